@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Project, Tag, Task, TimeEntry
+from .models import User, Project, Tag, Task, TimeEntry, DailyRollup
 
 
 @admin.register(User)
@@ -132,3 +132,18 @@ class TimeEntryAdmin(admin.ModelAdmin):
     list_filter = ("created_at", "start_time")
     search_fields = ("user__username", "task__name")
     readonly_fields = ("duration_seconds", "created_at")
+
+
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "date",
+        "user",
+        "project",
+        "task",
+        "duration_seconds",
+        "entry_count",
+    )
+    list_filter = ("date",)
+    search_fields = ("user__username", "task__name")
+    readonly_fields = ("duration_seconds", "entry_count")
@@ -0,0 +1,195 @@
+"""
+Read-only list serialization compiled from a ModelSerializer
+
+Serializing a page of model instances with a ModelSerializer walks every
+bound field of every row: attribute lookups through source_attrs, a
+to_representation call per field and a method call per
+SerializerMethodField. CompiledListSerializer inspects the serializer's
+fields once and turns them into a values() column list plus a flat list
+of per-field steps, so a page is read as dicts and converted with plain
+dict lookups. Only fields whose representation depends on more than the
+raw value (datetimes, for example) still go through the DRF field.
+
+Many-to-many values (primary keys, or another column of the related
+model in place of a SerializerMethodField) are read for the whole page
+with one query on the through table, in the related model's default
+ordering like prefetch_related().
+
+The output is the same JSON as the ModelSerializer's, byte for byte; the
+tests compare both paths and bench_serializers times them.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+# 値をそのまま出力できるフィールド（DBの値がJSONの型と一致する）
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+)
+
+# 出力の種類
+COLUMN, RELATED_COLUMN, MANY = range(3)
+
+
+class CompiledListSerializer:
+    """
+    values()-based list representation of a ModelSerializer
+
+    many_values maps SerializerMethodFields to (relation, column) pairs,
+    e.g. {"tag_names": ("tags", "name")} for [tag.name for tag in obj.tags.all()].
+    """
+
+    def __init__(self, serializer_class, many_values=None):
+        self.serializer_class = serializer_class
+        self.many_values = many_values or {}
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        # フィールドの構築はアプリの読み込み後に行う（初回の使用時に1回だけ）
+        if self._compiled is None:
+            self._compiled = self._compile()
+        return self._compiled
+
+    def _compile(self):
+        """(values()のカラム, 出力の手順, 多対多の関連ごとのカラム) を返す"""
+        model = self.serializer_class.Meta.model
+        columns, steps, many = ["pk"], [], {}
+        for name, field in self.serializer_class().fields.items():
+            if name in self.many_values:
+                relation, column = self.many_values[name]
+                many.setdefault(relation, []).append(column)
+                steps.append((name, MANY, (relation, column), None))
+            elif isinstance(field, ManyRelatedField):
+                if not isinstance(field.child_relation, PrimaryKeyRelatedField):
+                    raise ImproperlyConfigured(f"Unsupported field: {name}")
+                many.setdefault(field.source, []).append("pk")
+                steps.append((name, MANY, (field.source, "pk"), None))
+            elif isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(
+                    f"{name} needs an entry in many_values to be compiled"
+                )
+            elif isinstance(field, PrimaryKeyRelatedField):
+                # 外部キーのカラムの値がそのまま主キーになる
+                columns.append(field.source)
+                steps.append((name, COLUMN, field.source, None))
+            elif len(field.source_attrs) > 1:
+                # 関連先がNoneの場合、読み取り専用のフィールドは出力されない（SkipField）
+                if not field.read_only:
+                    raise ImproperlyConfigured(f"Unsupported field: {name}")
+                lookup = "__".join(field.source_attrs)
+                relation = field.source_attrs[0]
+                columns += [relation, lookup]
+                steps.append(
+                    (name, RELATED_COLUMN, (relation, lookup), self._converter(field))
+                )
+            else:
+                columns.append(field.source)
+                steps.append((name, COLUMN, field.source, self._converter(field)))
+
+        if not set(many) <= {f.name for f in model._meta.many_to_many}:
+            raise ImproperlyConfigured(f"Unknown relation in {sorted(many)}")
+        return list(dict.fromkeys(columns)), steps, many
+
+    @staticmethod
+    def _converter(field):
+        """Noneでない値の変換（DBの値をそのまま出力できる場合はNone）"""
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        return field.to_representation
+
+    def values(self, queryset):
+        """出力に必要なカラムだけを読み込むvalues()のクエリセット"""
+        columns, _, _ = self.compiled
+        return queryset.select_related(None).prefetch_related(None).values(*columns)
+
+    def serialize(self, rows):
+        """values()の行のリストをModelSerializerと同じ形の辞書のリストにする"""
+        rows = list(rows)
+        _, steps, many = self.compiled
+        related = self._load_many(rows, many)
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, kind, source, convert in steps:
+                if kind == COLUMN:
+                    value = row[source]
+                elif kind == RELATED_COLUMN:
+                    relation, lookup = source
+                    if row[relation] is None:
+                        continue
+                    value = row[lookup]
+                else:
+                    item[name] = related[source].get(row["pk"], [])
+                    continue
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+    def _load_many(self, rows, many):
+        """
+        多対多の関連の値をページ分まとめて読み込む
+        {(関連, カラム): {主キー: [値, ...]}} を返す
+        """
+        model = self.serializer_class.Meta.model
+        result = {}
+        for relation, columns in many.items():
+            field = model._meta.get_field(relation)
+            source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+            lookups = [
+                f"{target}_id" if column == "pk" else f"{target}__{column}"
+                for column in columns
+            ]
+            ordering = [
+                (
+                    f"-{target}__{name[1:]}"
+                    if name.startswith("-")
+                    else f"{target}__{name}"
+                )
+                for name in field.related_model._meta.ordering
+            ]
+            values = {(relation, column): {} for column in columns}
+            if rows:
+                through = field.remote_field.through.objects.filter(
+                    **{f"{source}_id__in": [row["pk"] for row in rows]}
+                )
+                for row in through.order_by(*ordering, "pk").values_list(
+                    f"{source}_id", *lookups
+                ):
+                    for column, value in zip(columns, row[1:]):
+                        values[(relation, column)].setdefault(row[0], []).append(value)
+            result.update(values)
+        return result
+
+
+class CompiledListMixin:
+    """
+    Serve the list action of a ViewSet through a CompiledListSerializer
+
+    ViewSets opt in by setting compiled_list_serializer; use_compiled_list()
+    can fall back to the ModelSerializer for requests it does not cover.
+    """
+
+    compiled_list_serializer = None
+
+    def use_compiled_list(self):
+        return self.compiled_list_serializer is not None
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_compiled_list():
+            return super().list(request, *args, **kwargs)
+
+        compiled = self.compiled_list_serializer
+        rows = compiled.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(rows))
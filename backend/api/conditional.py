@@ -0,0 +1,84 @@
+"""
+Conditional GET for the per-user collection and detail endpoints
+
+Every write of a user's projects, tags, tasks and time entries bumps
+User.data_version, so the version plus the request URL is a strong
+validator for any representation built from that data. The ETag is
+checked before the view runs: a matching If-None-Match costs a single
+primary key lookup and returns 304 without querying or serializing.
+"""
+
+import hashlib
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import User
+
+
+class DataVersionMixin:
+    """
+    The requesting user's data_version, read once per request
+    """
+
+    def get_data_version(self, request):
+        # ビューのインスタンスはリクエストごとに作られる
+        if not hasattr(self, "_data_version"):
+            self._data_version = (
+                User.objects.filter(pk=request.user.pk)
+                .values_list("data_version", flat=True)
+                .first()
+            )
+        return self._data_version
+
+
+class ConditionalGetMixin(DataVersionMixin):
+    """
+    ETag / If-None-Match support for the list and retrieve actions of a ViewSet
+    """
+
+    conditional_actions = ("list", "retrieve")
+
+    def is_conditional(self):
+        """ETagを付けるアクションか（時刻に依存する表現を返す場合はFalseにする）"""
+        return self.action in self.conditional_actions
+
+    def get_etag(self, request):
+        key = "\n".join(
+            [
+                str(request.user.pk),
+                str(self.get_data_version(request)),
+                request.get_full_path(),
+                request.headers.get("Accept", ""),
+            ]
+        )
+        return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def _conditional_response(self, handler, request, *args, **kwargs):
+        if not self.is_conditional():
+            return handler(request, *args, **kwargs)
+
+        etag = self.get_etag(request)
+        # If-None-Matchは弱い比較で判定する（RFC 9110）
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in if_none_match or etag in {
+            tag.removeprefix("W/") for tag in if_none_match
+        }:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+        response["ETag"] = etag
+        # 表現はユーザー（トークン）ごとに異なる
+        patch_vary_headers(response, ("Authorization",))
+        return response
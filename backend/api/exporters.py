@@ -0,0 +1,108 @@
+"""
+Streaming export of TimeEntry rows as CSV or NDJSON
+
+Rows are read with a server-side cursor in fixed-size chunks as flat
+values() dicts, so memory stays constant whatever the export size.
+Timestamps are written in the requesting user's timezone, like reports.
+"""
+
+import csv
+import json
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+EXPORT_FIELDS = [
+    "id",
+    "start_time",
+    "end_time",
+    "duration_seconds",
+    "name",
+    "task_id",
+    "task_name",
+    "project_id",
+    "project_name",
+    "tags",
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+def iter_export_rows(queryset, tz=None, chunk_size=2000):
+    """
+    エクスポート用の行をチャンク単位で読み込んで返すジェネレータ
+    タグ名はチャンクごとに1クエリでまとめて取得し、日時はtzで出力する
+    """
+    rows = queryset.values(
+        "id",
+        "start_time",
+        "end_time",
+        "duration_seconds",
+        "name",
+        "task_id",
+        "project_id",
+        task_name=F("task__name"),
+        project_name=F("project__name"),
+    ).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _with_tags(chunk, tz)
+            chunk = []
+    if chunk:
+        yield from _with_tags(chunk, tz)
+
+
+def _with_tags(chunk, tz):
+    task_ids = {row["task_id"] for row in chunk if row["task_id"]}
+    tags = {}
+    if task_ids:
+        through = Task.tags.through.objects.filter(task_id__in=task_ids)
+        for task_id, tag_name in through.order_by("tag__name").values_list(
+            "task_id", "tag__name"
+        ):
+            tags.setdefault(task_id, []).append(tag_name)
+
+    for row in chunk:
+        row["tags"] = tags.get(row["task_id"], [])
+        for key in ("start_time", "end_time"):
+            if row[key] is not None:
+                row[key] = timezone.localtime(row[key], tz).isoformat()
+        yield row
+
+
+class _Echo:
+    """csv.writerの出力をそのまま返す疑似バッファ"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row["tags"] = ";".join(row["tags"])
+        yield writer.writerow([row[key] for key in EXPORT_FIELDS])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps({key: row[key] for key in EXPORT_FIELDS}, ensure_ascii=False)
+        yield "\n"
+
+
+def export_lines(queryset, file_format, tz=None, chunk_size=2000):
+    rows = iter_export_rows(queryset, tz=tz, chunk_size=chunk_size)
+    if file_format == "csv":
+        return csv_lines(rows)
+    return ndjson_lines(rows)
@@ -0,0 +1,21 @@
+import django_filters
+
+from .models import TimeEntry
+
+
+class TimeEntryFilter(django_filters.FilterSet):
+    """
+    Filters for TimeEntry lists
+
+    All filters compare plain columns so that they can use the
+    (user, start_time), (user, task, start_time) and
+    (user, project, start_time) indexes.
+    """
+
+    start_time = django_filters.IsoDateTimeFromToRangeFilter()
+    task = django_filters.NumberFilter(field_name="task_id")
+    project = django_filters.NumberFilter(field_name="project_id")
+
+    class Meta:
+        model = TimeEntry
+        fields = ["start_time", "task", "project"]
@@ -0,0 +1,70 @@
+"""
+Per-request identity map of a user's projects, tags and tasks
+
+Validating a task write used to look up parent, project and each tag
+with its own query, and Task.save() then fetched parent.root and
+root.project again. The identity map loads the rows a payload refers to
+with one IN query per model, tasks together with the parent, root and
+project objects that validation, clean(), save() and
+_check_circular_reference walk, and hands out the same instances to
+every field that asks for them. Rows of other users are never loaded,
+so they resolve as missing.
+"""
+
+from .models import Project, Tag, Task
+
+
+class IdentityMap:
+    """
+    Loaded Project, Tag and Task rows of one user, by primary key
+    """
+
+    # タスクは親（とその親）・ルート・プロジェクトをJOINして読み込む
+    QUERYSETS = {
+        Project: lambda: Project.objects.all(),
+        Tag: lambda: Tag.objects.all(),
+        Task: lambda: Task.objects.select_related(
+            "project", "parent__parent", "root__project"
+        ),
+    }
+
+    # 共有する関連先（select_relatedで読み込まれたもの）
+    RELATIONS = {Task: ("project", "parent", "root")}
+
+    def __init__(self, user):
+        self.user = user
+        self._rows = {model: {} for model in self.QUERYSETS}
+        # 存在しない（または他のユーザーの）主キー
+        self._missing = {model: set() for model in self.QUERYSETS}
+
+    def load(self, model, pks):
+        """まだ読み込んでいない主キーの行をINクエリ1回で読み込む"""
+        pks = set(pks) - self._rows[model].keys() - self._missing[model]
+        if not pks:
+            return
+        rows = self.QUERYSETS[model]().filter(user=self.user, pk__in=pks)
+        for instance in rows:
+            self.add(instance)
+        self._missing[model] |= pks - self._rows[model].keys()
+
+    def get(self, model, pk):
+        """主キーの行を返す（存在しない場合はNone）"""
+        self.load(model, [pk])
+        return self._rows[model].get(pk)
+
+    def add(self, instance):
+        """
+        行とselect_relatedで一緒に読み込まれた関連先を登録し、登録された行を返す
+        既に登録されている行は置き換えない（同じインスタンスを共有する）
+        """
+        registered = self._rows[type(instance)].setdefault(instance.pk, instance)
+        for name in self.RELATIONS.get(type(instance), ()):
+            field = instance._meta.get_field(name)
+            related = field.get_cached_value(instance, default=None)
+            if related is None:
+                continue
+            related = self.add(related)
+            # 登録済みの行に無い関連先は、後から読み込んだ行のものを引き継ぐ
+            if registered is instance or not field.is_cached(registered):
+                field.set_cached_value(registered, related)
+        return registered
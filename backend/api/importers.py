@@ -0,0 +1,384 @@
+"""
+Bulk import of TimeEntry rows from CSV or NDJSON
+
+Rows are validated and inserted in batches with bulk_create (or COPY on
+PostgreSQL), bypassing TimeEntry.save() and its per-row rollup. Daily
+rollups are updated once per batch in the same transaction, and task
+durations of the affected trees are recomputed once at the end, also
+when the import stops early on an unreadable file or an interrupt.
+"""
+
+import csv
+import json
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .intervals import find_overlaps
+from .models import (
+    DailyRollup,
+    Project,
+    Task,
+    TimeEntry,
+    User,
+    bump_data_version,
+)
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+class ImportRowError(ValueError):
+    """Invalid row in an import file"""
+
+
+class ImportFileError(ValueError):
+    """
+    Unreadable import file (invalid UTF-8 or CSV)
+
+    The import stops at this line; result holds what was imported before it.
+    """
+
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+        self.result = None
+
+
+def detect_format(filename, default="csv"):
+    """ファイル名の拡張子から形式を判定"""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def decode_lines(stream):
+    """
+    バイナリストリームを1行ずつUTF-8（先頭のBOMは除く）でデコードする
+    行ごとにデコードするため、不正なバイト列の行番号がわかる
+    """
+    for line_num, line in enumerate(stream, start=1):
+        try:
+            yield line.decode("utf-8-sig" if line_num == 1 else "utf-8")
+        except UnicodeDecodeError as e:
+            raise ImportFileError(line_num, f"UTF-8として読み込めません: {e.reason}")
+
+
+def read_rows(stream, file_format):
+    """
+    バイナリストリームから行を1件ずつ読み込む
+    (行番号, dict) を返すジェネレータ（ファイル全体をメモリに載せない）
+    ファイルとして読み込めない場合はImportFileErrorで中断する
+    """
+    lines = decode_lines(stream)
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            # エラーになった行はline_numに数えられていない
+            raise ImportFileError(reader.line_num + 1, f"CSVの形式が不正です: {e}")
+    elif file_format == "ndjson":
+        for line_num, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = ImportRowError(f"JSONの形式が不正です: {e.msg}")
+            yield line_num, row
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+    last_line: int = 0
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_line": self.last_line,
+        }
+
+
+class TimeEntryImporter:
+    """
+    Import completed TimeEntry rows for a single user
+
+    Each batch is committed in its own transaction, so an interrupted import
+    can be resumed by skipping the lines up to ImportResult.last_line.
+    """
+
+    def __init__(self, user, batch_size=1000, use_copy=None, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        if use_copy is None:
+            use_copy = connection.vendor == "postgresql"
+        self.use_copy = use_copy
+        self.progress = progress
+        self.root_ids = set()
+        self.timezone = user.get_timezone()
+
+    def run(self, rows, skip_lines=0):
+        """
+        行を取り込んでImportResultを返す
+        読み込めない行があればそれより前の行を取り込んでImportFileErrorを送出する
+        """
+        result = ImportResult(last_line=skip_lines)
+        batch = []
+        try:
+            for line_num, row in rows:
+                if line_num <= skip_lines:
+                    continue
+                batch.append((line_num, row))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, result)
+                    batch = []
+        except ImportFileError as e:
+            if batch:
+                self._import_batch(batch, result)
+            e.result = result
+            raise
+        else:
+            if batch:
+                self._import_batch(batch, result)
+        finally:
+            # コミット済みのバッチのタスクの時間は中断した場合も再計算する
+            self.recompute_durations()
+        return result
+
+    def recompute_durations(self):
+        """取り込んだエントリのタスクツリーのduration_secondsを1回だけ再計算"""
+        root_ids = list(self.root_ids)
+        if root_ids:
+            bump_data_version([self.user.pk])
+        for i in range(0, len(root_ids), self.batch_size):
+            chunk = root_ids[i : i + self.batch_size]
+            Task.objects.filter(
+                Q(pk__in=chunk) | Q(root__in=chunk)
+            ).recompute_durations()
+        self.root_ids.clear()
+
+    def _import_batch(self, batch, result):
+        tasks, projects = self._load_related(batch)
+
+        built = []
+        for line_num, row in batch:
+            try:
+                built.append((line_num, self._build_entry(row, tasks, projects)))
+            except ImportRowError as e:
+                result.skipped += 1
+                result.errors.append({"line": line_num, "error": str(e)})
+
+        entries = []
+        rejected = self._find_overlapping_rows(built)
+        for i, (line_num, entry) in enumerate(built):
+            if i in rejected:
+                result.skipped += 1
+                result.errors.append(
+                    {"line": line_num, "error": "他のTime Entryと時間が重複しています"}
+                )
+            else:
+                entries.append(entry)
+        result.errors.sort(key=lambda error: error["line"])
+
+        with transaction.atomic():
+            if entries:
+                self._stamp_sync_version(entries)
+            if self.use_copy:
+                self._copy_insert(entries)
+            else:
+                TimeEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+            DailyRollup.objects.apply_deltas(self.user.pk, self._daily_deltas(entries))
+
+        for entry in entries:
+            if entry.task_id:
+                task = tasks[entry.task_id]
+                self.root_ids.add(task["root_id"] or entry.task_id)
+
+        result.created += len(entries)
+        result.last_line = batch[-1][0]
+        if self.progress:
+            self.progress(result)
+
+    def _stamp_sync_version(self, entries):
+        """
+        data_versionを進め、バッチのエントリのsync_versionに記録する
+        （bulk_createやCOPYではSyncedModel.save()が呼ばれないため）
+        """
+        bump_data_version([self.user.pk])
+        version = User.objects.values_list("data_version", flat=True).get(
+            pk=self.user.pk
+        )
+        for entry in entries:
+            entry.sync_version = version
+
+    def _find_overlapping_rows(self, built):
+        """
+        既存のエントリやバッチ内の先の行と時間が重なる行のインデックスを返す
+        バッチの期間と重なる既存のエントリとまとめてスイープラインで判定する
+        """
+        if not built:
+            return set()
+        start_time = min(entry.start_time for _, entry in built)
+        end_time = max(entry.end_time for _, entry in built)
+        existing = (
+            TimeEntry.objects.filter(user=self.user)
+            .overlapping(start_time, end_time)
+            .values_list("id", "start_time", "end_time")
+        )
+        rows = [(("db", pk), start, end) for pk, start, end in existing]
+        rows += [
+            (("row", i), entry.start_time, entry.end_time)
+            for i, (_, entry) in enumerate(built)
+        ]
+        rows.sort(key=lambda row: (row[1], row[0]))
+
+        rejected = set()
+        for first, second, _, _ in find_overlaps(rows):
+            if first in rejected or second in rejected:
+                continue
+            # 後から開始した行を除外する（既存のエントリは残す）
+            rejected.add(second if second[0] == "row" else first)
+        return {i for kind, i in rejected if kind == "row"}
+
+    def _daily_deltas(self, entries):
+        """バッチ内のエントリを日次集計の差分にまとめる"""
+        deltas = {}
+        for entry in entries:
+            DailyRollup.add_entry_deltas(
+                deltas, entry._get_daily_state(), self.timezone
+            )
+        return deltas
+
+    def _load_related(self, batch):
+        """バッチ内のタスク・プロジェクトの所有者をINクエリでまとめて確認"""
+        task_ids, project_ids = set(), set()
+        for _, row in batch:
+            if not isinstance(row, dict):
+                continue
+            try:
+                task_ids.add(_parse_id(row.get("task")))
+                project_ids.add(_parse_id(row.get("project")))
+            except ImportRowError:
+                # 不正なIDは行の組み立て時にエラーとして記録する
+                continue
+        task_ids.discard(None)
+        project_ids.discard(None)
+
+        tasks = {}
+        if task_ids:
+            tasks = {
+                task["id"]: task
+                for task in Task.objects.filter(user=self.user, pk__in=task_ids).values(
+                    "id", "name", "project_id", "root_id"
+                )
+            }
+        projects = set()
+        if project_ids:
+            projects = set(
+                Project.objects.filter(user=self.user, pk__in=project_ids).values_list(
+                    "pk", flat=True
+                )
+            )
+        return tasks, projects
+
+    def _build_entry(self, row, tasks, projects):
+        if isinstance(row, Exception):
+            raise ImportRowError(str(row))
+        if not isinstance(row, dict):
+            raise ImportRowError("行の形式が不正です")
+
+        start_time = _parse_time(row.get("start_time"), "start_time")
+        end_time = _parse_time(row.get("end_time"), "end_time")
+        if end_time < start_time:
+            raise ImportRowError("終了時刻は開始時刻より後である必要があります")
+
+        task_id = _parse_id(row.get("task"))
+        project_id = _parse_id(row.get("project"))
+        name = row.get("name") or None
+
+        if task_id is not None:
+            task = tasks.get(task_id)
+            if task is None:
+                raise ImportRowError("選択されたタスクはこのユーザーに紐づいていません")
+            # TimeEntry.save()と同様にタスクから名前とプロジェクトを設定
+            project_id = task["project_id"]
+            name = task["name"]
+        elif project_id is not None and project_id not in projects:
+            raise ImportRowError(
+                "選択されたプロジェクトはこのユーザーに紐づいていません"
+            )
+
+        if name and len(name) > TimeEntry._meta.get_field("name").max_length:
+            raise ImportRowError("nameが長すぎます")
+
+        return TimeEntry(
+            user=self.user,
+            task_id=task_id,
+            project_id=project_id,
+            name=name,
+            start_time=start_time,
+            end_time=end_time,
+            duration_seconds=int((end_time - start_time).total_seconds()),
+            created_at=timezone.now(),
+        )
+
+    def _copy_insert(self, entries):
+        """PostgreSQLのCOPYで一括挿入"""
+        if not entries:
+            return
+        columns = [
+            "user_id",
+            "task_id",
+            "project_id",
+            "name",
+            "start_time",
+            "end_time",
+            "duration_seconds",
+            "created_at",
+            "sync_version",
+        ]
+        quote = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote(TimeEntry._meta.db_table), ", ".join(quote(c) for c in columns)
+        )
+        with connection.cursor() as cursor, cursor.copy(sql) as copy:
+            for entry in entries:
+                copy.write_row([getattr(entry, column) for column in columns])
+
+
+def _parse_id(value):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"IDが不正です: {value}")
+
+
+def _parse_time(value, name):
+    if not value:
+        raise ImportRowError(f"{name}は必須です")
+    try:
+        parsed = parse_datetime(str(value))
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ImportRowError(f"{name}の形式が不正です: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -0,0 +1,239 @@
+"""
+Vectorized interval engine for timeline and heatmap reports
+
+TimeEntry rows are loaded as NumPy arrays of epoch seconds and every
+bucket total is derived from the cumulative coverage function
+
+    C(t) = sum_i clamp(t - start_i, 0, end_i - start_i)
+
+which is evaluated for all bucket edges at once with two searchsorted
+calls over sorted starts/ends and their prefix sums. The seconds in a
+bucket [a, b) are C(b) - C(a), so clipping at bucket boundaries, binning
+and histograms cost O((n + m) log n) for n intervals and m edges instead
+of a Python loop per interval and bucket.
+
+Overlap audits use a sweep line over entries read in start_time order
+(find_overlaps), which needs no arrays at all.
+
+The pure-Python functions at the end of the module are the reference
+implementations used by the tests and the bench_intervals command.
+"""
+
+import heapq
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import UTC, datetime, time, timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TimeEntry
+
+# project_idがNULLのエントリのグループ
+NO_PROJECT = -1
+
+# 進行中のエントリ（end_timeがNone）の終了時刻として扱う値
+OPEN_END = datetime.max.replace(tzinfo=UTC)
+
+HOURS_PER_WEEK = 7 * 24
+
+
+@dataclass
+class Intervals:
+    """Epoch-second intervals with their project ids"""
+
+    starts: np.ndarray
+    ends: np.ndarray
+    project_ids: np.ndarray
+
+    def __len__(self):
+        return len(self.starts)
+
+    def for_project(self, project_id):
+        mask = self.project_ids == project_id
+        return Intervals(self.starts[mask], self.ends[mask], self.project_ids[mask])
+
+
+def load_intervals(user, start_time, end_time, now=None):
+    """
+    期間 [start_time, end_time) と重なるユーザーのTime Entryを配列として読み込む
+    進行中のエントリは現在時刻までとして扱う
+    """
+    now = now or timezone.now()
+    rows = list(
+        TimeEntry.objects.filter(user=user, start_time__lt=end_time)
+        .filter(Q(end_time__gt=start_time) | Q(end_time__isnull=True))
+        .values_list("start_time", "end_time", "project_id")
+    )
+    count = len(rows)
+    return Intervals(
+        np.fromiter((row[0].timestamp() for row in rows), np.float64, count),
+        np.fromiter(((row[1] or now).timestamp() for row in rows), np.float64, count),
+        np.fromiter(
+            (NO_PROJECT if row[2] is None else row[2] for row in rows), np.int64, count
+        ),
+    )
+
+
+def coverage(starts, ends, points):
+    """
+    各時刻pointsまでに区間が覆う秒数の合計 C(t) を返す
+    重なっている区間はそれぞれ加算される
+    """
+    starts = np.sort(starts)
+    ends = np.sort(ends)
+    start_sums = np.concatenate(([0.0], np.cumsum(starts)))
+    end_sums = np.concatenate(([0.0], np.cumsum(ends)))
+    points = np.asarray(points, dtype=np.float64)
+
+    started = np.searchsorted(starts, points, side="right")
+    ended = np.searchsorted(ends, points, side="right")
+    return (points * started - start_sums[started]) - (points * ended - end_sums[ended])
+
+
+def bin_totals(starts, ends, edges):
+    """
+    バケット [edges[k], edges[k+1]) ごとの合計秒数を返す
+    区間はバケット境界で分割（クリップ）される
+    """
+    return np.diff(coverage(starts, ends, edges))
+
+
+def merge(starts, ends):
+    """重なっている（接している）区間を結合した (starts, ends) を返す"""
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    new_group = np.empty(len(starts), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero(new_group)
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def local_day_edges(start_date, end_date, tz):
+    """ローカル日付 start_date から end_date までの各日の0時（エポック秒）"""
+    days = (end_date - start_date).days + 1
+    return np.array(
+        [
+            datetime.combine(start_date + timedelta(days=i), time.min, tz).timestamp()
+            for i in range(days + 1)
+        ]
+    )
+
+
+def local_hour_edges(start_date, end_date, tz):
+    """
+    ローカル日付の範囲を1時間ごとに区切った境界と、各バケットの曜日×時のインデックス
+    """
+    first, last = local_day_edges(start_date, end_date, tz)[[0, -1]]
+    edges = np.arange(first, last + 1, 3600.0)
+    labels = np.array(
+        [
+            (local.weekday() * 24 + local.hour)
+            for local in (datetime.fromtimestamp(edge, tz) for edge in edges[:-1])
+        ],
+        dtype=np.int64,
+    )
+    return edges, labels
+
+
+def hour_of_week(starts, ends, edges, labels):
+    """曜日（月曜=0）×時刻の7x24ヒストグラム（秒）を返す"""
+    totals = bin_totals(starts, ends, edges)
+    return np.bincount(labels, weights=totals, minlength=HOURS_PER_WEEK).reshape(7, 24)
+
+
+def timeline(intervals, edges):
+    """
+    バケットごとの合計秒数・稼働秒数（重なりを除いた時間）・プロジェクト別秒数
+    """
+    totals = bin_totals(intervals.starts, intervals.ends, edges)
+    active = bin_totals(*merge(intervals.starts, intervals.ends), edges)
+    projects = {}
+    for project_id in np.unique(intervals.project_ids):
+        part = intervals.for_project(project_id)
+        projects[int(project_id)] = bin_totals(part.starts, part.ends, edges)
+    return totals, active, projects
+
+
+def find_overlaps(rows):
+    """
+    開始時刻順に並んだ (id, start_time, end_time) から重なっている組を全て列挙する
+    スイープライン法で、終了していない区間をend_timeのヒープで保持する
+    （n件・k組に対して O(n log n + k)）
+
+    (先に開始したid, 後に開始したid, 重なりの開始, 重なりの終了) を返すジェネレータ
+    進行中のエントリ同士の重なりの終了はNone
+    """
+    active = []
+    for pk, start, end in rows:
+        end = end or OPEN_END
+        if end <= start:
+            # 長さ0のエントリはどのエントリとも重ならない
+            continue
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for other_end, other_pk in active:
+            overlap_end = min(end, other_end)
+            yield other_pk, pk, start, None if overlap_end == OPEN_END else overlap_end
+        heapq.heappush(active, (end, pk))
+
+
+def find_user_overlaps(user):
+    """
+    ユーザーの重なっているTime Entryの組を全て返す
+    (user, start_time)インデックスの順に1回だけ走査する
+    """
+    rows = (
+        TimeEntry.objects.filter(user=user)
+        .order_by("start_time", "id")
+        .values_list("id", "start_time", "end_time")
+    )
+    return list(find_overlaps(rows.iterator(chunk_size=5000)))
+
+
+# --- Pure-Python reference implementations ---
+
+
+def py_bin_totals(intervals, edges):
+    """bin_totalsの素朴な実装（区間ごとに重なるバケットを走査）"""
+    totals = [0.0] * (len(edges) - 1)
+    for start, end in intervals:
+        k = max(bisect_right(edges, start) - 1, 0)
+        while k < len(totals) and edges[k] < end:
+            overlap = min(end, edges[k + 1]) - max(start, edges[k])
+            if overlap > 0:
+                totals[k] += overlap
+            k += 1
+    return totals
+
+
+def py_merge(intervals):
+    """mergeの素朴な実装"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def py_hour_of_week(intervals, tz):
+    """hour_of_weekの素朴な実装（区間をローカル時刻の1時間ごとに分割）"""
+    histogram = [[0.0] * 24 for _ in range(7)]
+    for start, end in intervals:
+        current = start
+        while current < end:
+            local = datetime.fromtimestamp(current, tz)
+            hour_end = local.replace(minute=0, second=0, microsecond=0) + timedelta(
+                hours=1
+            )
+            boundary = min(hour_end.astimezone(UTC).timestamp(), end)
+            histogram[local.weekday()][local.hour] += boundary - current
+            current = boundary
+    return histogram
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.intervals import find_user_overlaps
+
+
+class Command(BaseCommand):
+    help = "Report every pair of overlapping time entries, per user"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="usernames",
+            help="Only audit this user (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(
+                users.values_list("username", flat=True)
+            )
+            if missing:
+                raise CommandError(f"User not found: {', '.join(sorted(missing))}")
+
+        total = 0
+        for user in users.only("pk", "username").iterator():
+            for first, second, start_time, end_time in find_user_overlaps(user):
+                total += 1
+                self.stdout.write(
+                    f"{user.username}: entries {first} and {second} overlap "
+                    f"from {start_time.isoformat()} to "
+                    f"{end_time.isoformat() if end_time else 'now (running)'}"
+                )
+
+        style = self.style.WARNING if total else self.style.SUCCESS
+        self.stdout.write(style(f"{total} overlapping pairs found"))
@@ -0,0 +1,73 @@
+import itertools
+import random
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import intervals
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the vectorized interval engine against the pure-Python "
+        "reference on synthetic entries"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=50000)
+        parser.add_argument("--year", type=int, default=2025)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        tz = timezone.get_default_timezone()
+        start, end = date(options["year"], 1, 1), date(options["year"], 12, 31)
+        day_edges = intervals.local_day_edges(start, end, tz)
+        hour_edges, labels = intervals.local_hour_edges(start, end, tz)
+
+        # 1年間に散らばった5分〜3時間のエントリ（一部は重なる）
+        rng = random.Random(options["seed"])
+        pairs = []
+        for _ in range(options["entries"]):
+            begin = rng.uniform(day_edges[0], day_edges[-1] - 3 * 3600)
+            pairs.append((begin, begin + rng.uniform(300, 3 * 3600)))
+        starts = np.array([pair[0] for pair in pairs])
+        ends = np.array([pair[1] for pair in pairs])
+
+        self.stdout.write(f"{len(pairs)} intervals, {options['year']} ({tz})")
+        self._compare(
+            "daily bins",
+            lambda: intervals.bin_totals(starts, ends, day_edges),
+            lambda: intervals.py_bin_totals(pairs, list(day_edges)),
+        )
+        self._compare(
+            "merge",
+            lambda: np.subtract(*intervals.merge(starts, ends)[::-1]),
+            lambda: [end - start for start, end in intervals.py_merge(pairs)],
+        )
+        self._compare(
+            "hour of week",
+            lambda: intervals.hour_of_week(starts, ends, hour_edges, labels).ravel(),
+            lambda: list(
+                itertools.chain.from_iterable(intervals.py_hour_of_week(pairs, tz))
+            ),
+        )
+
+    def _compare(self, name, vectorized, reference):
+        numpy_seconds, expected = self._time(vectorized)
+        python_seconds, actual = self._time(reference)
+        if not np.allclose(expected, actual, atol=1e-3):
+            self.stderr.write(self.style.ERROR(f"{name}: results differ"))
+        self.stdout.write(
+            f"{name:>14}: numpy {numpy_seconds * 1000:8.1f} ms, "
+            f"python {python_seconds * 1000:8.1f} ms "
+            f"({python_seconds / numpy_seconds:.0f}x)"
+        )
+
+    @staticmethod
+    def _time(func):
+        began = time.perf_counter()
+        result = func()
+        return time.perf_counter() - began, result
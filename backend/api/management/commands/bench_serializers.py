@@ -0,0 +1,116 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Project, Tag, Task
+from api.serializers import ProjectSerializer, TagSerializer, TaskSerializer
+from api.views import ProjectViewSet, TagViewSet, TaskViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the compiled values()-based list serializers against the "
+        "ModelSerializers on synthetic rows (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="Rows per page")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._create_rows(options["rows"], random.Random(options["seed"]))
+            self.stdout.write(
+                f"{options['rows']} rows per list, {options['repeat']} runs, "
+                "CPU time per row (query + serialization)"
+            )
+            self._compare(
+                "projects",
+                Project.objects.filter(user=user),
+                ProjectSerializer,
+                ProjectViewSet.compiled_list_serializer,
+                options,
+            )
+            self._compare(
+                "tags",
+                Tag.objects.filter(user=user),
+                TagSerializer,
+                TagViewSet.compiled_list_serializer,
+                options,
+            )
+            self._compare(
+                "tasks",
+                Task.objects.filter(user=user)
+                .select_related("project", "parent", "root")
+                .prefetch_related("tags"),
+                TaskSerializer,
+                TaskViewSet.compiled_list_serializer,
+                options,
+            )
+            transaction.set_rollback(True)
+
+    def _create_rows(self, rows, rng):
+        """プロジェクト・タグ・3階層のタスク（タグ付き）をrows件ずつ作成"""
+        user = get_user_model().objects.create_user(
+            username=f"bench-{rng.random()}", password=None
+        )
+        projects = Project.objects.bulk_create(
+            Project(user=user, name=f"プロジェクト{i}") for i in range(rows)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f"タグ{i}") for i in range(rows)
+        )
+        tasks = []
+        for i in range(rows):
+            parent = rng.choice(tasks) if tasks and i % 3 else None
+            if parent and parent.level >= 2:
+                parent = None
+            task = Task(
+                user=user,
+                name=f"タスク{i}",
+                description="説明" * rng.randint(0, 20),
+                parent=parent,
+                project=rng.choice(projects) if parent is None else None,
+                estimate_minutes=rng.choice([None, 30, 120]),
+            )
+            task.save()
+            tasks.append(task)
+        Through = Task.tags.through
+        Through.objects.bulk_create(
+            Through(task_id=task.pk, tag_id=tag.pk)
+            for task in tasks
+            for tag in rng.sample(tags, rng.randint(0, 3))
+        )
+        return user
+
+    def _compare(self, name, queryset, serializer_class, compiled, options):
+        renderer = JSONRenderer()
+        model_seconds, expected = self._time(
+            lambda: serializer_class(list(queryset.all()), many=True).data,
+            options["repeat"],
+        )
+        compiled_seconds, actual = self._time(
+            lambda: compiled.serialize(compiled.values(queryset.all())),
+            options["repeat"],
+        )
+        if renderer.render(expected) != renderer.render(actual):
+            self.stderr.write(self.style.ERROR(f"{name}: JSON differs"))
+
+        rows = options["rows"] * options["repeat"]
+        self.stdout.write(
+            f"{name:>9}: ModelSerializer {model_seconds / rows * 1e6:7.1f} us/row, "
+            f"compiled {compiled_seconds / rows * 1e6:7.1f} us/row "
+            f"({model_seconds / compiled_seconds:.1f}x)"
+        )
+
+    @staticmethod
+    def _time(func, repeat):
+        began = time.process_time()
+        for _ in range(repeat):
+            result = func()
+        return time.process_time() - began, result
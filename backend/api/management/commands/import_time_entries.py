@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import (
+    IMPORT_FORMATS,
+    ImportFileError,
+    TimeEntryImporter,
+    detect_format,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Import completed time entries for a user from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file to import")
+        parser.add_argument("--user", required=True, help="Username of the owner")
+        parser.add_argument(
+            "--format",
+            dest="file_format",
+            choices=IMPORT_FORMATS,
+            help="File format (default: detected from the file extension)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-lines",
+            type=int,
+            default=0,
+            help="Resume an interrupted import after this line number",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Use bulk_create instead of COPY on PostgreSQL",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User not found: {options['user']}")
+
+        file_format = options["file_format"] or detect_format(options["path"])
+
+        def report(result):
+            self.stdout.write(
+                f"line {result.last_line}: "
+                f"{result.created} created, {result.skipped} skipped"
+            )
+
+        importer = TimeEntryImporter(
+            user,
+            batch_size=options["batch_size"],
+            use_copy=False if options["no_copy"] else None,
+            progress=report,
+        )
+        # 中断した場合もコミット済みの行のタスクの時間は再計算されている
+        try:
+            with open(options["path"], "rb") as f:
+                result = importer.run(
+                    read_rows(f, file_format), skip_lines=options["skip_lines"]
+                )
+        except KeyboardInterrupt:
+            raise CommandError(
+                "Interrupted. Resume with --skip-lines set to the last reported line."
+            )
+        except ImportFileError as e:
+            raise CommandError(
+                f"line {e.line}: {e.message}. Fix the file and resume with "
+                f"--skip-lines {e.result.last_line}."
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.created} entries ({result.skipped} skipped)"
+            )
+        )
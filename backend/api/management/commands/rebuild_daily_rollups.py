@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import DailyRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily rollup table from completed time entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="usernames",
+            help="Only rebuild rollups for this user (repeatable)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(
+                users.values_list("username", flat=True)
+            )
+            if missing:
+                raise CommandError(f"User not found: {', '.join(sorted(missing))}")
+
+        total = 0
+        for user in users.only("pk", "username", "timezone").iterator():
+            created = DailyRollup.objects.rebuild(
+                user, chunk_size=options["chunk_size"]
+            )
+            total += created
+            self.stdout.write(f"{user.username}: {created} rollup rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} rollup rows"))
@@ -0,0 +1,98 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from api.models import Task, bump_data_version
+
+UPDATE_BATCH_SIZE = 500
+
+
+def reconcile_chunk(user_ids, verify=False):
+    """
+    ユーザーのチャンクについてTask.duration_secondsのずれを検出し、必要なら修正する
+    修正する場合はチャンクのタスクをロック（select_for_update）してからずれを求め、
+    正しい値をそのまま書き込む。コミット時の再計算（TaskDurationRollup）は
+    ロックが解放されるまで待ち、その後に同じ値を書き込むため、結果は変わらない
+
+    {pk: (保存値, 正しい値)} を返す
+    """
+    tasks = Task.objects.filter(user_id__in=user_ids)
+    if verify:
+        return tasks.duration_drift()
+
+    with transaction.atomic():
+        list(tasks.select_for_update().order_by("pk").values_list("pk", flat=True))
+        drift = tasks.duration_drift()
+        durations = [(pk, expected) for pk, (_, expected) in drift.items()]
+        for i in range(0, len(durations), UPDATE_BATCH_SIZE):
+            batch = dict(durations[i : i + UPDATE_BATCH_SIZE])
+            bump_data_version(Task.objects.filter(pk__in=batch).values("user_id"))
+            Task.objects.set_durations(batch)
+    return drift
+
+
+def _reconcile_in_worker(user_ids, verify):
+    try:
+        return reconcile_chunk(user_ids, verify)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Task.duration_seconds from completed time entries, "
+        "one grouped query per chunk of users"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report drifted tasks without writing",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=100, help="Users per chunk"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes (each uses its own DB connection)",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+        size = options["chunk_size"]
+        chunks = [user_ids[i : i + size] for i in range(0, len(user_ids), size)]
+        verify = options["verify"]
+
+        if options["workers"] > 1:
+            # 子プロセスに親の接続を引き継がせない
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+                results = executor.map(
+                    _reconcile_in_worker, chunks, [verify] * len(chunks)
+                )
+                drifted = self._report(results)
+        else:
+            drifted = self._report(reconcile_chunk(chunk, verify) for chunk in chunks)
+
+        action = "drifted" if verify else "fixed"
+        style = self.style.WARNING if drifted and verify else self.style.SUCCESS
+        self.stdout.write(
+            style(f"{len(user_ids)} users checked, {drifted} tasks {action}")
+        )
+
+    def _report(self, results):
+        drifted = 0
+        for drift in results:
+            drifted += len(drift)
+            for pk, (stored, expected) in sorted(drift.items()):
+                self.stdout.write(
+                    f"task {pk}: stored {stored}, expected {expected} "
+                    f"({expected - stored:+d})"
+                )
+        return drifted
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_task_duration_seconds_task_estimate_minutes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="timeentry",
+            index=models.Index(
+                fields=["user", "project", "start_time"],
+                name="api_timeent_user_id_bea5b8_idx",
+            ),
+        ),
+    ]
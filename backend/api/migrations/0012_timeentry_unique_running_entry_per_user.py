@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+def close_duplicate_running_entries(apps, schema_editor):
+    """
+    ユーザーごとに最新以外の進行中Time Entryを、次に開始したエントリの開始時刻で終了させる
+    終了させたエントリの時間はタスクとその先祖タスクのduration_secondsに加算する
+    """
+    TimeEntry = apps.get_model("api", "TimeEntry")
+    Task = apps.get_model("api", "Task")
+
+    running = TimeEntry.objects.filter(end_time__isnull=True).order_by(
+        "user_id", "-start_time", "-id"
+    )
+    next_start = {}
+    for entry in running.iterator():
+        if entry.user_id not in next_start:
+            next_start[entry.user_id] = entry.start_time
+            continue
+
+        entry.end_time = next_start[entry.user_id]
+        next_start[entry.user_id] = entry.start_time
+        entry.duration_seconds = int(
+            (entry.end_time - entry.start_time).total_seconds()
+        )
+        entry.save(update_fields=["end_time", "duration_seconds"])
+
+        if entry.task_id and entry.duration_seconds:
+            task = Task.objects.get(pk=entry.task_id)
+            chain = {task.pk, task.parent_id, task.root_id} - {None}
+            Task.objects.filter(pk__in=chain).update(
+                duration_seconds=models.F("duration_seconds") + entry.duration_seconds
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_timeentry_api_timeent_user_id_bea5b8_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            close_duplicate_running_entries, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="timeentry",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("end_time__isnull", True)),
+                fields=("user",),
+                name="unique_running_entry_per_user",
+            ),
+        ),
+    ]
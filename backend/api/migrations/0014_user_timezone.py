@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:18
+
+from django.db import migrations, models
+
+import api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_dailyrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="timezone",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=64,
+                validators=[api.models.validate_timezone],
+            ),
+        ),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from datetime import UTC, datetime
+
+from django.db import migrations
+
+CONSTRAINT_NAME = "api_timeentry_no_overlap"
+
+OPEN_END = datetime.max.replace(tzinfo=UTC)
+
+# user_idの等価比較をint8rangeの重なりで表すことで、btree_gist拡張なしで
+# GiSTの排他制約を作成できる
+POSTGRES_FORWARD = [
+    f"""
+    ALTER TABLE api_timeentry ADD CONSTRAINT {CONSTRAINT_NAME}
+    EXCLUDE USING gist (
+        int8range(user_id, user_id, '[]') WITH &&,
+        tstzrange(start_time, end_time, '[)') WITH &&
+    )
+    """,
+]
+
+POSTGRES_REVERSE = [
+    f"ALTER TABLE api_timeentry DROP CONSTRAINT IF EXISTS {CONSTRAINT_NAME}",
+]
+
+# SQLiteの日時はISO形式の文字列なので文字列比較で大小を判定できる
+# 進行中（end_timeがNULL）のエントリは終了時刻のない期間として扱う
+SQLITE_OVERLAP_CONDITION = """
+    NEW.start_time < COALESCE(NEW.end_time, '9999-12-31 23:59:59')
+    AND EXISTS (
+        SELECT 1 FROM api_timeentry
+        WHERE user_id = NEW.user_id
+        AND start_time < COALESCE(NEW.end_time, '9999-12-31 23:59:59')
+        AND COALESCE(end_time, '9999-12-31 23:59:59') > NEW.start_time
+        AND start_time < COALESCE(end_time, '9999-12-31 23:59:59')
+        {exclude_self}
+    )
+"""
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER {CONSTRAINT_NAME}_insert
+    BEFORE INSERT ON api_timeentry
+    WHEN {SQLITE_OVERLAP_CONDITION.format(exclude_self="")}
+    BEGIN
+        SELECT RAISE(ABORT, '{CONSTRAINT_NAME}: time entry overlaps another entry');
+    END
+    """,
+    f"""
+    CREATE TRIGGER {CONSTRAINT_NAME}_update
+    BEFORE UPDATE OF user_id, start_time, end_time ON api_timeentry
+    WHEN {SQLITE_OVERLAP_CONDITION.format(exclude_self="AND id != NEW.id")}
+    BEGIN
+        SELECT RAISE(ABORT, '{CONSTRAINT_NAME}: time entry overlaps another entry');
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {CONSTRAINT_NAME}_insert",
+    f"DROP TRIGGER IF EXISTS {CONSTRAINT_NAME}_update",
+]
+
+
+# エラーメッセージに表示する重複の件数
+REPORTED_OVERLAPS = 20
+
+
+def check_existing_overlaps(TimeEntry):
+    """
+    既存データに重なっているTime Entryがあれば中断する
+    ユーザー・開始時刻順に1回走査し、それまでで最も遅く終わるエントリと比較する
+    進行中のエントリの重複（ユーザーごとに複数のタイマー）は0012で解消されている
+    """
+    rows = TimeEntry.objects.order_by("user_id", "start_time", "id").values_list(
+        "id", "user_id", "start_time", "end_time"
+    )
+    overlaps = []
+    current_user, reach, reach_id = None, None, None
+    for entry_id, user_id, start_time, end_time in rows.iterator(chunk_size=5000):
+        end_time = end_time or OPEN_END
+        if end_time <= start_time:
+            continue
+        if user_id != current_user:
+            current_user, reach = user_id, None
+        elif reach is not None and start_time < reach:
+            overlaps.append((reach_id, entry_id))
+        if reach is None or end_time > reach:
+            reach, reach_id = end_time, entry_id
+    if overlaps:
+        pairs = ", ".join(f"{a} and {b}" for a, b in overlaps[:REPORTED_OVERLAPS])
+        if len(overlaps) > REPORTED_OVERLAPS:
+            pairs += f", ... ({len(overlaps) - REPORTED_OVERLAPS} more)"
+        raise RuntimeError(
+            f"{len(overlaps)} overlapping time entries found "
+            f"(ids {pairs}). Run "
+            "`manage.py audit_overlaps` and fix them before migrating."
+        )
+
+
+def add_overlap_constraint(apps, schema_editor):
+    check_existing_overlaps(apps.get_model("api", "TimeEntry"))
+    statements = {
+        "postgresql": POSTGRES_FORWARD,
+        "sqlite": SQLITE_FORWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def remove_overlap_constraint(apps, schema_editor):
+    statements = {
+        "postgresql": POSTGRES_REVERSE,
+        "sqlite": SQLITE_REVERSE,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    # 進行中のエントリの重複の解消（0012）の後に重複を検査する
+    dependencies = [
+        ("api", "0012_timeentry_unique_running_entry_per_user"),
+        ("api", "0014_user_timezone"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_constraint, remove_overlap_constraint),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_task_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="data_version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
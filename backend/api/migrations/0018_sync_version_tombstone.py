@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+no_overlap = import_module("api.migrations.0015_timeentry_no_overlap")
+
+
+def recreate_sqlite_triggers(apps, schema_editor):
+    """
+    SQLiteではNOT NULLの列の追加でテーブルが作り直され、トリガーが削除されるため
+    Time Entryの重複を拒否するトリガーを作り直す
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in no_overlap.SQLITE_REVERSE + no_overlap.SQLITE_FORWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0017_user_data_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("project", "project"),
+                            ("tag", "tag"),
+                            ("task", "task"),
+                            ("time_entry", "time_entry"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("sync_version", models.PositiveBigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="sync_version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="sync_version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="sync_version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        # 列の削除（逆方向）でもテーブルが作り直されるため、削除後に作り直す
+        migrations.RunPython(migrations.RunPython.noop, recreate_sqlite_triggers),
+        migrations.AddField(
+            model_name="timeentry",
+            name="sync_version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recreate_sqlite_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(
+                fields=["user", "sync_version"], name="api_project_user_id_1b6269_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=models.Index(
+                fields=["user", "sync_version"], name="api_tag_user_id_9adc27_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["user", "sync_version"], name="api_task_user_id_24cb57_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timeentry",
+            index=models.Index(
+                fields=["user", "sync_version"], name="api_timeent_user_id_11d81f_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="tombstone",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tombstones",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tombstone",
+            index=models.Index(
+                fields=["user", "sync_version"], name="api_tombsto_user_id_f8da8b_idx"
+            ),
+        ),
+    ]
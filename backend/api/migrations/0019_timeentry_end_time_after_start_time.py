@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:33
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+no_overlap = import_module("api.migrations.0015_timeentry_no_overlap")
+
+# エラーメッセージに表示するTime Entryの件数
+REPORTED_ENTRIES = 20
+
+
+def check_reversed_entries(apps, schema_editor):
+    """
+    既存データに終了時刻が開始時刻より前のTime Entryがあれば中断する
+    """
+    TimeEntry = apps.get_model("api", "TimeEntry")
+    reversed_entries = TimeEntry.objects.filter(
+        end_time__lt=models.F("start_time")
+    ).order_by("id")
+    count = reversed_entries.count()
+    if count:
+        ids = ", ".join(
+            str(pk)
+            for pk in reversed_entries.values_list("id", flat=True)[:REPORTED_ENTRIES]
+        )
+        if count > REPORTED_ENTRIES:
+            ids += f", ... ({count - REPORTED_ENTRIES} more)"
+        raise RuntimeError(
+            f"{count} time entries end before they start (ids {ids}). "
+            "Fix their start_time or end_time before migrating."
+        )
+
+
+def recreate_sqlite_triggers(apps, schema_editor):
+    """
+    SQLiteでは制約の追加・削除でテーブルが作り直され、トリガーが削除されるため
+    Time Entryの重複を拒否するトリガーを作り直す
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in no_overlap.SQLITE_REVERSE + no_overlap.SQLITE_FORWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_sync_version_tombstone"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_reversed_entries, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, recreate_sqlite_triggers),
+        migrations.AddConstraint(
+            model_name="timeentry",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("end_time__isnull", True),
+                    ("end_time__gte", models.F("start_time")),
+                    _connector="OR",
+                ),
+                name="timeentry_end_time_after_start_time",
+            ),
+        ),
+        migrations.RunPython(recreate_sqlite_triggers, migrations.RunPython.noop),
+    ]
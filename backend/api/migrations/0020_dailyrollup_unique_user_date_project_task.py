@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:56
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+import api.models
+
+KEY_FIELDS = ("user_id", "date", "project_id", "task_id")
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    """
+    同じ (user, date, project, task) の集計行を1行に合算する
+    """
+    DailyRollup = apps.get_model("api", "DailyRollup")
+    duplicates = (
+        DailyRollup.objects.order_by()
+        .values(*KEY_FIELDS)
+        .annotate(
+            rows=models.Count("id"),
+            keep_id=models.Min("id"),
+            total_seconds=models.Sum("duration_seconds"),
+            total_count=models.Sum("entry_count"),
+        )
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        key = {field: row[field] for field in KEY_FIELDS}
+        DailyRollup.objects.filter(**key).exclude(id=row["keep_id"]).delete()
+        DailyRollup.objects.filter(id=row["keep_id"]).update(
+            duration_seconds=row["total_seconds"], entry_count=row["total_count"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0019_timeentry_end_time_after_start_time"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="dailyrollup",
+            name="project",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=api.models.DETACH_ROLLUPS,
+                related_name="daily_rollups",
+                to="api.project",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dailyrollup",
+            name="task",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=api.models.DETACH_ROLLUPS,
+                related_name="daily_rollups",
+                to="api.task",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyrollup",
+            constraint=models.UniqueConstraint(
+                models.F("user"),
+                models.F("date"),
+                django.db.models.functions.comparison.Coalesce("project", 0),
+                django.db.models.functions.comparison.Coalesce("task", 0),
+                name="dailyrollup_unique_user_date_project_task",
+            ),
+        ),
+    ]
@@ -1,6 +1,33 @@
+from datetime import UTC, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    F,
+    Func,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Now
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+def validate_timezone(value):
+    """IANAタイムゾーン名として有効かチェック"""
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"不正なタイムゾーンです: {value}")
 
 
 class User(AbstractUser):
@@ -8,10 +35,103 @@ class User(AbstractUser):
     Custom user model extending AbstractUser
     """
 
-    pass
+    # 空の場合はsettings.TIME_ZONEを使用
+    timezone = models.CharField(
+        max_length=64, blank=True, default="", validators=[validate_timezone]
+    )
+
+    # ユーザーのデータ（プロジェクト・タグ・タスク・Time Entry）が変更されるたびに増える
+    # 条件付きGETのETagなどの検証子に使う
+    data_version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    def get_timezone(self):
+        """日付の境界（日次集計・レポート）に使うタイムゾーン"""
+        if self.timezone:
+            return ZoneInfo(self.timezone)
+        return timezone.get_default_timezone()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 読み込み時点のタイムゾーンを保持（変更検知に使用）
+        if "timezone" in instance.__dict__:
+            instance._loaded_timezone = instance.timezone
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Override save to rebuild the daily rollups when the timezone changes
+
+        data_version is only written by bump_data_version(): an ordinary save
+        of an existing user updates every other field, so a stale instance
+        never moves the counter back.
+        """
+        adding = self._state.adding
+        changed = getattr(self, "_loaded_timezone", self.timezone) != self.timezone
+        if not adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "data_version"
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_timezone = self.timezone
+
+        # 日付の境界が変わるため日次集計を作り直す
+        if not adding and changed:
+            DailyRollup.objects.rebuild(self)
+
+
+def bump_data_version(user_ids):
+    """
+    ユーザーのdata_versionを1つ進める（UPDATE 1文）
+    user_idsにはIDのリストまたはuser_idを返すQuerySetを指定できる
+    """
+    return User.objects.filter(pk__in=user_ids).update(
+        data_version=F("data_version") + 1
+    )
+
+
+def user_data_version(user_id=None):
+    """
+    ユーザーの現在のdata_versionを返すサブクエリ（sync_versionの記録に使う）
+    user_idを省略した場合は更新する行のuser_idで相関させる（一括UPDATE用）
+    """
+    user = OuterRef("user_id") if user_id is None else user_id
+    return Subquery(User.objects.filter(pk=user).values("data_version")[:1])
 
 
-class Project(models.Model):
+class SyncedModel(models.Model):
+    """
+    /api/sync/ の差分同期の対象になるユーザーのデータ
+
+    保存のたびにユーザーのdata_versionを進め、進めた後の値をsync_versionに記録する
+    data_versionの更新でユーザーの行がロックされるため、同じユーザーの変更は
+    コミット順にsync_versionが大きくなる
+    一括UPDATEで行を変更する場合は、先にdata_versionを進めてから
+    sync_version=user_data_version() を合わせて更新する
+    同じトランザクションで既にdata_versionを進めた場合は save(bump=False) で
+    進めずに現在の値を記録できる
+    """
+
+    sync_version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, bump=True, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if bump:
+                bump_data_version([self.user_id])
+            self.sync_version = user_data_version(self.user_id)
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "sync_version"}
+            super().save(*args, **kwargs)
+        # 式で保存した値は次のアクセス時にDBから読み込む
+        del self.sync_version
+
+
+class Project(SyncedModel):
     """
     Project model for organizing tasks
     """
@@ -26,13 +146,61 @@ class Project(models.Model):
         ordering = ["name"]
         indexes = [
             models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["user", "sync_version"]),
         ]
 
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        """
+        Override delete to mark the tasks and time entries detached from the
+        project (SET NULL without save()) as changed
+        """
+        with transaction.atomic(savepoint=False):
+            bump_data_version([self.user_id])
+            for model in (Task, TimeEntry):
+                model.objects.filter(project=self).update(
+                    sync_version=user_data_version()
+                )
+            return super().delete(*args, **kwargs)
+
+
+class TagQuerySet(models.QuerySet):
+    def get_or_create_names(self, user, names):
+        """
+        タグ名に対応するユーザーのタグを返し、存在しないものは作成する
+        作成は(user, name)の一意制約とbulk_create(ignore_conflicts=True)の1文で行い、
+        並行して作成されたタグはそのまま使う
+
+        {名前: Tag} を返す
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        tags = {tag.name: tag for tag in self.filter(user=user, name__in=names)}
+        missing = [name for name in names if name not in tags]
+        if missing:
+            with transaction.atomic(savepoint=False):
+                bump_data_version([user.pk])
+                self.bulk_create(
+                    [
+                        Tag(
+                            user=user,
+                            name=name,
+                            sync_version=user_data_version(user.pk),
+                        )
+                        for name in missing
+                    ],
+                    ignore_conflicts=True,
+                )
+            tags.update(
+                (tag.name, tag) for tag in self.filter(user=user, name__in=missing)
+            )
+        return {name: tags[name] for name in names}
+
 
-class Tag(models.Model):
+class Tag(SyncedModel):
     """
     Tag model for categorizing tasks
     """
@@ -41,10 +209,13 @@ class Tag(models.Model):
     name = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TagQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
         indexes = [
             models.Index(fields=["user", "name"]),
+            models.Index(fields=["user", "sync_version"]),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -55,8 +226,243 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        """
+        Override delete to mark the tasks losing the tag as changed
+        """
+        with transaction.atomic(savepoint=False):
+            bump_data_version([self.user_id])
+            Task.objects.filter(tags=self).update(sync_version=user_data_version())
+            return super().delete(*args, **kwargs)
+
+
+class ElapsedSeconds(Func):
+    """
+    指定した日時から現在時刻(Now)までの経過秒数をDB側で計算する式
+    PostgreSQLではinterval、SQLiteではマイクロ秒の整数として差分が得られる
+    """
+
+    template = "CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s)) AS integer)"
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, **extra):
+        elapsed = ExpressionWrapper(
+            Now() - expression, output_field=models.DurationField()
+        )
+        super().__init__(elapsed, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(%(expressions)s / 1000000)",
+            **extra_context,
+        )
+
+
+def _subtree_ids():
+    """
+    OuterRefのOuterRefのタスクのサブツリー（自タスク + 子 + 孫）のID
+    Time Entryの相関サブクエリで task_id__in に使い、pk・parent・rootと
+    task_idのインデックスで解決する（Time Entryの全件走査にならない）
+    """
+    task = OuterRef(OuterRef("pk"))
+    return Task.objects.filter(Q(pk=task) | Q(parent=task) | Q(root=task)).values("pk")
+
+
+def _subquery_total(queryset, expression, function="SUM"):
+    """
+    相関サブクエリとして集計値(SUM/COUNT)を返す式
+    GROUP BYを伴わない単一行の集計にするため、集計関数をFuncとして組み立てる
+    """
+    total = queryset.order_by().annotate(
+        _total=Func(expression, function=function, output_field=models.IntegerField())
+    )
+    return Coalesce(Subquery(total.values("_total")[:1]), 0)
+
+
+class TaskQuerySet(models.QuerySet):
+    """
+    Task用のQuerySet
+    階層はroot/parent/levelで表現されるため、サブツリー単位の処理を集合演算で行う
+    """
+
+    def descendants_of(self, task):
+        """
+        子孫タスク（子+孫）を1クエリで取得
+        ルートは(root, level)、子タスクはparentのインデックスで解決する
+        """
+        if task.level == 0:
+            return self.filter(root=task.pk, level__gt=0).order_by(
+                "level", "-created_at"
+            )
+        if task.level == 1:
+            return self.filter(root=task.root_id, level=2, parent=task.pk)
+        return self.none()
+
+    def subtree_of(self, task):
+        """自タスク + 子孫タスク"""
+        if task.level == 0:
+            return self.filter(Q(pk=task.pk) | Q(root=task.pk))
+        if task.level == 1:
+            return self.filter(Q(pk=task.pk) | Q(parent=task.pk))
+        return self.filter(pk=task.pk)
+
+    def ancestors_of(self, task):
+        """先祖タスク（parent, grandparent）を近い順に1クエリで取得"""
+        if task.level == 0:
+            return self.none()
+        ancestor_ids = [pk for pk in (task.parent_id, task.root_id) if pk]
+        return self.filter(pk__in=ancestor_ids).order_by("-level")
+
+    def descendants_map(self, tasks):
+        """
+        複数タスクの子孫タスクを1クエリでまとめて取得
+        {task_id: [子孫タスク, ...]} を返す
+        """
+        root_ids = {task.pk for task in tasks if task.level == 0}
+        child_ids = {task.pk for task in tasks if task.level == 1}
+        result = {task.pk: [] for task in tasks}
+        if not root_ids and not child_ids:
+            return result
+
+        rows = self.filter(Q(root__in=root_ids) | Q(parent__in=child_ids)).order_by(
+            "level", "-created_at"
+        )
+        for row in rows:
+            if row.root_id in root_ids:
+                result[row.root_id].append(row)
+            if row.parent_id in child_ids:
+                result[row.parent_id].append(row)
+        return result
+
+    def with_live_duration(self):
+        """
+        進行中のTime Entryを含む現在の累計時間(秒)をアノテート
+        - live_duration_seconds: duration_seconds + サブツリー内の進行中エントリの経過時間
+        - ongoing_duration_seconds: 進行中エントリの経過時間（filter/order_by用のalias）
+        経過時間はDB側で計算するため、複数タスクでも1クエリで取得できる
+
+        進行中のエントリはユーザーごとに1件のため、user_idのインデックスで引いて
+        サブツリー（pk・parent・rootのインデックスで解決）に含まれるかを確認する
+        サブクエリはSELECTに1回だけ現れる（aliasはSELECTに含まれない）
+        """
+        running = TimeEntry.objects.filter(
+            user_id=OuterRef("user_id"),
+            end_time__isnull=True,
+            task_id__in=_subtree_ids(),
+        )
+        return self.alias(
+            ongoing_duration_seconds=_subquery_total(
+                running, ElapsedSeconds(F("start_time"))
+            )
+        ).annotate(
+            live_duration_seconds=F("duration_seconds") + F("ongoing_duration_seconds")
+        )
+
+    def with_subtree_counts(self):
+        """
+        サブツリーの件数をアノテート
+        - child_count: 直接の子タスク数
+        - subtree_entry_count: サブツリー内のTime Entry数
+        どちらもparentとtask_idのインデックスで数える相関サブクエリ
+        """
+        children = Task.objects.filter(parent=OuterRef("pk"))
+        entries = TimeEntry.objects.filter(task_id__in=_subtree_ids())
+        return self.annotate(
+            child_count=_subquery_total(children, F("pk"), function="COUNT"),
+            subtree_entry_count=_subquery_total(entries, F("pk"), function="COUNT"),
+        )
+
+    def recompute_durations(self):
+        """
+        duration_secondsを完了したTime Entryの合計から再計算
+        各タスクのサブツリー（自タスク + 子 + 孫）をUPDATE 1文で集計する
+        """
+        completed = TimeEntry.objects.filter(
+            task_id__in=_subtree_ids(), end_time__isnull=False
+        )
+        return self.update(
+            duration_seconds=_subquery_total(completed, F("duration_seconds")),
+            updated_at=timezone.now(),
+            sync_version=user_data_version(),
+        )
+
+    def duration_drift(self):
+        """
+        完了したTime Entryの合計から求めたduration_secondsと保存値の差分
+        {pk: (保存値, 正しい値)} を返す（差分のないタスクは含まない）
+
+        タスクごとにGROUP BYした1回のクエリで自タスクの合計を取得し、
+        parent/rootを使ってPython側でサブツリーに積み上げる
+        クエリセットにはツリー全体（ユーザー単位など）が含まれている必要がある
+        """
+        rows = (
+            self.order_by()
+            .values("id", "parent_id", "root_id", "duration_seconds")
+            .annotate(
+                own=Coalesce(
+                    Sum(
+                        "time_entries__duration_seconds",
+                        filter=Q(time_entries__end_time__isnull=False),
+                    ),
+                    0,
+                )
+            )
+        )
+
+        stored, expected = {}, {}
+        for row in rows:
+            stored[row["id"]] = row["duration_seconds"]
+            expected.setdefault(row["id"], 0)
+            for pk in {row["id"], row["parent_id"], row["root_id"]} - {None}:
+                expected[pk] = expected.get(pk, 0) + row["own"]
 
-class Task(models.Model):
+        return {
+            pk: (stored[pk], expected[pk])
+            for pk in stored
+            if stored[pk] != expected[pk]
+        }
+
+    def add_tags(self, tags):
+        """
+        クエリセットのタスクにタグを追加する（既に付いているタグはそのまま）
+        中間テーブルへの追加はINSERT 1文（ignore_conflicts）で行い、m2m_changedは送らない
+        追加したタスクのIDのリストを返す
+        """
+        task_ids = list(self.values_list("pk", flat=True))
+        if not task_ids or not tags:
+            return task_ids
+        Through = self.model.tags.through
+        with transaction.atomic(savepoint=False):
+            Through.objects.bulk_create(
+                [
+                    Through(task_id=task_id, tag_id=tag.pk)
+                    for task_id in task_ids
+                    for tag in tags
+                ],
+                ignore_conflicts=True,
+            )
+            bump_data_version(self.values("user_id"))
+            self.update(sync_version=user_data_version())
+        return task_ids
+
+    def set_durations(self, durations):
+        """{pk: 秒数} をduration_secondsにまとめて書き込む（UPDATE 1文）"""
+        if not durations:
+            return 0
+        value = Case(
+            *(When(pk=pk, then=Value(seconds)) for pk, seconds in durations.items()),
+            default=F("duration_seconds"),
+        )
+        return self.filter(pk__in=durations).update(
+            duration_seconds=value,
+            updated_at=timezone.now(),
+            sync_version=user_data_version(),
+        )
+
+
+class Task(SyncedModel):
     """
     Task model supporting hierarchical structure (parent-child-grandchild)
     Maximum depth: 3 levels (level 0: parent, level 1: child, level 2: grandchild)
@@ -112,13 +518,18 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=["user", "created_at"]),
+            # キーセットページネーション (created_at, id) / (name, id) 用
+            models.Index(fields=["user", "created_at", "id"]),
+            models.Index(fields=["user", "name", "id"]),
             models.Index(fields=["user", "project"]),
             models.Index(fields=["parent"]),
             models.Index(fields=["root", "level"]),
+            models.Index(fields=["user", "sync_version"]),
         ]
         constraints = [
             models.CheckConstraint(
@@ -132,32 +543,23 @@ class Task(models.Model):
 
     def get_all_descendants(self):
         """全ての子孫タスク（子+孫）"""
-        descendants = list(self.children.all())
-        for child in self.children.all():
-            descendants.extend(child.children.all())
-        return descendants
+        return list(Task.objects.descendants_of(self))
 
     def get_all_ancestors(self):
         """全ての先祖タスク（parent, grandparent）をリストで返す"""
-        ancestors = []
-        current = self.parent
-        while current:
-            ancestors.append(current)
-            current = current.parent
-        return ancestors
+        return list(Task.objects.ancestors_of(self))
 
     def get_completed_duration_seconds(self):
         """
         完了したTime Entryの累計時間(秒)を取得
         自タスク + 子孫タスクのTime Entryの合計
         """
-        # 自タスク + 子孫タスクのIDリスト
-        task_ids = [self.id]
-        task_ids.extend([d.id for d in self.get_all_descendants()])
+        # 自タスク + 子孫タスク
+        subtree = Task.objects.subtree_of(self).values("pk")
 
         # 完了したTime Entryの合計
         result = TimeEntry.objects.filter(
-            task_id__in=task_ids, end_time__isnull=False  # 完了したもののみ
+            task__in=subtree, end_time__isnull=False  # 完了したもののみ
         ).aggregate(total=models.Sum("duration_seconds"))
         return result["total"] or 0
 
@@ -166,25 +568,19 @@ class Task(models.Model):
         進行中のTime Entryを含む現在の累計時間(秒)
         完了分(duration_seconds) + 進行中のエントリの経過時間
         """
-        from django.utils import timezone
-
         completed = self.duration_seconds
 
-        # 自タスク + 子孫タスクのIDリスト
-        task_ids = [self.id]
-        task_ids.extend([d.id for d in self.get_all_descendants()])
+        # 自タスク + 子孫タスク
+        subtree = Task.objects.subtree_of(self).values("pk")
 
-        # 進行中のエントリを取得
-        ongoing_entries = TimeEntry.objects.filter(
-            task_id__in=task_ids, end_time__isnull=True
+        # 進行中のエントリの経過時間をDB側で合計
+        ongoing_duration = (
+            TimeEntry.objects.filter(task__in=subtree, end_time__isnull=True).aggregate(
+                total=models.Sum(ElapsedSeconds(F("start_time")))
+            )["total"]
+            or 0
         )
 
-        ongoing_duration = 0
-        now = timezone.now()
-        for entry in ongoing_entries:
-            delta = now - entry.start_time
-            ongoing_duration += int(delta.total_seconds())
-
         return completed + ongoing_duration
 
     def clean(self):
@@ -221,8 +617,14 @@ class Task(models.Model):
     def save(self, *args, **kwargs):
         """
         Override save to automatically set level, root, and project
-        Also propagate project changes to all descendant tasks
+        Also propagate project changes to all descendant tasks, and move the
+        descendants along when the parent changes
         """
+        adding = self._state.adding
+        moved = not adding and self._parent_changed(kwargs)
+        if moved:
+            self.check_move(self.parent)
+
         # 親が設定されている場合
         if self.parent:
             # レベルを計算
@@ -246,11 +648,71 @@ class Task(models.Model):
             self.root = None
             # projectはユーザーが設定したものを使用
 
-        super().save(*args, **kwargs)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+            if moved:
+                # 子孫タスクを移動先に合わせ、移動元と移動先のツリーの時間を再計算
+                self._move_descendants(self._project_changed(kwargs))
+                TaskDurationRollup.mark(
+                    [getattr(self, "_loaded_parent_id", None), self.pk],
+                    using=kwargs.get("using"),
+                )
+            # 子孫タスクのプロジェクトも更新（既存のルートタスクでプロジェクトが変わった場合のみ）
+            elif not adding and self.level == 0 and self._project_changed(kwargs):
+                self._update_descendants_project()
+        self._loaded_project_id = self.project_id
+        self._loaded_parent_id = self.parent_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 読み込み時点のプロジェクト・親を保持（変更検知に使用）
+        if "project_id" in instance.__dict__:
+            instance._loaded_project_id = instance.project_id
+        if "parent_id" in instance.__dict__:
+            instance._loaded_parent_id = instance.parent_id
+        return instance
+
+    def _parent_changed(self, save_kwargs):
+        """前回の読み込み/保存時からparentが変更されたか（不明な場合はTrue）"""
+        update_fields = save_kwargs.get("update_fields")
+        if update_fields is not None and "parent" not in update_fields:
+            return False
+        if not hasattr(self, "_loaded_parent_id"):
+            return True
+        return self._loaded_parent_id != self.parent_id
+
+    def check_move(self, parent):
+        """
+        親をparent（Noneならルート）に変更できるか検証する
+        子孫タスクも一緒に移動するため、自身やその子孫の下への移動と、
+        子孫が孫より深くなる移動はエラー（子孫の確認は1クエリ）
+        """
+        if parent is None:
+            return
+        if self.pk and self.pk in (parent.pk, parent.parent_id, parent.root_id):
+            raise ValidationError({"parent": "循環参照が検出されました"})
+        level = parent.level + 1
+        if level > 2:
+            raise ValidationError(
+                {"parent": "孫タスクは子タスクを持てません（最大3階層まで）"}
+            )
+        # 移動後に孫より深くなる子孫（レベル1なら孫、レベル2なら子）
+        too_deep = {1: "parent__parent", 2: "parent"}[level]
+        if self.pk and Task.objects.filter(**{too_deep: self.pk}).exists():
+            raise ValidationError(
+                {"parent": "子孫タスクを含めて最大3階層までしか移動できません"}
+            )
 
-        # 子孫タスクのプロジェクトも更新（ルートタスクのみ）
-        if self.pk and self.level == 0:
-            self._update_descendants_project()
+    def _project_changed(self, save_kwargs):
+        """前回の読み込み/保存時からprojectが変更されたか（不明な場合はTrue）"""
+        update_fields = save_kwargs.get("update_fields")
+        if update_fields is not None and "project" not in update_fields:
+            return False
+        if not hasattr(self, "_loaded_project_id"):
+            return True
+        return self._loaded_project_id != self.project_id
 
     def _check_circular_reference(self):
         """循環参照を防ぐ"""
@@ -266,19 +728,167 @@ class Task(models.Model):
             visited.add(current.pk)
             current = current.parent
 
+    def _move_descendants(self, project_changed):
+        """
+        移動したタスクの子と孫のレベル・ルート・プロジェクトを一括UPDATEで合わせる
+        プロジェクトが変わった場合はサブツリーのTime Entryと日次集計も更新する
+        """
+        root_id = self.root_id or self.pk
+        for lookup, level in (
+            ("parent", self.level + 1),
+            ("parent__parent", self.level + 2),
+        ):
+            Task.objects.filter(**{lookup: self}).update(
+                level=level,
+                root=root_id,
+                project=self.project_id,
+                updated_at=timezone.now(),
+                sync_version=user_data_version(),
+            )
+        if project_changed:
+            subtree = Q(task=self) | Q(task__parent=self) | Q(task__parent__parent=self)
+            TimeEntry.objects.filter(subtree).update(
+                project=self.project_id, sync_version=user_data_version()
+            )
+            DailyRollup.objects.filter(subtree).update(project=self.project_id)
+
     def _update_descendants_project(self):
-        """全ての子孫タスクのプロジェクトを更新"""
-        descendants = self.get_all_descendants()
-        for descendant in descendants:
-            descendant.project = self.project
-            descendant.save(update_fields=["project", "updated_at"])
+        """
+        全ての子孫タスクとツリー配下のTime Entryのプロジェクトを更新
+        (root, level)インデックスを使った一括UPDATEで行う
+        """
+        Task.objects.filter(root=self, level__gt=0).update(
+            project=self.project_id,
+            updated_at=timezone.now(),
+            sync_version=user_data_version(),
+        )
+        TimeEntry.objects.filter(Q(task=self) | Q(task__root=self)).update(
+            project=self.project_id, sync_version=user_data_version()
+        )
+        DailyRollup.objects.filter(Q(task=self) | Q(task__root=self)).update(
+            project=self.project_id
+        )
+
+    def delete(self, *args, **kwargs):
+        """
+        Override delete to recompute the durations of the ancestors
+        Time entries of the deleted subtree are detached (SET NULL) without save(),
+        so they are marked as changed here
+        """
+        TaskDurationRollup.mark(
+            [self.parent_id, self.root_id], using=kwargs.get("using")
+        )
+        with transaction.atomic(savepoint=False):
+            bump_data_version([self.user_id])
+            TimeEntry.objects.filter(task__in=Task.objects.subtree_of(self)).update(
+                sync_version=user_data_version()
+            )
+            return super().delete(*args, **kwargs)
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def _mark_task_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    タスクのタグの付け外し（Tag側からの変更を含む）で
+    data_versionを進め、対象タスクのsync_versionを更新する
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    bump_data_version([instance.user_id])
+    if not reverse:
+        tasks = Task.objects.filter(pk=instance.pk)
+    elif action == "pre_clear":
+        tasks = Task.objects.filter(tags=instance)
+    else:
+        tasks = Task.objects.filter(pk__in=pk_set)
+    tasks.update(sync_version=user_data_version())
+
+
+class TaskDurationRollup:
+    """
+    トランザクション単位でまとめて行うTask.duration_secondsの再計算
+
+    Time Entryの作成・更新・削除で影響を受けたタスクを接続ごとのセットに集め、
+    transaction.on_commitでそれらのタスクと先祖タスク（ツリーの深さ分の行）を
+    UPDATE 1文で再計算する。合計はtask_idのインデックスで集計する
+    同じトランザクション内で何件のエントリが変更されても、各タスクは1回だけ再計算される
+    トランザクション外（autocommit）ではon_commitにより即座に再計算される
 
+    ロールバックされた場合、集めたタスクは次のコミット時に合わせて再計算される
+    （再計算は冪等なので結果は変わらない）
+    """
+
+    CHUNK_SIZE = 1000
 
-class TimeEntry(models.Model):
+    def __init__(self, using):
+        self.using = using
+        self.task_ids = set()
+        self.scheduled = False
+
+    @classmethod
+    def mark(cls, task_ids, using=None):
+        """タスク（またはそのツリー内のタスク）を再計算の対象に追加"""
+        task_ids = set(task_ids) - {None}
+        if not task_ids:
+            return
+        connection = transaction.get_connection(using)
+        rollup = getattr(connection, "task_duration_rollup", None)
+        if rollup is None:
+            rollup = connection.task_duration_rollup = cls(connection.alias)
+        rollup.task_ids |= task_ids
+        # ロールバックでコールバックが破棄されていた場合も登録し直す
+        if not (rollup.scheduled and rollup.is_pending(connection)):
+            rollup.scheduled = True
+            transaction.on_commit(rollup.flush, using=connection.alias)
+
+    def is_pending(self, connection):
+        return any(func == self.flush for _, func, _ in connection.run_on_commit)
+
+    def flush(self):
+        """集めたタスクとその先祖タスクのduration_secondsを再計算"""
+        task_ids, self.task_ids = list(self.task_ids), set()
+        self.scheduled = False
+        tasks = Task.objects.using(self.using)
+        with transaction.atomic(using=self.using, savepoint=False):
+            for i in range(0, len(task_ids), self.CHUNK_SIZE):
+                chunk = task_ids[i : i + self.CHUNK_SIZE]
+                marked = tasks.filter(pk__in=chunk)
+                bump_data_version(marked.values("user_id"))
+                tasks.filter(
+                    Q(pk__in=chunk)
+                    | Q(pk__in=marked.values("parent"))
+                    | Q(pk__in=marked.values("root"))
+                ).recompute_durations()
+
+
+class TimeEntryQuerySet(models.QuerySet):
+    def overlapping(self, start_time, end_time=None):
+        """
+        期間 [start_time, end_time) と重なるTime Entry
+        end_timeがNoneの場合（進行中）は終了時刻のない期間として扱う
+        """
+        if end_time is not None and end_time <= start_time:
+            # 長さ0のエントリはどのエントリとも重ならない
+            return self.none()
+        queryset = self.filter(
+            Q(end_time__isnull=True) | Q(end_time__gt=start_time)
+        ).exclude(start_time=F("end_time"))
+        if end_time is not None:
+            queryset = queryset.filter(start_time__lt=end_time)
+        return queryset
+
+
+class TimeEntry(SyncedModel):
     """
     Time entry model for tracking time spent on tasks
+
+    Entries of a user must not overlap. This is enforced by an exclusion
+    constraint on PostgreSQL and by triggers on SQLite (migration 0015).
     """
 
+    # 重複を禁止する制約（トリガー）の名前。違反時のエラーメッセージに含まれる
+    NO_OVERLAP_CONSTRAINT = "api_timeentry_no_overlap"
+
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="time_entries"
     )
@@ -302,11 +912,29 @@ class TimeEntry(models.Model):
     duration_seconds = models.IntegerField(editable=False, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TimeEntryQuerySet.as_manager()
+
     class Meta:
         ordering = ["-start_time"]
         indexes = [
             models.Index(fields=["user", "start_time"]),
             models.Index(fields=["user", "task", "start_time"]),
+            models.Index(fields=["user", "project", "start_time"]),
+            models.Index(fields=["user", "sync_version"]),
+        ]
+        constraints = [
+            # 進行中のTime Entry（タイマー）はユーザーごとに1件のみ
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(end_time__isnull=True),
+                name="unique_running_entry_per_user",
+            ),
+            # 終了時刻は開始時刻以降（PostgreSQLのtstzrangeは逆順の範囲を作れない）
+            models.CheckConstraint(
+                condition=models.Q(end_time__isnull=True)
+                | models.Q(end_time__gte=models.F("start_time")),
+                name="timeentry_end_time_after_start_time",
+            ),
         ]
 
     def __str__(self):
@@ -319,6 +947,49 @@ class TimeEntry(models.Model):
         seconds = self.duration_seconds % 60
         return f"{task_name} - {hours:02d}:{minutes:02d}:{seconds:02d}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 読み込み時点の集計状態を保持（保存時の差分計算に使用）
+        instance._loaded_rollup = instance._get_rollup_state()
+        if not instance.get_deferred_fields() & set(cls.DAILY_ROLLUP_FIELDS):
+            instance._loaded_daily = instance._get_daily_state()
+        return instance
+
+    def _get_rollup_state(self):
+        """
+        Taskの累計時間への寄与 (task_id, 秒数) を返す
+        task_id/duration_secondsが読み込まれていない場合はNone
+        """
+        if "task_id" not in self.__dict__ or "duration_seconds" not in self.__dict__:
+            return None
+        return (self.task_id, self.duration_seconds or 0)
+
+    DAILY_ROLLUP_FIELDS = ("start_time", "end_time", "project_id", "task_id")
+
+    def _get_daily_state(self):
+        """
+        日次集計への寄与 (start_time, end_time, project_id, task_id) を返す
+        進行中のTime Entryは集計対象外のためNone
+        """
+        if self.end_time is None:
+            return None
+        return tuple(getattr(self, name) for name in self.DAILY_ROLLUP_FIELDS)
+
+    def _get_saved_daily_state(self):
+        """DB上の（前回保存時点の）日次集計への寄与を返す"""
+        if self._state.adding:
+            return None
+        if hasattr(self, "_loaded_daily"):
+            return self._loaded_daily
+        # 読み込み時に一部のフィールドが遅延されていた場合はDBから取得
+        saved = (
+            TimeEntry.objects.filter(pk=self.pk, end_time__isnull=False)
+            .values_list(*self.DAILY_ROLLUP_FIELDS)
+            .first()
+        )
+        return tuple(saved) if saved else None
+
     def clean(self):
         """モデルレベルのバリデーション"""
         super().clean()
@@ -335,6 +1006,24 @@ class TimeEntry(models.Model):
                 {"project": "選択されたプロジェクトはこのユーザーに紐づいていません"}
             )
 
+        # 終了時刻が開始時刻より前でないかチェック
+        if self.start_time and self.end_time and self.end_time < self.start_time:
+            raise ValidationError(
+                {"end_time": "終了時刻は開始時刻より後である必要があります"}
+            )
+
+        # 同じユーザーの他のTime Entryと時間が重なっていないかチェック
+        if self.start_time and self.user_id:
+            overlapping = TimeEntry.objects.filter(user_id=self.user_id).overlapping(
+                self.start_time, self.end_time
+            )
+            if self.pk:
+                overlapping = overlapping.exclude(pk=self.pk)
+            if overlapping.exists():
+                raise ValidationError(
+                    {"start_time": "他のTime Entryと時間が重複しています"}
+                )
+
     def save(self, *args, **kwargs):
         """
         Override save to automatically calculate duration_seconds
@@ -346,25 +1035,296 @@ class TimeEntry(models.Model):
             self.duration_seconds = None
 
         if self.task:
-            self.project = self.task.project
+            self.project_id = self.task.project_id
             self.name = self.task.name
 
-        super().save(*args, **kwargs)
+        saved_daily = self._get_saved_daily_state()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+            # 関連Taskのツリーのduration_secondsをコミット時に再計算
+            self._mark_task_duration(kwargs.get("using"))
+            # 日次集計に差分を反映
+            self._update_daily_rollup(saved_daily, self._get_daily_state())
+
+    def delete(self, *args, **kwargs):
+        """
+        Override delete to remove the entry from the daily rollups
+        and the task durations
+        """
+        saved_daily = self._get_saved_daily_state()
+        loaded = getattr(self, "_loaded_rollup", None)
+        with transaction.atomic(savepoint=False):
+            result = super().delete(*args, **kwargs)
+            self._update_daily_rollup(saved_daily, None)
+            if loaded is None or loaded[1]:
+                task_id = loaded[0] if loaded else self.task_id
+                TaskDurationRollup.mark([task_id], using=kwargs.get("using"))
+        return result
+
+    def _update_daily_rollup(self, old, new):
+        """
+        日次集計に旧状態の取り消しと新状態の加算を反映
+        集計に関係するフィールドが変わっていなければ何もしない
+        """
+        self._loaded_daily = new
+        if old == new:
+            return
+        tz = self.user.get_timezone()
+        deltas = {}
+        if old is not None:
+            DailyRollup.add_entry_deltas(deltas, old, tz, sign=-1)
+        if new is not None:
+            DailyRollup.add_entry_deltas(deltas, new, tz)
+        DailyRollup.objects.apply_deltas(self.user_id, deltas)
+
+    def _mark_task_duration(self, using=None):
+        """
+        Taskの累計時間への寄与が変わった場合、旧タスクと新タスクのツリーを
+        コミット時の再計算の対象にする
+        以前の状態が不明な場合は現在のタスクを対象にする
+        """
+        loaded = getattr(self, "_loaded_rollup", (None, 0))
+        current = self._get_rollup_state()
+        self._loaded_rollup = current
+
+        if loaded is None:
+            TaskDurationRollup.mark([self.task_id], using=using)
+        elif loaded != current:
+            # 寄与のない（進行中の）状態のタスクは対象外
+            TaskDurationRollup.mark(
+                [task_id for task_id, seconds in (loaded, current) if seconds],
+                using=using,
+            )
+
+
+class DailyRollupQuerySet(models.QuerySet):
+    def apply_deltas(self, user_id, deltas, batch_size=100):
+        """
+        {(date, project_id, task_id): (秒数, 件数)} の差分を集計行に加算
+        該当する集計行がなければ作成する
+        """
+        rows = [
+            (user_id, date, project_id, task_id, seconds, count)
+            for (date, project_id, task_id), (seconds, count) in deltas.items()
+            if seconds or count
+        ]
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))
+            self._upsert(f"VALUES {values}", [v for row in batch for v in row])
+
+    def detach(self, field):
+        """
+        集計行のfield (project/task) を外し、外した後のキーの集計行に合算する
+        行ごとにSET NULLすると一意制約 (user, date, project, task) で衝突するため、
+        外した後のキーで集約して加算してから元の行を削除する
+        """
+        quote = connections[self.db].ops.quote_name
+        kept = "task_id" if field == "project" else "project_id"
+        columns = {"project_id": "NULL", "task_id": "NULL", kept: kept}
+        rows, params = self.values("pk").query.sql_with_params()
+        self._upsert(
+            f"SELECT user_id, date, {columns['project_id']}, {columns['task_id']}, "
+            "SUM(duration_seconds), SUM(entry_count) "
+            f"FROM {quote(self.model._meta.db_table)} WHERE id IN ({rows}) "
+            f"GROUP BY user_id, date, {kept}",
+            params,
+        )
+        self.delete()
+
+    def _upsert(self, rows, params):
+        """
+        rows (VALUES/SELECT) の (user_id, date, project_id, task_id, 秒数, 件数) を
+        一意制約に対する INSERT ... ON CONFLICT で1文のまま集計行に加算する
+        """
+        table = connections[self.db].ops.quote_name(self.model._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} "
+            "(user_id, date, project_id, task_id, duration_seconds, entry_count) "
+            f"{rows} "
+            "ON CONFLICT (user_id, date, COALESCE(project_id, 0), COALESCE(task_id, 0)) "
+            f"DO UPDATE SET duration_seconds = {table}.duration_seconds "
+            "+ excluded.duration_seconds, "
+            f"entry_count = {table}.entry_count + excluded.entry_count"
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def rebuild(self, user, chunk_size=2000):
+        """
+        ユーザーの日次集計を完了済みTime Entryから作り直す
+        作成した集計行の件数を返す
+        """
+        user_id = user.pk
+        tz = user.get_timezone()
+        with transaction.atomic():
+            entries = TimeEntry.objects.filter(
+                user_id=user_id, end_time__isnull=False
+            ).values_list(*TimeEntry.DAILY_ROLLUP_FIELDS)
+
+            deltas = {}
+            for state in entries.iterator(chunk_size=chunk_size):
+                DailyRollup.add_entry_deltas(deltas, state, tz)
+
+            self.filter(user_id=user_id).delete()
+            rows = self.bulk_create(
+                [
+                    DailyRollup(
+                        user_id=user_id,
+                        date=date,
+                        project_id=project_id,
+                        task_id=task_id,
+                        duration_seconds=seconds,
+                        entry_count=count,
+                    )
+                    for (date, project_id, task_id), (seconds, count) in deltas.items()
+                ],
+                batch_size=chunk_size,
+            )
+        return len(rows)
+
+
+def DETACH_ROLLUPS(collector, field, sub_objs, using):
+    """
+    DailyRollupのproject/task用on_delete
+    SET_NULLと同じ結果を、同じキーの集計行へ合算して一意制約を保ったまま作る
+    """
+    DailyRollup.objects.using(using).filter(pk__in=sub_objs).detach(field.name)
+
+
+DETACH_ROLLUPS.lazy_sub_objs = True
+
+
+class DailyRollup(models.Model):
+    """
+    Pre-aggregated daily totals of completed TimeEntries
+
+    One row per user, local date (in the user's timezone), project and task,
+    enforced by a unique constraint that treats a missing project/task as a
+    value. Rows are updated with deltas in the same transaction as the
+    TimeEntry change, so reports can read these summary rows instead of
+    scanning raw entries. Entries spanning midnight are split across the local
+    dates they cover.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="daily_rollups"
+    )
+    date = models.DateField()
+    project = models.ForeignKey(
+        Project,
+        on_delete=DETACH_ROLLUPS,
+        null=True,
+        blank=True,
+        related_name="daily_rollups",
+    )
+    task = models.ForeignKey(
+        Task,
+        on_delete=DETACH_ROLLUPS,
+        null=True,
+        blank=True,
+        related_name="daily_rollups",
+    )
+    duration_seconds = models.IntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
 
-        # Time Entryが完了した場合、関連Taskのduration_secondsを更新
-        if self.task and self.end_time:
-            self._update_task_duration()
+    objects = DailyRollupQuerySet.as_manager()
 
-    def _update_task_duration(self):
+    class Meta:
+        ordering = ["-date"]
+        indexes = [
+            models.Index(fields=["user", "date"]),
+        ]
+        constraints = [
+            # apply_deltas()/detach()のON CONFLICTはこの式と同じ列・式を指定する
+            models.UniqueConstraint(
+                "user",
+                "date",
+                Coalesce("project", 0),
+                Coalesce("task", 0),
+                name="dailyrollup_unique_user_date_project_task",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.date}: {self.duration_seconds}s"
+
+    @staticmethod
+    def split_by_day(start_time, end_time, tz):
         """
-        関連Taskとその先祖タスクのduration_secondsを更新
-        完了したTime Entryの合計を再計算して保存
+        期間をローカル日付ごとに分割し (date, 秒数) を返す
+        秒数の合計はTimeEntry.duration_secondsと一致する
         """
-        # 直接のタスクを更新
-        self.task.duration_seconds = self.task.get_completed_duration_seconds()
-        self.task.save(update_fields=["duration_seconds", "updated_at"])
+        # 夏時間の切り替えを考慮してUTCで計算
+        current, end_time = start_time.astimezone(UTC), end_time.astimezone(UTC)
+        remaining = int((end_time - current).total_seconds())
+        local_date = timezone.localtime(current, tz).date()
+        while local_date < timezone.localtime(end_time, tz).date():
+            next_date = local_date + timedelta(days=1)
+            boundary = datetime.combine(next_date, time.min, tzinfo=tz).astimezone(UTC)
+            seconds = min(int((boundary - current).total_seconds()), remaining)
+            yield local_date, seconds
+            remaining -= seconds
+            current = boundary
+            local_date = next_date
+        yield local_date, remaining
+
+    @classmethod
+    def add_entry_deltas(cls, deltas, state, tz, sign=1):
+        """TimeEntryの寄与 (start_time, end_time, project_id, task_id) をdeltasに加算"""
+        start_time, end_time, project_id, task_id = state
+        for date, seconds in cls.split_by_day(start_time, end_time, tz):
+            key = (date, project_id, task_id)
+            total, count = deltas.get(key, (0, 0))
+            deltas[key] = (total + sign * seconds, count + sign)
+        return deltas
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row of a user's synced data, returned by /api/sync/
+    """
+
+    MODELS = {
+        Project: "project",
+        Tag: "tag",
+        Task: "task",
+        TimeEntry: "time_entry",
+    }
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tombstones")
+    model = models.CharField(
+        max_length=20, choices=[(name, name) for name in MODELS.values()]
+    )
+    object_id = models.BigIntegerField()
+    sync_version = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "sync_version"]),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} (deleted)"
+
+
+def _record_tombstone(sender, instance, origin=None, **kwargs):
+    """
+    削除された行（CASCADEで削除された子タスクなどを含む）のTombstoneを記録
+    ユーザー自体の削除に伴う場合は記録しない
+    """
+    if isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    bump_data_version([instance.user_id])
+    Tombstone.objects.create(
+        user_id=instance.user_id,
+        model=Tombstone.MODELS[sender],
+        object_id=instance.pk,
+        sync_version=user_data_version(instance.user_id),
+    )
+
 
-        # 先祖タスク全体も更新
-        for ancestor in self.task.get_all_ancestors():
-            ancestor.duration_seconds = ancestor.get_completed_duration_seconds()
-            ancestor.save(update_fields=["duration_seconds", "updated_at"])
+for _model in Tombstone.MODELS:
+    post_delete.connect(_record_tombstone, sender=_model)
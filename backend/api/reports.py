@@ -0,0 +1,160 @@
+"""
+Reports in the user's timezone
+
+The summary report reads the DailyRollup table: entries are already split
+at local midnight when they are rolled up, so day/week/month buckets are
+plain date truncations evaluated in the database over a few hundred
+summary rows. Timeline and heatmap reports need sub-day resolution and are
+computed from raw entries with the vectorized interval engine.
+"""
+
+from datetime import UTC, date, datetime
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from . import intervals
+from .models import DailyRollup
+
+# day: ローカル日付そのもの / week: ISO週の月曜日 / month: 月初日
+BUCKETS = {
+    "day": F,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+# タイムラインのバケットと、1回で取得できる最大日数
+TIMELINE_BUCKETS = {
+    "hour": 31,
+    "day": 366,
+}
+
+# グループ化キー (ID, 名前)
+GROUPS = {
+    "project": ("project_id", "project__name"),
+    "task": ("task_id", "task__name"),
+    "tag": ("task__tags__id", "task__tags__name"),
+}
+
+
+def summarize(user, start, end, bucket="day", group_by=None):
+    """
+    期間内の合計時間をバケット（日/週/月）とグループごとに集計する
+    タグでグループ化した場合、複数のタグを持つタスクの時間はそれぞれのタグに計上される
+    """
+    rollups = DailyRollup.objects.filter(user=user, date__range=(start, end))
+
+    columns = {"period": BUCKETS[bucket]("date")}
+    ordering = ["period"]
+    if group_by:
+        id_field, name_field = GROUPS[group_by]
+        columns.update(key=F(id_field), key_name=F(name_field))
+        # DBによらず未分類（NULL）のグループを先頭にする
+        ordering.append(F("key").asc(nulls_first=True))
+
+    rows = (
+        rollups.values(**columns)
+        .annotate(seconds=Sum("duration_seconds"), entries=Sum("entry_count"))
+        .filter(entries__gt=0)
+        .order_by(*ordering)
+    )
+
+    results = []
+    for row in rows:
+        result = {"period": row["period"].isoformat()}
+        if group_by:
+            result.update(id=row["key"], name=row["key_name"])
+        result.update(duration_seconds=row["seconds"], entry_count=row["entries"])
+        results.append(result)
+
+    total = rollups.aggregate(total=Sum("duration_seconds"))["total"] or 0
+    return {
+        "timezone": str(user.get_timezone()),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "group_by": group_by,
+        "total_seconds": total,
+        "results": results,
+    }
+
+
+def timeline(user, start, end, bucket="day"):
+    """
+    期間内の時間帯（時/日）ごとの合計秒数・稼働秒数・プロジェクト別秒数
+    稼働秒数は重なっているエントリを1回だけ数えた時間
+    """
+    tz = user.get_timezone()
+    if bucket == "hour":
+        edges, _ = intervals.local_hour_edges(start, end, tz)
+    else:
+        edges = intervals.local_day_edges(start, end, tz)
+
+    loaded = intervals.load_intervals(user, *_edge_range(edges))
+    totals, active, projects = intervals.timeline(loaded, edges)
+
+    results = []
+    for k, edge in enumerate(edges[:-1]):
+        results.append(
+            {
+                "start": datetime.fromtimestamp(edge, tz).isoformat(),
+                "duration_seconds": _seconds(totals[k]),
+                "active_seconds": _seconds(active[k]),
+                "projects": [
+                    {
+                        "id": (
+                            None if project_id == intervals.NO_PROJECT else project_id
+                        ),
+                        "duration_seconds": _seconds(seconds[k]),
+                    }
+                    for project_id, seconds in projects.items()
+                    if _seconds(seconds[k])
+                ],
+            }
+        )
+    return {
+        "timezone": str(tz),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "results": results,
+    }
+
+
+def heatmap(user, year):
+    """
+    1年分の日ごとの合計秒数と、曜日（月曜=0）×時刻の7x24ヒストグラム
+    """
+    tz = user.get_timezone()
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    day_edges = intervals.local_day_edges(start, end, tz)
+    hour_edges, labels = intervals.local_hour_edges(start, end, tz)
+
+    loaded = intervals.load_intervals(user, *_edge_range(day_edges))
+    days = intervals.bin_totals(loaded.starts, loaded.ends, day_edges)
+    hours = intervals.hour_of_week(loaded.starts, loaded.ends, hour_edges, labels)
+
+    return {
+        "timezone": str(tz),
+        "year": year,
+        "days": [
+            {
+                "date": datetime.fromtimestamp(edge, tz).date().isoformat(),
+                "duration_seconds": _seconds(seconds),
+            }
+            for edge, seconds in zip(day_edges, days)
+            if _seconds(seconds)
+        ],
+        "hour_of_week": [[_seconds(seconds) for seconds in row] for row in hours],
+    }
+
+
+def _edge_range(edges):
+    return (
+        datetime.fromtimestamp(edges[0], UTC),
+        datetime.fromtimestamp(edges[-1], UTC),
+    )
+
+
+def _seconds(value):
+    return round(value)
@@ -0,0 +1,147 @@
+"""
+Per-user cache of list and retrieve responses
+
+User.data_version is the user's generation counter: every save and
+delete of their projects, tags, tasks and time entries (bulk updates
+included) bumps it. Cached response data is keyed by the user, the
+current version and the request URL, so a write makes every entry of
+that user unreachable at once without deleting anything; stale entries
+simply expire. A warm read costs the version lookup that the ETag needs
+anyway and no queryset or serializer work. The version is read before the
+data, so an entry is never older than the version it is stored under.
+
+The version is read from the database rather than kept in the cache, so
+a process-local backend is never stale against writes made by other
+processes. The backend is the Django cache named by the
+API_RESPONSE_CACHE setting (local memory by default); hits and misses are
+counted in the same backend, per process with local memory and shared
+with Redis or Memcached.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import DataVersionMixin
+
+KEY_PREFIX = "api-response"
+
+# キャッシュする ViewSet の名前（統計の集計対象）
+NAMESPACES = []
+
+
+def get_cache():
+    """レスポンスを保存するキャッシュ（API_RESPONSE_CACHE の別名、既定は default）"""
+    return caches[getattr(settings, "API_RESPONSE_CACHE", "default")]
+
+
+def _counter_key(namespace, outcome):
+    return f"{KEY_PREFIX}:{outcome}:{namespace}"
+
+
+def record(namespace, outcome):
+    """ヒット・ミスの件数を数える（outcome は "hits" か "misses"）"""
+    cache, key = get_cache(), _counter_key(namespace, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 初回（またはキャッシュから追い出された後）は作成する
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    """ViewSet ごとと合計のヒット・ミスの件数とヒット率"""
+    counters = get_cache().get_many(
+        [
+            _counter_key(namespace, outcome)
+            for namespace in NAMESPACES
+            for outcome in ("hits", "misses")
+        ]
+    )
+    result, total = {}, {"hits": 0, "misses": 0}
+    for namespace in NAMESPACES:
+        counts = {
+            outcome: counters.get(_counter_key(namespace, outcome), 0)
+            for outcome in ("hits", "misses")
+        }
+        result[namespace] = _with_hit_rate(counts)
+        total["hits"] += counts["hits"]
+        total["misses"] += counts["misses"]
+    return {"total": _with_hit_rate(total), "viewsets": result}
+
+
+def _with_hit_rate(counts):
+    requests = counts["hits"] + counts["misses"]
+    return {**counts, "hit_rate": counts["hits"] / requests if requests else None}
+
+
+class ResponseCacheMixin(DataVersionMixin):
+    """
+    Cache the data of successful list and retrieve responses per user
+
+    Subclasses are registered under cache_namespace (the model name by
+    default) for the hit/miss statistics.
+    """
+
+    cache_actions = ("list", "retrieve")
+    cache_namespace = None
+    cache_timeout = DEFAULT_TIMEOUT
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        serializer_class = getattr(cls, "serializer_class", None)
+        if cls.cache_namespace is None and serializer_class is not None:
+            cls.cache_namespace = serializer_class.Meta.model._meta.model_name
+        if cls.cache_namespace and cls.cache_namespace not in NAMESPACES:
+            NAMESPACES.append(cls.cache_namespace)
+
+    def is_cacheable(self):
+        """キャッシュするアクションか（時刻に依存する表現を返す場合はFalseにする）"""
+        return self.action in self.cache_actions
+
+    def get_cache_key(self, request):
+        user = request.user
+        key = "\n".join(
+            [
+                str(user.pk),
+                # 主キーは再利用されうる（テストのロールバックなど）ので登録日時も含める
+                user.date_joined.isoformat(),
+                str(self.get_data_version(request)),
+                request.build_absolute_uri(),
+            ]
+        )
+        return f"{KEY_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable():
+            return handler(request, *args, **kwargs)
+
+        cache, key = get_cache(), self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            record(self.cache_namespace, "hits")
+            data, headers = cached
+            return Response(data, headers=headers)
+
+        record(self.cache_namespace, "misses")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            # Content-Type はレンダラーが決める
+            headers = {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() != "content-type"
+            }
+            cache.set(key, (response.data, headers), self.cache_timeout)
+        return response
@@ -1,6 +1,13 @@
+from operator import attrgetter
+
+from dj_rest_auth.serializers import UserDetailsSerializer as BaseUserDetailsSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 
-from .models import Project, Tag, Task
+from .models import Project, Tag, Task, TimeEntry
+from .reports import BUCKETS, GROUPS, TIMELINE_BUCKETS
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -60,14 +67,53 @@ class TagSerializer(serializers.ModelSerializer):
         return data
 
 
+class IdentityMapRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key relation resolved through the request's IdentityMap
+    (context["identity_map"]) when there is one
+    """
+
+    def to_internal_value(self, data):
+        identity_map = self.context.get("identity_map")
+        if identity_map is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        instance = identity_map.get(self.get_queryset().model, pk)
+        if instance is None:
+            self.fail("does_not_exist", pk_value=data)
+        return instance
+
+
+class TagNamesField(serializers.ListField):
+    """
+    Names of a task's tags; on writes, tags to attach by name (created if missing)
+    """
+
+    child = serializers.CharField(max_length=50)
+
+    def get_attribute(self, instance):
+        return [tag.name for tag in instance.tags.all()]
+
+
 class TaskSerializer(serializers.ModelSerializer):
     """
     Serializer for Task model
+
+    With an IdentityMap in the context, parent, project and tags of a write
+    are loaded with one query per model, and parent comes with its parent,
+    root and root project so that Task.save() needs no further lookups.
     """
 
+    serializer_related_field = IdentityMapRelatedField
+
     project_name = serializers.CharField(source="project.name", read_only=True)
     parent_name = serializers.CharField(source="parent.name", read_only=True)
-    tag_names = serializers.SerializerMethodField(read_only=True)
+    tag_names = TagNamesField(required=False)
 
     # PrimaryKeyRelatedFieldでquerysetを指定する必要はない（get_queryset_for_fieldで動的に取得）
     # ただし、バリデーションを簡単にするため明示的にqueryset指定
@@ -99,8 +145,24 @@ class TaskSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
 
+    # ?with= で追加できる読み取り専用フィールド（ViewSetでアノテートされた値）
+    OPTIONAL_FIELDS = {
+        "live_duration": ["live_duration_seconds"],
+        "subtree_counts": ["child_count", "subtree_entry_count"],
+    }
+
+    # 出力に関連オブジェクトのJOIN（select_related）が必要なフィールド
+    RELATED_FIELDS = {"project_name": "project", "parent_name": "parent"}
+    # 出力にタグのprefetchが必要なフィールド
+    PREFETCH_FIELDS = {"tags": "tags", "tag_names": "tags"}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # ?with= で指定された追加フィールド
+        for option in self.context.get("with", ()):
+            for name in self.OPTIONAL_FIELDS[option]:
+                self.fields[name] = serializers.IntegerField(read_only=True)
+
         # リクエストコンテキストからユーザーを取得してquerysetをフィルタリング
         request = self.context.get("request")
         if request and hasattr(request, "user"):
@@ -110,9 +172,102 @@ class TaskSerializer(serializers.ModelSerializer):
             self.fields["parent"].queryset = Task.objects.filter(user=user)
             self.fields["tags"].queryset = Tag.objects.filter(user=user)
 
-    def get_tag_names(self, obj):
-        """タグ名のリストを取得"""
-        return [tag.name for tag in obj.tags.all()]
+        # ?fields= / ?omit= で絞り込まれた出力フィールド
+        selected = self.context.get("fields")
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_available_fields(cls, with_options=()):
+        """?with= を含めて出力できるフィールド名"""
+        names = list(cls.Meta.fields)
+        for option in with_options:
+            names += cls.OPTIONAL_FIELDS[option]
+        return names
+
+    @classmethod
+    def restrict_queryset(cls, queryset, fields, extra=()):
+        """
+        出力するフィールドに必要なJOIN・prefetch・カラムだけを読み込む
+        extraには並び替えなどで常に必要なカラムを指定する
+        """
+        columns = {field.name for field in Task._meta.concrete_fields}
+        only = {"id", *extra}
+        related, prefetch = set(), set()
+        for name in fields:
+            if name in cls.RELATED_FIELDS:
+                relation = cls.RELATED_FIELDS[name]
+                related.add(relation)
+                only |= {relation, f"{relation}__name"}
+            elif name in cls.PREFETCH_FIELDS:
+                prefetch.add(cls.PREFETCH_FIELDS[name])
+            elif name in columns:
+                only.add(name)
+        if related:
+            # 引数なしのselect_related()は全ての外部キーをJOINするため指定時のみ
+            queryset = queryset.select_related(*sorted(related))
+        return queryset.prefetch_related(*prefetch).only(*sorted(only))
+
+    def to_internal_value(self, data):
+        """参照される行をIdentityMapにまとめて読み込んでから検証する"""
+        identity_map = self.context.get("identity_map")
+        if identity_map is not None and isinstance(data, dict):
+            if hasattr(data, "getlist"):
+                tags = data.getlist("tags")
+            else:
+                tags = data.get("tags")
+            references = {
+                Task: [data.get("parent")],
+                Project: [data.get("project")],
+                Tag: tags if isinstance(tags, list) else [],
+            }
+            for model, values in references.items():
+                identity_map.load(model, _primary_keys(values))
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        """
+        タスクとタグの中間テーブルの行をINSERTする
+        作成したタスクのsync_versionは同じトランザクションで記録されるため、
+        タグの追加ではset()の事前の読み込みやm2m_changedによる再記録を行わない
+        """
+        self._resolve_tag_names(validated_data)
+        tags = list(dict.fromkeys(validated_data.pop("tags", [])))
+        Through = Task.tags.through
+        with transaction.atomic(savepoint=False):
+            instance = Task.objects.create(**validated_data)
+            if tags:
+                Through.objects.bulk_create(
+                    [Through(task_id=instance.pk, tag_id=tag.pk) for tag in tags]
+                )
+        # レスポンスのtags・tag_namesは作成したタグから返す（Tag.Meta.orderingの順）
+        _cache_tags(instance, sorted(tags, key=attrgetter("name")))
+        return instance
+
+    def update(self, instance, validated_data):
+        self._resolve_tag_names(validated_data)
+        return super().update(instance, validated_data)
+
+    def to_representation(self, instance):
+        # tagsとtag_namesで1回のタグの読み込みを共有する
+        if {"tags", "tag_names"} & self.fields.keys():
+            prefetch_related_objects([instance], "tags")
+        return super().to_representation(instance)
+
+    def _resolve_tag_names(self, validated_data):
+        """
+        tag_namesをタグに置き換えてtagsに加える（存在しないタグは作成する）
+        tagsと同様に、指定した場合はタスクのタグ全体を置き換える
+        """
+        names = validated_data.pop("tag_names", None)
+        if names is None:
+            return
+        user = self.context["request"].user
+        tags = Tag.objects.get_or_create_names(user, names).values()
+        validated_data["tags"] = list(
+            dict.fromkeys([*validated_data.get("tags", []), *tags])
+        )
 
     def validate_name(self, value):
         """
@@ -144,6 +299,14 @@ class TaskSerializer(serializers.ModelSerializer):
                     {"parent": "孫タスクは子タスクを持てません（最大3階層まで）"}
                 )
 
+        # 既存タスクの移動は子孫タスクも含めて検証する
+        parent_id = parent.pk if parent else None
+        if self.instance and "parent" in data and parent_id != self.instance.parent_id:
+            try:
+                self.instance.check_move(parent)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.message_dict)
+
         # プロジェクトがユーザーに紐づいているかチェック
         if project:
             # projectは既にモデルインスタンスとして渡される（PrimaryKeyRelatedField）
@@ -153,3 +316,321 @@ class TaskSerializer(serializers.ModelSerializer):
                 )
 
         return data
+
+
+def _cache_tags(task, tags):
+    """タスクのタグをprefetch_related()で読み込んだ場合と同じようにキャッシュする"""
+    queryset = task.tags.all()
+    queryset._result_cache = list(tags)
+    queryset._prefetch_done = True
+    task._prefetched_objects_cache = {
+        **getattr(task, "_prefetched_objects_cache", {}),
+        "tags": queryset,
+    }
+
+
+def _primary_keys(values):
+    """入力値のうち主キーとして解釈できるものだけを返す（不正な値はフィールドで検証）"""
+    pks = []
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            pks.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return pks
+
+
+class TagApplySerializer(serializers.Serializer):
+    """
+    Payload of the bulk "apply tags to tasks" endpoint
+    """
+
+    tasks = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=5000
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, default=list
+    )
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False, default=list
+    )
+
+    def validate(self, data):
+        """
+        Validate that the tasks and tags belong to the user
+        """
+        user = self.context["request"].user
+        if not data["tags"] and not data["tag_names"]:
+            raise serializers.ValidationError("tagsかtag_namesを指定してください")
+
+        task_ids = set(data["tasks"])
+        found = Task.objects.filter(user=user, pk__in=task_ids).values_list(
+            "pk", flat=True
+        )
+        if task_ids - set(found):
+            raise serializers.ValidationError(
+                {"tasks": "選択されたタスクはこのユーザーに紐づいていません"}
+            )
+
+        tags = Tag.objects.filter(user=user, pk__in=data["tags"]).in_bulk()
+        if set(data["tags"]) - tags.keys():
+            raise serializers.ValidationError(
+                {"tags": "選択されたタグはこのユーザーに紐づいていません"}
+            )
+        data["tags"] = list(tags.values())
+        return data
+
+    def create(self, validated_data):
+        """タグ名を解決し（無いタグは作成）、全てのタスクにタグを追加する"""
+        user = self.context["request"].user
+        with transaction.atomic():
+            named = Tag.objects.get_or_create_names(user, validated_data["tag_names"])
+            tags = list(dict.fromkeys([*validated_data["tags"], *named.values()]))
+            tasks = Task.objects.filter(user=user, pk__in=validated_data["tasks"])
+            tasks.add_tags(tags)
+        return tags
+
+
+class TaskTreeQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the task tree endpoint
+    """
+
+    project = serializers.IntegerField(required=False, min_value=1)
+
+
+class TaskTreeItemSerializer(serializers.Serializer):
+    """
+    One task of a bulk task-tree payload (see api/task_trees.py)
+
+    Items with an id update that task; other items create a task under
+    their enclosing item, an existing task (parent) or another item of
+    the payload (parent_ref).
+    """
+
+    id = serializers.IntegerField(required=False, min_value=1)
+    ref = serializers.CharField(required=False, max_length=100)
+    parent = serializers.IntegerField(required=False, min_value=1)
+    parent_ref = serializers.CharField(required=False, max_length=100)
+    name = serializers.CharField(required=False, max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True)
+    project = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    estimate_minutes = serializers.IntegerField(
+        required=False, allow_null=True, min_value=0, max_value=2147483647
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False
+    )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # 子タスクは同じ形式の項目のリスト
+        fields["children"] = TaskTreeItemSerializer(many=True, required=False)
+        return fields
+
+    def validate(self, data):
+        """
+        Validate that new tasks have a name and a single kind of parent
+        """
+        if "id" not in data and "name" not in data:
+            raise serializers.ValidationError({"name": "This field is required."})
+        if "parent" in data and "parent_ref" in data:
+            raise serializers.ValidationError(
+                "parentとparent_refは同時に指定できません"
+            )
+        return data
+
+
+class TaskTreeSerializer(serializers.Serializer):
+    """
+    Payload of the bulk task-tree endpoint
+    """
+
+    tasks = TaskTreeItemSerializer(many=True, allow_empty=False)
+
+
+class TimeEntrySerializer(serializers.ModelSerializer):
+    """
+    Serializer for TimeEntry model
+    """
+
+    task_name = serializers.CharField(source="task.name", read_only=True)
+
+    class Meta:
+        model = TimeEntry
+        fields = [
+            "id",
+            "name",
+            "task",
+            "task_name",
+            "project",
+            "start_time",
+            "end_time",
+            "duration_seconds",
+            "created_at",
+        ]
+        read_only_fields = ["id", "duration_seconds", "created_at"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # リクエストコンテキストからユーザーを取得してquerysetをフィルタリング
+        request = self.context.get("request")
+        if request and hasattr(request, "user"):
+            user = request.user
+            self.fields["task"].queryset = Task.objects.filter(user=user)
+            self.fields["project"].queryset = Project.objects.filter(user=user)
+
+    def validate(self, data):
+        """
+        Validate that end_time is not before start_time and that the entry
+        does not overlap the user's other entries
+        """
+        start_time = data.get("start_time", getattr(self.instance, "start_time", None))
+        end_time = data.get("end_time", getattr(self.instance, "end_time", None))
+
+        if start_time and end_time and end_time < start_time:
+            raise serializers.ValidationError(
+                {"end_time": "終了時刻は開始時刻より後である必要があります"}
+            )
+
+        if not start_time:
+            return data
+
+        user = self.context["request"].user
+        others = TimeEntry.objects.filter(user=user)
+        if self.instance:
+            others = others.exclude(pk=self.instance.pk)
+
+        # 進行中のTime Entryはユーザーごとに1件のみ
+        if not end_time and others.filter(end_time__isnull=True).exists():
+            raise serializers.ValidationError(
+                {"end_time": "進行中のタイマーが既に存在します"}
+            )
+
+        # 同じユーザーの他のTime Entryと時間が重ならないこと
+        if others.overlapping(start_time, end_time).exists():
+            raise serializers.ValidationError(
+                {"start_time": "他のTime Entryと時間が重複しています"}
+            )
+
+        return data
+
+
+class TimerStartSerializer(TimeEntrySerializer):
+    """
+    Serializer for starting a timer (start_time is set by the server)
+    """
+
+    class Meta(TimeEntrySerializer.Meta):
+        read_only_fields = [
+            "id",
+            "start_time",
+            "end_time",
+            "duration_seconds",
+            "created_at",
+        ]
+
+    def validate(self, data):
+        return data
+
+
+class SyncTaskSerializer(TaskSerializer):
+    """
+    Task rows returned by /api/sync/
+
+    Names of related rows are left out: renaming a project, parent or tag
+    does not change the task, so they could not be kept up to date.
+    """
+
+    project_name = None
+    parent_name = None
+    tag_names = None
+
+    class Meta(TaskSerializer.Meta):
+        fields = [
+            name
+            for name in TaskSerializer.Meta.fields
+            if name not in ("project_name", "parent_name", "tag_names")
+        ]
+
+
+class SyncTimeEntrySerializer(TimeEntrySerializer):
+    """
+    Time entry rows returned by /api/sync/ (without the task name)
+    """
+
+    task_name = None
+
+    class Meta(TimeEntrySerializer.Meta):
+        fields = [
+            name for name in TimeEntrySerializer.Meta.fields if name != "task_name"
+        ]
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the sync endpoint
+    """
+
+    since = serializers.IntegerField(min_value=0, default=0)
+
+
+class UserDetailsSerializer(BaseUserDetailsSerializer):
+    """
+    Serializer for the authenticated user, including the report timezone
+    """
+
+    class Meta(BaseUserDetailsSerializer.Meta):
+        fields = (*BaseUserDetailsSerializer.Meta.fields, "timezone")
+
+
+class ReportSummaryQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the summary report
+    """
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    bucket = serializers.ChoiceField(choices=list(BUCKETS), default="day")
+    group_by = serializers.ChoiceField(choices=list(GROUPS), required=False)
+
+    def validate(self, data):
+        """
+        Validate that end is not before start
+        """
+        if data["end"] < data["start"]:
+            raise serializers.ValidationError("end must be on or after start.")
+        return data
+
+
+class ReportTimelineQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the timeline report
+    """
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    bucket = serializers.ChoiceField(choices=list(TIMELINE_BUCKETS), default="day")
+
+    def validate(self, data):
+        """
+        Validate the range and limit its length for the bucket size
+        """
+        if data["end"] < data["start"]:
+            raise serializers.ValidationError("end must be on or after start.")
+        max_days = TIMELINE_BUCKETS[data["bucket"]]
+        if (data["end"] - data["start"]).days >= max_days:
+            raise serializers.ValidationError(
+                f"The range can be at most {max_days} days for bucket={data['bucket']}."
+            )
+        return data
+
+
+class ReportHeatmapQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the heatmap report
+    """
+
+    year = serializers.IntegerField(min_value=1970, max_value=9998)
@@ -0,0 +1,372 @@
+"""
+Reading and bulk writing of task trees
+
+A payload of tasks, nested with "children" or flat with temporary "ref"
+ids referenced by "parent_ref", is resolved in memory: the level, root
+and project of new tasks are derived from their parents as Task.save()
+would, and the projects, tags and existing tasks it refers to are checked
+with one IN query each. Everything is then written in one transaction
+with one bulk_create per level, one bulk_update and one insert of the
+tag rows, instead of a validated save() per task. Existing tasks keep
+their parent: moving a task would move its whole subtree, which this
+endpoint does not do, so such items are rejected.
+
+Trees are read the other way round: every task of the trees is fetched
+with one query on root/level (and their tags with one more), ordered by
+level so that each parent is seen before its children, and nested into
+plain dicts in a single pass without per-node serializers.
+"""
+
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Project, Tag, Task, User, bump_data_version
+
+# 1回のリクエストで作成・更新できるタスク数
+MAX_TASKS = 1000
+
+# ツリーのノードに含めるカラムと出力するキー（TaskSerializerと同じ名前）
+TREE_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+    "project_id": "project",
+    "parent_id": "parent",
+    "root_id": "root",
+    "level": "level",
+    "estimate_minutes": "estimate_minutes",
+    "duration_seconds": "duration_seconds",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+# 既存タスクの更新で変更できるフィールド
+UPDATE_FIELDS = ("name", "description", "project", "estimate_minutes")
+
+
+def build_tree(tasks):
+    """
+    タスクのクエリセットをネストした辞書のリストにする
+    親がクエリセットに含まれないタスクが最上位になる
+
+    タスクは1クエリ、タグは同じ条件のサブクエリで1クエリで読み込み、
+    レベル順に1回走査して子を親のchildrenに追加する（O(n)）
+    """
+    datetime_field = serializers.DateTimeField()
+    rows = tasks.order_by("level", "-created_at", "-id").values_list(*TREE_COLUMNS)
+
+    nodes, roots = {}, []
+    for row in rows:
+        node = dict(zip(TREE_COLUMNS.values(), row))
+        node["created_at"] = datetime_field.to_representation(node["created_at"])
+        node["updated_at"] = datetime_field.to_representation(node["updated_at"])
+        node.update(tags=[], tag_names=[], children=[])
+        nodes[node["id"]] = node
+        parent = nodes.get(node["parent"])
+        (parent["children"] if parent else roots).append(node)
+
+    if nodes:
+        tags = (
+            Task.tags.through.objects.filter(task__in=tasks.values("pk"))
+            .order_by("tag__name", "tag_id")
+            .values_list("task_id", "tag_id", "tag__name")
+        )
+        for task_id, tag_id, tag_name in tags:
+            node = nodes[task_id]
+            node["tags"].append(tag_id)
+            node["tag_names"].append(tag_name)
+    return roots
+
+
+class TaskTreeError(ValueError):
+    """Invalid bulk task-tree payload ({path: message} or a message)"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+@dataclass(eq=False)
+class _Node:
+    path: str
+    data: dict
+    parent: "_Node | None" = None
+    task: Task | None = None
+    level: int | None = None
+    project_id: int | None = None
+
+    @property
+    def is_update(self):
+        return "id" in self.data
+
+
+class TaskTreeWriter:
+    """
+    Create and update a tree of tasks of a single user in bulk
+
+    Each item is a dict validated by TaskTreeItemSerializer: new tasks have
+    a name and optionally a "ref", and are placed under their enclosing
+    item, an existing task ("parent") or another item ("parent_ref").
+    Items with an "id" update that task and may have new children.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.errors = {}
+        # 保存後の {ref: 作成したタスクのID} と作成した件数
+        self.refs = {}
+        self.created = 0
+
+    def save(self, items):
+        """
+        ペイロードを検証して書き込み、入力順（深さ優先）のタスクのリストを返す
+        不正な場合はTaskTreeErrorを送出し、何も書き込まない
+        """
+        nodes = self._flatten(items)
+        if len(nodes) > MAX_TASKS:
+            raise TaskTreeError(f"一度に作成・更新できるタスクは{MAX_TASKS}件までです")
+        self._link(nodes)
+        self._load(nodes)
+        for node in nodes:
+            self._resolve(node, set())
+        if self.errors:
+            raise TaskTreeError(self.errors)
+
+        with transaction.atomic():
+            self._write(nodes)
+        for node in nodes:
+            if "ref" in node.data:
+                self.refs[node.data["ref"]] = node.task.pk
+        self.created = sum(1 for node in nodes if not node.is_update)
+        return [node.task for node in nodes]
+
+    def _error(self, node, message):
+        self.errors.setdefault(node.path, message)
+
+    def _flatten(self, items, parent=None, prefix=""):
+        """ネストされた項目を深さ優先の順に並べる"""
+        nodes = []
+        for i, data in enumerate(items):
+            node = _Node(path=f"{prefix}{i}", data=data, parent=parent)
+            nodes.append(node)
+            children = data.get("children", [])
+            nodes += self._flatten(children, node, f"{node.path}.children.")
+        return nodes
+
+    def _link(self, nodes):
+        """parent_refを項目どうしの親子関係に置き換える"""
+        refs = {}
+        for node in nodes:
+            ref = node.data.get("ref")
+            if ref is None:
+                continue
+            if ref in refs:
+                self._error(node, f"refが重複しています: {ref}")
+            refs[ref] = node
+
+        for node in nodes:
+            data = node.data
+            if node.parent is not None and ("parent" in data or "parent_ref" in data):
+                self._error(node, "子タスクにはparentとparent_refを指定できません")
+            elif node.is_update and ("parent" in data or "parent_ref" in data):
+                self._error(
+                    node, "既存タスクの親はこのエンドポイントでは変更できません"
+                )
+            elif "parent_ref" in data:
+                parent = refs.get(data["parent_ref"])
+                if parent is None:
+                    self._error(node, f"不明なparent_refです: {data['parent_ref']}")
+                else:
+                    node.parent = parent
+
+    def _load(self, nodes):
+        """参照されるタスク・プロジェクト・タグの所有者をINクエリでまとめて確認"""
+        task_ids, project_ids, tag_ids = set(), set(), set()
+        for node in nodes:
+            task_ids |= {node.data[key] for key in ("id", "parent") if key in node.data}
+            if node.data.get("project") is not None:
+                project_ids.add(node.data["project"])
+            tag_ids |= set(node.data.get("tags", ()))
+
+        tasks = {}
+        if task_ids:
+            tasks = Task.objects.filter(user=self.user, pk__in=task_ids).in_bulk()
+        projects = set()
+        if project_ids:
+            projects = set(
+                Project.objects.filter(user=self.user, pk__in=project_ids).values_list(
+                    "pk", flat=True
+                )
+            )
+        tags = set()
+        if tag_ids:
+            tags = set(
+                Tag.objects.filter(user=self.user, pk__in=tag_ids).values_list(
+                    "pk", flat=True
+                )
+            )
+
+        updated = {}
+        for node in nodes:
+            data = node.data
+            if node.is_update:
+                node.task = tasks.get(data["id"])
+                if node.task is None:
+                    self._error(node, "タスクが見つかりません")
+                elif data["id"] in updated:
+                    self._error(
+                        node, f"同じタスクが複数回指定されています: {data['id']}"
+                    )
+                else:
+                    updated[data["id"]] = node
+            if data.get("project") is not None and data["project"] not in projects:
+                self._error(
+                    node, "選択されたプロジェクトはこのユーザーに紐づいていません"
+                )
+            if not set(data.get("tags", ())) <= tags:
+                self._error(node, "選択されたタグはこのユーザーに紐づいていません")
+
+        # 既存タスクの下に作成する項目は、そのタスクの項目（更新する場合）か既存タスクを親にする
+        for node in nodes:
+            if "parent" not in node.data or node.parent is not None:
+                continue
+            parent_id = node.data["parent"]
+            if parent_id in updated:
+                node.parent = updated[parent_id]
+            elif parent_id in tasks:
+                node.parent = _Node(path="", data={}, task=tasks[parent_id])
+            else:
+                self._error(node, "選択された親タスクはこのユーザーに紐づいていません")
+
+    def _resolve(self, node, visiting):
+        """
+        levelとプロジェクトを親からメモリ上で求める（Task.save()と同じ規則）
+        parent_refの循環はここで検出する
+        """
+        if node.level is not None or node.path in self.errors:
+            return
+        if node in visiting:
+            self._error(node, "循環参照が検出されました")
+            return
+        data = node.data
+
+        if node.task is not None:
+            # 既存タスク（ルートのプロジェクトだけが変更できる）
+            node.level = node.task.level
+            node.project_id = node.task.project_id
+            if "project" in data:
+                if node.level == 0:
+                    node.project_id = data["project"]
+                elif data["project"] != node.project_id:
+                    self._error(
+                        node,
+                        "サブタスクのプロジェクトはルートタスクから自動的に設定されます",
+                    )
+            return
+
+        if node.parent is None:
+            node.level = 0
+            node.project_id = data.get("project")
+            return
+
+        visiting.add(node)
+        self._resolve(node.parent, visiting)
+        visiting.discard(node)
+        if node.parent.level is None:
+            # 親が不正な場合は子の判定を省略する
+            return
+
+        node.level = node.parent.level + 1
+        node.project_id = node.parent.project_id
+        if node.level > 2:
+            self._error(node, "孫タスクは子タスクを持てません（最大3階層まで）")
+        elif (
+            data.get("project") is not None
+            and node.project_id is not None
+            and data["project"] != node.project_id
+        ):
+            self._error(
+                node, "サブタスクのプロジェクトはルートタスクから自動的に設定されます"
+            )
+
+    def _write(self, nodes):
+        bump_data_version([self.user.pk])
+        version = User.objects.values_list("data_version", flat=True).get(
+            pk=self.user.pk
+        )
+        now = timezone.now()
+
+        updates = [node for node in nodes if node.is_update]
+        moved = self._update_tasks(updates, version, now)
+
+        # 親のIDが決まるようにレベルごとに作成する
+        created = [node for node in nodes if not node.is_update]
+        for level in range(3):
+            tasks = []
+            for node in created:
+                if node.level != level:
+                    continue
+                parent = node.parent.task if node.parent else None
+                node.task = Task(
+                    user=self.user,
+                    name=node.data["name"],
+                    description=node.data.get("description", ""),
+                    project_id=node.project_id,
+                    parent=parent,
+                    root_id=(parent.root_id or parent.pk) if parent else None,
+                    level=level,
+                    estimate_minutes=node.data.get("estimate_minutes"),
+                    sync_version=version,
+                )
+                tasks.append(node.task)
+            if tasks:
+                Task.objects.bulk_create(tasks)
+
+        # 更新したルートタスクのプロジェクトを子孫とTime Entryに伝播
+        for task in moved:
+            task._update_descendants_project()
+
+        self._set_tags([node for node in nodes if "tags" in node.data])
+
+    def _update_tasks(self, nodes, version, now):
+        """
+        既存タスクをbulk_updateで更新し、プロジェクトが変わったルートタスクを返す
+        """
+        fields, moved = {"updated_at", "sync_version"}, []
+        for node in nodes:
+            task = node.task
+            for name in UPDATE_FIELDS:
+                if name not in node.data:
+                    continue
+                if name == "project":
+                    if task.level == 0 and task.project_id != node.project_id:
+                        task.project_id = node.project_id
+                        moved.append(task)
+                        fields.add("project")
+                else:
+                    setattr(task, name, node.data[name])
+                    fields.add(name)
+            task.updated_at = now
+            task.sync_version = version
+        if nodes:
+            Task.objects.bulk_update([node.task for node in nodes], sorted(fields))
+        return moved
+
+    def _set_tags(self, nodes):
+        """tagsが指定された項目のタグを置き換える（INSERTは1回）"""
+        if not nodes:
+            return
+        Through = Task.tags.through
+        replaced = [node.task.pk for node in nodes if node.is_update]
+        if replaced:
+            Through.objects.filter(task_id__in=replaced).delete()
+        Through.objects.bulk_create(
+            [
+                Through(task_id=node.task.pk, tag_id=tag_id)
+                for node in nodes
+                for tag_id in dict.fromkeys(node.data["tags"])
+            ]
+        )
@@ -1,13 +1,19 @@
-from django.urls import path, include
+from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+
 from . import views
 
 router = DefaultRouter()
 router.register(r"projects", views.ProjectViewSet, basename="project")
 router.register(r"tags", views.TagViewSet, basename="tag")
 router.register(r"tasks", views.TaskViewSet, basename="task")
+router.register(r"time-entries", views.TimeEntryViewSet, basename="time-entry")
+router.register(r"timer", views.TimerViewSet, basename="timer")
+router.register(r"reports", views.ReportViewSet, basename="report")
+router.register(r"sync", views.SyncViewSet, basename="sync")
 
 urlpatterns = [
     path("health/", views.health, name="health"),
+    path("cache/stats/", views.response_cache_stats, name="response-cache-stats"),
     path("", include(router.urls)),
 ]
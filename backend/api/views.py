@@ -1,11 +1,50 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
-from rest_framework.response import Response
-from rest_framework import status, viewsets
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter
-from .models import Project, Tag, Task
-from .serializers import ProjectSerializer, TagSerializer, TaskSerializer
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+
+from . import reports, response_cache, sync
+from .compiled_serializers import CompiledListMixin, CompiledListSerializer
+from .conditional import ConditionalGetMixin
+from .exporters import CONTENT_TYPES, EXPORT_FORMATS, export_lines
+from .filters import TimeEntryFilter
+from .identity import IdentityMap
+from .importers import (
+    IMPORT_FORMATS,
+    ImportFileError,
+    TimeEntryImporter,
+    detect_format,
+    read_rows,
+)
+from .intervals import find_user_overlaps
+from .models import Project, Tag, Task, TimeEntry
+from .pagination import KeysetPagination
+from .response_cache import ResponseCacheMixin
+from .serializers import (
+    ProjectSerializer,
+    ReportHeatmapQuerySerializer,
+    ReportSummaryQuerySerializer,
+    ReportTimelineQuerySerializer,
+    SyncQuerySerializer,
+    SyncTaskSerializer,
+    SyncTimeEntrySerializer,
+    TagApplySerializer,
+    TagSerializer,
+    TaskSerializer,
+    TaskTreeQuerySerializer,
+    TaskTreeSerializer,
+    TimeEntrySerializer,
+    TimerStartSerializer,
+)
+from .task_trees import TaskTreeError, TaskTreeWriter, build_tree
 
 
 @api_view(["GET"])
@@ -14,6 +53,15 @@ def health(request):
     return Response({"status": "ok"}, status=status.HTTP_200_OK)
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """
+    Hit/miss counts of the per-user response cache (see api/response_cache.py)
+    """
+    return Response(response_cache.stats())
+
+
 @api_view(["GET"])
 def unauthorized_test(request):
     """
@@ -26,12 +74,15 @@ def unauthorized_test(request):
     )
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, CompiledListMixin, viewsets.ModelViewSet
+):
     """
     ViewSet for Project CRUD operations
     """
 
     serializer_class = ProjectSerializer
+    compiled_list_serializer = CompiledListSerializer(ProjectSerializer)
 
     def get_queryset(self):
         """
@@ -46,12 +97,15 @@ class ProjectViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, CompiledListMixin, viewsets.ModelViewSet
+):
     """
     ViewSet for Tag CRUD operations
     """
 
     serializer_class = TagSerializer
+    compiled_list_serializer = CompiledListSerializer(TagSerializer)
 
     def get_queryset(self):
         """
@@ -65,30 +119,521 @@ class TagViewSet(viewsets.ModelViewSet):
         """
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=["post"])
+    def apply(self, request):
+        """
+        Add tags to many tasks at once
+
+        Body: {"tasks": [ids], "tags": [ids], "tag_names": [names]}; tags
+        named in tag_names are created if missing. Existing tags of the
+        tasks are kept. Returns the task ids and the applied tags.
+        """
+        payload = TagApplySerializer(data=request.data, context={"request": request})
+        payload.is_valid(raise_exception=True)
+        tags = payload.save()
+        return Response(
+            {
+                "tasks": list(dict.fromkeys(payload.validated_data["tasks"])),
+                "tags": TagSerializer(tags, many=True).data,
+            }
+        )
+
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, CompiledListMixin, viewsets.ModelViewSet
+):
     """
     ViewSet for Task CRUD operations
     """
 
     serializer_class = TaskSerializer
+    compiled_list_serializer = CompiledListSerializer(
+        TaskSerializer, many_values={"tag_names": ("tags", "name")}
+    )
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["project", "parent", "tags"]
     ordering_fields = ["created_at", "name"]
     ordering = ["-created_at"]
 
-    def get_queryset(self):
+    # ?with= で指定できる追加アノテーションと対応するQuerySetメソッド
+    with_options = {
+        "live_duration": "with_live_duration",
+        "subtree_counts": "with_subtree_counts",
+    }
+
+    def get_with_options(self):
         """
-        Filter tasks by the current user with optimized queries
+        Parse the opt-in ?with= annotations (read actions only)
+        """
+        if self.action not in ("list", "retrieve"):
+            return []
+        raw = self.request.query_params.get("with", "")
+        options = [option for option in raw.split(",") if option]
+        unknown = [option for option in options if option not in self.with_options]
+        if unknown:
+            raise ValidationError({"with": f"Unknown option(s): {', '.join(unknown)}"})
+        return list(dict.fromkeys(options))
+
+    @property
+    def paginator(self):
+        """
+        Page-number pagination by default; ?pagination=cursor opts in to
+        keyset pagination on (created_at, id) or (name, id) without COUNT
+        """
+        mode = self.request.query_params.get("pagination", "page")
+        if mode not in ("page", "cursor"):
+            raise ValidationError({"pagination": "Must be 'page' or 'cursor'"})
+        if mode == "cursor" and not hasattr(self, "_paginator"):
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def use_compiled_list(self):
+        """
+        ?with= annotations and sparse fieldsets use the ModelSerializer
         """
         return (
-            Task.objects.filter(user=self.request.user)
-            .select_related("project", "parent", "root")
-            .prefetch_related("tags")
+            super().use_compiled_list()
+            and not self.get_with_options()
+            and self.get_selected_fields() is None
+        )
+
+    def is_conditional(self):
+        """
+        live_duration depends on the current time, so it never gets an ETag
+        """
+        return super().is_conditional() and "live_duration" not in (
+            self.get_with_options()
+        )
+
+    def is_cacheable(self):
+        """
+        live_duration depends on the current time, so it is never cached
+        """
+        return super().is_cacheable() and "live_duration" not in (
+            self.get_with_options()
         )
 
+    def get_selected_fields(self):
+        """
+        Parse the sparse fieldset ?fields= / ?omit= (read actions only)
+        Returns None when every field is requested
+        """
+        if self.action not in ("list", "retrieve"):
+            return None
+        params = self.request.query_params
+        fields = [name for name in params.get("fields", "").split(",") if name]
+        omit = [name for name in params.get("omit", "").split(",") if name]
+        if not fields and not omit:
+            return None
+
+        available = TaskSerializer.get_available_fields(self.get_with_options())
+        for param, names in (("fields", fields), ("omit", omit)):
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError(
+                    {param: f"Unknown field(s): {', '.join(unknown)}"}
+                )
+        return [
+            name
+            for name in available
+            if (not fields or name in fields) and name not in omit
+        ]
+
+    def get_queryset(self):
+        """
+        Filter tasks by the current user with optimized queries
+        Joins, prefetches and columns follow the requested sparse fieldset
+        """
+        queryset = Task.objects.filter(user=self.request.user)
+        selected = self.get_selected_fields()
+        if selected is None:
+            queryset = queryset.select_related(
+                "project", "parent", "root"
+            ).prefetch_related("tags")
+        else:
+            # 並び替え・キーセットページネーションに使うカラムは常に読み込む
+            queryset = TaskSerializer.restrict_queryset(
+                queryset, selected, extra=self.ordering_fields
+            )
+        for option in self.get_with_options():
+            queryset = getattr(queryset, self.with_options[option])()
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["with"] = self.get_with_options()
+        context["fields"] = self.get_selected_fields()
+        # 書き込みで参照される行はリクエスト内で1回だけ読み込む
+        if not hasattr(self, "_identity_map"):
+            self._identity_map = IdentityMap(self.request.user)
+        context["identity_map"] = self._identity_map
+        return context
+
     def perform_create(self, serializer):
         """
         Automatically set the user when creating a task
         """
         serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """
+        The user's tasks as nested parent / child / grandchild trees
+
+        Query params: project (only the trees of that project)
+        """
+        query = TaskTreeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        tasks = Task.objects.filter(user=request.user)
+        if "project" in query.validated_data:
+            # 子孫のプロジェクトはルートと同じなのでツリー単位で絞り込まれる
+            tasks = tasks.filter(project=query.validated_data["project"])
+        return Response(build_tree(tasks))
+
+    @action(detail=True, methods=["get"])
+    def subtree(self, request, pk=None):
+        """
+        A task with its children and grandchildren nested
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise NotFound()
+        # ルートならroot、子タスクならparentで子孫が決まる（レベルを知らずに1クエリ）
+        tasks = Task.objects.filter(user=request.user).filter(
+            Q(pk=pk) | Q(root=pk) | Q(parent=pk)
+        )
+        roots = build_tree(tasks)
+        if not roots or roots[0]["id"] != pk:
+            raise NotFound()
+        return Response(roots[0])
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Create and update a tree of tasks in one transaction
+
+        Body: {"tasks": [...]} with nested "children" or flat items linked
+        by a temporary "ref" and "parent_ref" (see api/task_trees.py).
+        Returns the tasks in payload order and the ids of the refs.
+        """
+        payload = TaskTreeSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        writer = TaskTreeWriter(request.user)
+        try:
+            tasks = writer.save(payload.validated_data["tasks"])
+        except TaskTreeError as e:
+            raise ValidationError({"tasks": e.errors})
+
+        # レスポンス用に関連オブジェクトとタグをまとめて読み込む
+        pks = [task.pk for task in tasks]
+        loaded = self.get_queryset().in_bulk(pks)
+        serializer = self.get_serializer([loaded[pk] for pk in pks], many=True)
+        return Response(
+            {"tasks": serializer.data, "refs": writer.refs},
+            status=status.HTTP_201_CREATED if writer.created else status.HTTP_200_OK,
+        )
+
+
+class TimeEntryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for TimeEntry CRUD operations
+
+    Lists use keyset pagination on (start_time, id) so that deep pages
+    cost the same as the first one.
+    """
+
+    serializer_class = TimeEntrySerializer
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = TimeEntryFilter
+    ordering_fields = ["start_time"]
+    ordering = ["-start_time"]
+
+    def get_queryset(self):
+        """
+        Filter time entries by the current user
+        """
+        return TimeEntry.objects.filter(user=self.request.user).select_related("task")
+
+    def perform_create(self, serializer):
+        """
+        Automatically set the user when creating a time entry
+        """
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream all matching time entries as CSV or NDJSON (?output=csv|ndjson)
+
+        Accepts the same filters as the list endpoint and is not paginated.
+        Timestamps are written in the user's timezone.
+        """
+        file_format = request.query_params.get("output", "csv")
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({"output": f"Unsupported format: {file_format}"})
+
+        queryset = self.filter_queryset(TimeEntry.objects.filter(user=request.user))
+        response = StreamingHttpResponse(
+            export_lines(queryset, file_format, tz=request.user.get_timezone()),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="time-entries.{file_format}"'
+        )
+        return response
+
+    @action(detail=False, methods=["get"])
+    def overlaps(self, request):
+        """
+        List every pair of the user's time entries whose times overlap
+
+        New overlaps are rejected by the database; this audits entries
+        recorded before the constraint existed. Runs a single sweep over
+        the entries in start_time order (O(n log n)).
+        """
+        results = [
+            {
+                "entries": [first, second],
+                "start_time": start_time,
+                "end_time": end_time,
+            }
+            for first, second, start_time, end_time in find_user_overlaps(request.user)
+        ]
+        return Response({"count": len(results), "results": results})
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+    )
+    def import_entries(self, request):
+        """
+        Bulk import completed time entries from an uploaded CSV/NDJSON file
+
+        Rows are inserted in batches and task durations are recomputed once
+        at the end. Invalid rows are skipped and reported by line number.
+        An unreadable file (invalid UTF-8 or CSV) stops the import with 400,
+        reporting the line and what was imported before it.
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "ファイルを指定してください"})
+
+        file_format = request.data.get("file_format") or detect_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError({"file_format": f"Unsupported format: {file_format}"})
+
+        try:
+            skip_lines = int(request.data.get("skip_lines") or 0)
+        except ValueError:
+            raise ValidationError({"skip_lines": "整数を指定してください"})
+
+        try:
+            result = TimeEntryImporter(request.user).run(
+                read_rows(upload.file, file_format), skip_lines=skip_lines
+            )
+        except ImportFileError as e:
+            # それまでの行は取り込み済み（last_line から再開できる）
+            return Response(
+                {"detail": e.message, "line": e.line, **e.result.as_dict()},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class TimerViewSet(viewsets.ViewSet):
+    """
+    Active timer (the user's running TimeEntry)
+
+    The running entry is looked up through the partial unique index on
+    TimeEntry(user) WHERE end_time IS NULL, so each action is a single
+    index probe plus a fixed number of writes.
+    """
+
+    def get_running_entry(self, for_update=False):
+        queryset = TimeEntry.objects.filter(
+            user=self.request.user, end_time__isnull=True
+        ).select_related("task", "user")
+        if for_update:
+            queryset = queryset.select_for_update(of=("self",))
+        return queryset.first()
+
+    def conflict_response(self, error):
+        """
+        409 for a start that violates a constraint: the new running entry
+        either is a second running entry or overlaps a finished entry that
+        ends in the future
+
+        A second running entry also overlaps the first one, and which
+        constraint reports it first differs by backend (the SQLite trigger
+        always fires before the unique index), so the running entry is
+        looked up instead of trusting the constraint name.
+        """
+        if (
+            TimeEntry.NO_OVERLAP_CONSTRAINT in str(error)
+            and self.get_running_entry() is None
+        ):
+            detail = "他のTime Entryと時間が重複しています"
+        else:
+            detail = "進行中のタイマーが既に存在します"
+        return Response({"detail": detail}, status=status.HTTP_409_CONFLICT)
+
+    def list(self, request):
+        """
+        Return the running timer, or 204 when no timer is running
+        """
+        entry = self.get_running_entry()
+        if entry is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(TimeEntrySerializer(entry).data)
+
+    @action(detail=False, methods=["post"])
+    def start(self, request):
+        """
+        Start a new timer (409 when a timer is already running)
+        """
+        serializer = TimerStartSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                entry = serializer.save(user=request.user, start_time=timezone.now())
+        except IntegrityError as e:
+            return self.conflict_response(e)
+        return Response(TimeEntrySerializer(entry).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def stop(self, request):
+        """
+        Stop the running timer (404 when no timer is running)
+        """
+        with transaction.atomic():
+            entry = self.get_running_entry(for_update=True)
+            if entry is None:
+                return Response(
+                    {"detail": "進行中のタイマーがありません"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            entry.end_time = timezone.now()
+            entry.save()
+        return Response(TimeEntrySerializer(entry).data)
+
+    @action(detail=False, methods=["post"])
+    def switch(self, request):
+        """
+        Stop the running timer (if any) and start a new one at the same instant
+
+        Both writes share one data_version bump: the stop bumps it and the
+        new entry is stamped with the same version, since the bump keeps
+        the user's row locked until the commit.
+        """
+        serializer = TimerStartSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                stopped = self.get_running_entry(for_update=True)
+                if stopped is not None:
+                    stopped.end_time = now
+                    stopped.save()
+                started = TimeEntry(
+                    user=request.user, start_time=now, **serializer.validated_data
+                )
+                started.save(force_insert=True, bump=stopped is None)
+        except IntegrityError as e:
+            return self.conflict_response(e)
+        return Response(
+            {
+                "stopped": TimeEntrySerializer(stopped).data if stopped else None,
+                "started": TimeEntrySerializer(started).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class ReportViewSet(viewsets.ViewSet):
+    """
+    Reports in the user's timezone (see api/reports.py)
+    """
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """
+        Totals per day, ISO week or month, optionally grouped by
+        project, task or tag
+
+        Query params: start, end (YYYY-MM-DD, inclusive),
+        bucket=day|week|month, group_by=project|task|tag
+        """
+        serializer = ReportSummaryQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(reports.summarize(request.user, **serializer.validated_data))
+
+    @action(detail=False, methods=["get"])
+    def timeline(self, request):
+        """
+        Tracked and active (overlap-free) seconds per hour or day, with a
+        per-project breakdown
+
+        Query params: start, end (YYYY-MM-DD, inclusive), bucket=hour|day
+        """
+        serializer = ReportTimelineQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(reports.timeline(request.user, **serializer.validated_data))
+
+    @action(detail=False, methods=["get"])
+    def heatmap(self, request):
+        """
+        Daily totals for a year and an hour-of-week histogram
+
+        Query params: year
+        """
+        serializer = ReportHeatmapQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(reports.heatmap(request.user, **serializer.validated_data))
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Changes of the user's data since a sync token (see api/sync.py)
+    """
+
+    serializers = {
+        "projects": ProjectSerializer,
+        "tags": TagSerializer,
+        "tasks": SyncTaskSerializer,
+        "time_entries": SyncTimeEntrySerializer,
+    }
+
+    def list(self, request):
+        """
+        Rows upserted and IDs deleted since the token, and the new token
+
+        Query params: since (a token from a previous response; omit or 0
+        for a full snapshot without deletions)
+        """
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data["since"]
+
+        token = sync.current_token(request.user)
+        if since > token:
+            raise ValidationError(
+                {"since": "不明な同期トークンです。全件を取得し直してください"}
+            )
+
+        data = {"token": token, "full": since == 0}
+        context = self.get_serializer_context()
+        for key, (rows, deleted) in sync.changes_since(request.user, since).items():
+            serializer = self.serializers[key](rows, many=True, context=context)
+            data[key] = {"upserted": serializer.data, "deleted": deleted}
+        return Response(data)
+
+    def get_serializer_context(self):
+        return {"request": self.request, "format": self.format_kwarg, "view": self}
@@ -155,6 +155,27 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # APIのレスポンスのキャッシュ（api/response_cache.py）
+    # 複数のプロセスで共有する場合はRedisなどのバックエンドを指定する
+    "api_responses": {
+        "BACKEND": os.getenv(
+            "API_RESPONSE_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("API_RESPONSE_CACHE_LOCATION", "api-responses"),
+        "TIMEOUT": int(os.getenv("API_RESPONSE_CACHE_TIMEOUT", "300")),
+    },
+}
+
+API_RESPONSE_CACHE = "api_responses"
+
 # Django REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
@@ -167,6 +188,11 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 100,
 }
 
+# dj-rest-auth: /api/auth/user/ でタイムゾーンを参照・変更できるようにする
+REST_AUTH = {
+    "USER_DETAILS_SERIALIZER": "api.serializers.UserDetailsSerializer",
+}
+
 # CORS: Development friendly
 CORS_ALLOW_ALL_ORIGINS = True
 
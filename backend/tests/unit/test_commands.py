@@ -0,0 +1,299 @@
+"""
+管理コマンドのテスト
+"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from api.models import DailyRollup, Task, TaskQuerySet, TimeEntry
+
+User = get_user_model()
+
+
+class ImportTimeEntriesCommandTestCase(TestCase):
+    """import_time_entries コマンドのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+
+    def _write(self, content, suffix):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_in_batches_with_progress(self):
+        """バッチごとに進捗が出力され、durationが再計算されることを確認"""
+        rows = ["task,start_time,end_time"] + [
+            f"{self.child.pk},2025-02-{day:02d}T09:00:00,2025-02-{day:02d}T09:01:00"
+            for day in range(1, 11)
+        ]
+        path = self._write("\n".join(rows), ".csv")
+        out = StringIO()
+
+        call_command(
+            "import_time_entries", path, user="testuser", batch_size=4, stdout=out
+        )
+
+        output = out.getvalue()
+        self.assertIn("line 5: 4 created", output)
+        self.assertIn("line 11: 10 created", output)
+        self.assertEqual(TimeEntry.objects.count(), 10)
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.duration_seconds, 600)
+        # 日次集計もバッチごとに更新される
+        self.assertEqual(DailyRollup.objects.filter(task=self.child).count(), 10)
+        self.assertEqual(
+            set(DailyRollup.objects.values_list("duration_seconds", "entry_count")),
+            {(60, 1)},
+        )
+
+    def test_unreadable_line_stops_and_resumes(self):
+        """読み込めない行で中断しても取り込み済みの行の時間が再計算されることを確認"""
+        rows = ["task,start_time,end_time"] + [
+            f"{self.child.pk},2025-02-{day:02d}T09:00:00,2025-02-{day:02d}T09:01:00"
+            for day in range(1, 6)
+        ]
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "wb") as f:
+            f.write("\n".join(rows[:4]).encode() + b"\n\xff\n")
+            f.write("\n".join(rows[4:]).encode())
+        self.addCleanup(os.remove, path)
+
+        with self.assertRaisesMessage(CommandError, "line 5:") as context:
+            call_command(
+                "import_time_entries",
+                path,
+                user="testuser",
+                batch_size=2,
+                stdout=StringIO(),
+            )
+
+        self.assertIn("--skip-lines 4", str(context.exception))
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.duration_seconds, 180)
+
+        # 不正な行を直して続きから取り込む
+        with open(path, "rb") as f:
+            content = f.read()
+        fixed = f"{self.child.pk},2025-02-06T09:00:00,2025-02-06T09:01:00"
+        with open(path, "wb") as f:
+            f.write(content.replace(b"\xff", fixed.encode()))
+        call_command(
+            "import_time_entries",
+            path,
+            user="testuser",
+            skip_lines=4,
+            stdout=StringIO(),
+        )
+
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.duration_seconds, 360)
+
+
+class RebuildDailyRollupsCommandTestCase(TestCase):
+    """rebuild_daily_rollups コマンドのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとTime Entryを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        task = Task.objects.create(user=self.user, name="タスク")
+        start_time = timezone.make_aware(datetime(2025, 2, 1, 9, 0))
+        for day in range(3):
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time + timedelta(days=day),
+                end_time=start_time + timedelta(days=day, minutes=30),
+            )
+
+    def test_rebuild_backfills_rollups(self):
+        """集計行が削除されていても再構築されることを確認"""
+        DailyRollup.objects.all().delete()
+        out = StringIO()
+
+        call_command("rebuild_daily_rollups", user=["testuser"], stdout=out)
+
+        self.assertIn("testuser: 3 rollup rows", out.getvalue())
+        self.assertEqual(
+            sorted(DailyRollup.objects.values_list("duration_seconds", flat=True)),
+            [1800, 1800, 1800],
+        )
+
+    def test_unknown_user(self):
+        """存在しないユーザーはエラーになることを確認"""
+        with self.assertRaises(CommandError):
+            call_command("rebuild_daily_rollups", user=["nobody"], stdout=StringIO())
+
+
+class BenchIntervalsCommandTestCase(TestCase):
+    """bench_intervals コマンドのテスト"""
+
+    def test_results_match_reference(self):
+        """NumPy 実装と素朴な実装の結果が一致することを確認"""
+        out, err = StringIO(), StringIO()
+
+        call_command("bench_intervals", entries=200, stdout=out, stderr=err)
+
+        self.assertIn("daily bins", out.getvalue())
+        self.assertIn("hour of week", out.getvalue())
+        self.assertEqual(err.getvalue(), "")
+
+
+class AuditOverlapsCommandTestCase(TestCase):
+    """audit_overlaps コマンドのテスト"""
+
+    def test_no_overlaps(self):
+        """重複がない場合の出力を確認"""
+        user = User.objects.create_user(username="testuser", password="pass")
+        start_time = timezone.make_aware(datetime(2025, 2, 1, 9, 0))
+        for i in range(3):
+            TimeEntry.objects.create(
+                user=user,
+                start_time=start_time + timedelta(hours=i),
+                end_time=start_time + timedelta(hours=i + 1),
+            )
+        out = StringIO()
+
+        call_command("audit_overlaps", user=["testuser"], stdout=out)
+
+        self.assertIn("0 overlapping pairs found", out.getvalue())
+
+
+class ReconcileDurationsCommandTestCase(TestCase):
+    """reconcile_durations コマンドのテスト"""
+
+    def setUp(self):
+        """ずれた duration_seconds を持つタスク階層を作成"""
+        self.user = User.objects.create_user(username="testuser", password="pass")
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        self.grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=self.child
+        )
+        start_time = timezone.make_aware(datetime(2025, 2, 1, 9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, task in enumerate((self.parent, self.child, self.grandchild)):
+                TimeEntry.objects.create(
+                    user=self.user,
+                    task=task,
+                    start_time=start_time + timedelta(hours=i),
+                    end_time=start_time + timedelta(hours=i, minutes=10),
+                )
+        # 一括UPDATEなどでキャッシュがずれた状態を再現
+        Task.objects.filter(pk=self.child.pk).update(duration_seconds=0)
+        Task.objects.filter(pk=self.parent.pk).update(duration_seconds=99)
+
+    def _durations(self):
+        return [
+            Task.objects.get(pk=task.pk).duration_seconds
+            for task in (self.parent, self.child, self.grandchild)
+        ]
+
+    def test_verify_reports_without_writing(self):
+        """--verify はずれを報告するだけで書き込まないことを確認"""
+        out = StringIO()
+
+        call_command("reconcile_durations", verify=True, stdout=out)
+
+        self.assertIn(
+            f"task {self.parent.pk}: stored 99, expected 1800", out.getvalue()
+        )
+        self.assertIn(f"task {self.child.pk}: stored 0, expected 1200", out.getvalue())
+        self.assertIn("2 tasks drifted", out.getvalue())
+        self.assertEqual(self._durations(), [99, 0, 600])
+
+    def test_reconcile_fixes_drift(self):
+        """ずれたタスクのみが修正されることを確認"""
+        out = StringIO()
+
+        # ユーザー一覧 + チャンクのタスクのロック・集計クエリ1回
+        # + 修正と data_version の UPDATE（SAVEPOINT/RELEASEで囲まれる）
+        with self.assertNumQueries(7):
+            call_command("reconcile_durations", stdout=out)
+
+        self.assertIn("2 tasks fixed", out.getvalue())
+        self.assertEqual(self._durations(), [1800, 1200, 600])
+
+        out = StringIO()
+        call_command("reconcile_durations", verify=True, stdout=out)
+        self.assertIn("0 tasks drifted", out.getvalue())
+
+    def test_reconcile_writes_expected_values(self):
+        """ずれの取得後に反映された再計算の上に差分を重ねないことを確認"""
+        duration_drift = TaskQuerySet.duration_drift
+
+        def drift_then_flush(queryset):
+            drift = duration_drift(queryset)
+            # ずれの取得後にコミット時の再計算が正しい値を書き込んだ状態を再現
+            Task.objects.filter(pk=self.parent.pk).update(duration_seconds=1800)
+            return drift
+
+        with mock.patch.object(
+            TaskQuerySet, "duration_drift", autospec=True, side_effect=drift_then_flush
+        ):
+            call_command("reconcile_durations", stdout=StringIO())
+
+        self.assertEqual(self._durations(), [1800, 1200, 600])
+
+
+class ReconcileDurationsWorkersTestCase(TransactionTestCase):
+    """reconcile_durations --workers のテスト（ワーカーはコミット済みのデータを読む）"""
+
+    def setUp(self):
+        """ずれた duration_seconds を持つタスクをユーザーごとに作成"""
+        start_time = timezone.make_aware(datetime(2025, 2, 1, 9, 0))
+        self.tasks = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"user{i}", password="pass")
+            parent = Task.objects.create(user=user, name="親タスク")
+            child = Task.objects.create(user=user, name="子タスク", parent=parent)
+            TimeEntry.objects.create(
+                user=user,
+                task=child,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=10 * (i + 1)),
+            )
+            self.tasks += [parent, child]
+        Task.objects.update(duration_seconds=0)
+
+    def test_reconcile_with_workers(self):
+        """ユーザーのチャンクを複数のワーカーで修正することを確認"""
+        out = StringIO()
+        executor = "api.management.commands.reconcile_durations.ProcessPoolExecutor"
+        if connection.vendor == "sqlite":
+            # メモリ上のテスト用DBは他のプロセスから見えず、共有キャッシュは
+            # 同時の書き込みでロックされるため、ワーカーを1スレッドで順に実行する
+            with mock.patch(executor, lambda max_workers: ThreadPoolExecutor(1)):
+                call_command("reconcile_durations", workers=2, chunk_size=1, stdout=out)
+        else:
+            call_command("reconcile_durations", workers=2, chunk_size=1, stdout=out)
+
+        self.assertIn("3 users checked, 6 tasks fixed", out.getvalue())
+        self.assertEqual(
+            [Task.objects.get(pk=task.pk).duration_seconds for task in self.tasks],
+            [600, 600, 1200, 1200, 1800, 1800],
+        )
@@ -0,0 +1,128 @@
+"""
+区間エンジン（api.intervals）のテスト
+
+NumPy による実装が素朴な Python 実装と同じ結果になることを確認します。
+"""
+
+import random
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from api import intervals
+
+
+class IntervalEngineTestCase(SimpleTestCase):
+    """ベクトル化した区間演算のテスト"""
+
+    def setUp(self):
+        """ランダムな（一部が重なる）区間を作成"""
+        self.tz = ZoneInfo("Asia/Tokyo")
+        self.day_edges = intervals.local_day_edges(
+            date(2026, 1, 1), date(2026, 1, 31), self.tz
+        )
+        rng = random.Random(0)
+        self.pairs = []
+        for _ in range(500):
+            start = rng.uniform(self.day_edges[0] - 86400, self.day_edges[-1])
+            self.pairs.append((start, start + rng.uniform(60, 6 * 3600)))
+        self.starts = np.array([pair[0] for pair in self.pairs])
+        self.ends = np.array([pair[1] for pair in self.pairs])
+
+    def test_bin_totals_matches_reference(self):
+        """バケット境界での分割が素朴な実装と一致することを確認"""
+        totals = intervals.bin_totals(self.starts, self.ends, self.day_edges)
+
+        np.testing.assert_allclose(
+            totals,
+            intervals.py_bin_totals(self.pairs, list(self.day_edges)),
+            atol=1e-6,
+        )
+
+    def test_bin_totals_clips_to_range(self):
+        """範囲外の部分がバケットに含まれないことを確認"""
+        edges = np.array([100.0, 200.0, 300.0])
+        starts = np.array([50.0, 150.0, 250.0])
+        ends = np.array([150.0, 350.0, 260.0])
+
+        totals = intervals.bin_totals(starts, ends, edges)
+
+        self.assertEqual(totals.tolist(), [100.0, 110.0])
+
+    def test_merge_matches_reference(self):
+        """重なる区間の結合が素朴な実装と一致することを確認"""
+        starts, ends = intervals.merge(self.starts, self.ends)
+
+        self.assertEqual(
+            list(zip(starts.tolist(), ends.tolist())),
+            intervals.py_merge(self.pairs),
+        )
+
+    def test_merge_empty(self):
+        """空の配列を結合できることを確認"""
+        starts, ends = intervals.merge(np.array([]), np.array([]))
+
+        self.assertEqual(len(starts), 0)
+        self.assertEqual(len(ends), 0)
+
+    def test_hour_of_week_matches_reference(self):
+        """曜日×時刻のヒストグラムが素朴な実装と一致することを確認"""
+        edges, labels = intervals.local_hour_edges(
+            date(2025, 12, 31), date(2026, 2, 1), self.tz
+        )
+
+        histogram = intervals.hour_of_week(self.starts, self.ends, edges, labels)
+
+        np.testing.assert_allclose(
+            histogram, intervals.py_hour_of_week(self.pairs, self.tz), atol=1e-6
+        )
+
+
+class FindOverlapsTestCase(SimpleTestCase):
+    """スイープラインによる重複検出のテスト"""
+
+    def _brute_force(self, rows):
+        pairs = set()
+        for i, (pk_a, start_a, end_a) in enumerate(rows):
+            for pk_b, start_b, end_b in rows[i + 1 :]:
+                end_a_key = end_a or intervals.OPEN_END
+                end_b_key = end_b or intervals.OPEN_END
+                if start_a >= end_a_key or start_b >= end_b_key:
+                    continue
+                if start_a < end_b_key and start_b < end_a_key:
+                    pairs.add((pk_a, pk_b))
+        return pairs
+
+    def test_matches_brute_force(self):
+        """全ての重複の組を O(n²) の総当たりと同じだけ検出することを確認"""
+        tz = ZoneInfo("Asia/Tokyo")
+        base = datetime(2026, 1, 1, tzinfo=tz)
+        rng = random.Random(1)
+        rows = []
+        for pk in range(300):
+            start = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 7))
+            length = rng.choice([0, 15, 30, 60, 240])
+            rows.append((pk, start, start + timedelta(minutes=length)))
+        rows.append((300, base + timedelta(days=6), None))
+        rows.sort(key=lambda row: (row[1], row[0]))
+
+        found = list(intervals.find_overlaps(rows))
+
+        self.assertEqual({(a, b) for a, b, _, _ in found}, self._brute_force(rows))
+        self.assertEqual(len(found), len({(a, b) for a, b, _, _ in found}))
+
+    def test_overlap_range(self):
+        """重なりの開始・終了と、隣接するエントリが重複にならないことを確認"""
+        base = datetime(2026, 1, 1, 9, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+        rows = [
+            (1, base, base + timedelta(hours=2)),
+            (2, base + timedelta(hours=1), base + timedelta(hours=3)),
+            (3, base + timedelta(hours=3), None),
+        ]
+
+        self.assertEqual(
+            list(intervals.find_overlaps(rows)),
+            [(1, 2, base + timedelta(hours=1), base + timedelta(hours=2))],
+        )
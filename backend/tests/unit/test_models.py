@@ -9,18 +9,38 @@ Phase 1 Backend 基本動作確認テスト
 5. データベース制約の確認
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from api.models import Project, Tag, Task, TimeEntry
+from api.models import DailyRollup, Project, Tag, Task, TimeEntry
 
 User = get_user_model()
 
 
+def time_entry_full_scans(sql):
+    """
+    SQLの実行計画でapi_timeentryを全件走査している箇所を返す
+    PostgreSQLではインデックスが使える場合に使われるよう順次走査を無効にする
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            plan = [row[0] for row in cursor.fetchall()]
+            return [line for line in plan if "Seq Scan on api_timeentry" in line]
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        plan = [row[-1] for row in cursor.fetchall()]
+        # SQLiteではテーブルの別名で表示されるため、全件走査（SCAN）の行を返す
+        return [line for line in plan if line.startswith("SCAN ")]
+
+
 class TaskHierarchyTestCase(TestCase):
     """タスク階層構造のテストケース"""
 
@@ -116,6 +136,53 @@ class TaskHierarchyTestCase(TestCase):
         self.assertEqual(child.project, new_project)
         self.assertEqual(grandchild.project, new_project)
 
+    def test_project_update_propagates_to_time_entries(self):
+        """ルートタスクのプロジェクト変更がツリー配下の TimeEntry に伝播することを確認"""
+        parent = Task.objects.create(
+            user=self.user, name="親タスク", project=self.project
+        )
+        child = Task.objects.create(user=self.user, name="子タスク", parent=parent)
+        grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=child
+        )
+        start_time = timezone.now()
+        entries = [
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time + timedelta(hours=i),
+                end_time=start_time + timedelta(hours=i, minutes=30),
+            )
+            for i, task in enumerate((parent, child, grandchild))
+        ]
+        new_project = Project.objects.create(
+            user=self.user, name="新プロジェクト", color="#00FF00"
+        )
+
+        parent = Task.objects.get(pk=parent.pk)
+        parent.project = new_project
+        # タスクの UPDATE + 子孫タスク・TimeEntry・日次集計の一括 UPDATE
+        # + data_version の UPDATE
+        with self.assertNumQueries(5):
+            parent.save()
+
+        for entry in entries:
+            entry.refresh_from_db()
+            self.assertEqual(entry.project, new_project)
+
+    def test_save_without_project_change_skips_propagation(self):
+        """プロジェクトが変わらない場合は子孫タスクを更新しないことを確認"""
+        parent = Task.objects.create(
+            user=self.user, name="親タスク", project=self.project
+        )
+        Task.objects.create(user=self.user, name="子タスク", parent=parent)
+
+        parent = Task.objects.get(pk=parent.pk)
+        parent.name = "親タスク（改名）"
+        # タスクの UPDATE + data_version の UPDATE
+        with self.assertNumQueries(2):
+            parent.save()
+
     def test_task_with_null_project(self):
         """プロジェクトが null のタスクを作成できることを確認"""
         task = Task.objects.create(user=self.user, name="Inbox タスク", project=None)
@@ -172,6 +239,23 @@ class TaskHierarchyValidationTestCase(TestCase):
 
         self.assertIn("孫タスクは子タスクを持てません", str(context.exception))
 
+    def test_cannot_move_subtree_below_grandchild_level(self):
+        """孫タスクを持つタスクを他のタスクの下に移動できないことを確認"""
+        parent = Task.objects.create(
+            user=self.user, name="親タスク", project=self.project
+        )
+        child = Task.objects.create(user=self.user, name="子タスク", parent=parent)
+        Task.objects.create(user=self.user, name="孫タスク", parent=child)
+        other = Task.objects.create(user=self.user, name="別の親タスク")
+
+        parent.parent = other
+        with self.assertRaises(ValidationError) as context:
+            parent.save()
+
+        self.assertIn("parent", context.exception.message_dict)
+        child.refresh_from_db()
+        self.assertEqual((child.level, child.root), (1, parent))
+
 
 class TaskCascadeDeleteTestCase(TestCase):
     """タスクのカスケード削除テスト"""
@@ -402,11 +486,12 @@ class TaskDurationTrackingTestCase(TestCase):
         start_time = timezone.now()
         end_time = start_time + timedelta(hours=1)
 
-        TimeEntry.objects.create(
-            user=self.user, task=task, start_time=start_time, end_time=end_time
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.create(
+                user=self.user, task=task, start_time=start_time, end_time=end_time
+            )
 
-        # TimeEntry 保存時に task.duration_seconds が更新される
+        # TimeEntry 保存時（コミット時）に task.duration_seconds が更新される
         task.refresh_from_db()
         self.assertEqual(task.duration_seconds, 3600)
 
@@ -418,21 +503,22 @@ class TaskDurationTrackingTestCase(TestCase):
 
         start_time = timezone.now()
 
-        # 1時間のエントリ
-        TimeEntry.objects.create(
-            user=self.user,
-            task=task,
-            start_time=start_time,
-            end_time=start_time + timedelta(hours=1),
-        )
-
-        # 30分のエントリ
-        TimeEntry.objects.create(
-            user=self.user,
-            task=task,
-            start_time=start_time + timedelta(hours=2),
-            end_time=start_time + timedelta(hours=2, minutes=30),
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            # 1時間のエントリ
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+
+            # 30分のエントリ
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time + timedelta(hours=2),
+                end_time=start_time + timedelta(hours=2, minutes=30),
+            )
 
         task.refresh_from_db()
         expected_seconds = 3600 + 1800  # 1時間 + 30分
@@ -446,18 +532,19 @@ class TaskDurationTrackingTestCase(TestCase):
 
         start_time = timezone.now()
 
-        # 完了したエントリ
-        TimeEntry.objects.create(
-            user=self.user,
-            task=task,
-            start_time=start_time,
-            end_time=start_time + timedelta(hours=1),
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            # 完了したエントリ
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
 
-        # 進行中のエントリ (end_time が null)
-        TimeEntry.objects.create(
-            user=self.user, task=task, start_time=start_time + timedelta(hours=2)
-        )
+            # 進行中のエントリ (end_time が null)
+            TimeEntry.objects.create(
+                user=self.user, task=task, start_time=start_time + timedelta(hours=2)
+            )
 
         task.refresh_from_db()
         # 完了した1時間のみがカウントされる
@@ -471,17 +558,20 @@ class TaskDurationTrackingTestCase(TestCase):
 
         start_time = timezone.now() - timedelta(hours=2)
 
-        # 完了したエントリ
-        TimeEntry.objects.create(
-            user=self.user,
-            task=task,
-            start_time=start_time,
-            end_time=start_time + timedelta(hours=1),
-        )
-
-        # 進行中のエントリ (1時間前に開始)
-        ongoing_start = timezone.now() - timedelta(hours=1)
-        TimeEntry.objects.create(user=self.user, task=task, start_time=ongoing_start)
+        with self.captureOnCommitCallbacks(execute=True):
+            # 完了したエントリ
+            TimeEntry.objects.create(
+                user=self.user,
+                task=task,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+
+            # 進行中のエントリ (1時間前に開始)
+            ongoing_start = timezone.now() - timedelta(hours=1)
+            TimeEntry.objects.create(
+                user=self.user, task=task, start_time=ongoing_start
+            )
 
         task.refresh_from_db()
         current_duration = task.get_current_duration_seconds()
@@ -500,21 +590,22 @@ class TaskDurationTrackingTestCase(TestCase):
 
         start_time = timezone.now()
 
-        # 親タスクに1時間
-        TimeEntry.objects.create(
-            user=self.user,
-            task=parent,
-            start_time=start_time,
-            end_time=start_time + timedelta(hours=1),
-        )
-
-        # 子タスクに30分
-        TimeEntry.objects.create(
-            user=self.user,
-            task=child,
-            start_time=start_time + timedelta(hours=2),
-            end_time=start_time + timedelta(hours=2, minutes=30),
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            # 親タスクに1時間
+            TimeEntry.objects.create(
+                user=self.user,
+                task=parent,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+
+            # 子タスクに30分
+            TimeEntry.objects.create(
+                user=self.user,
+                task=child,
+                start_time=start_time + timedelta(hours=2),
+                end_time=start_time + timedelta(hours=2, minutes=30),
+            )
 
         parent.refresh_from_db()
         child.refresh_from_db()
@@ -538,29 +629,30 @@ class TaskDurationTrackingTestCase(TestCase):
 
         start_time = timezone.now()
 
-        # 親タスクに1時間
-        TimeEntry.objects.create(
-            user=self.user,
-            task=parent,
-            start_time=start_time,
-            end_time=start_time + timedelta(hours=1),
-        )
-
-        # 子タスクに30分
-        TimeEntry.objects.create(
-            user=self.user,
-            task=child,
-            start_time=start_time + timedelta(hours=2),
-            end_time=start_time + timedelta(hours=2, minutes=30),
-        )
-
-        # 孫タスクに15分
-        TimeEntry.objects.create(
-            user=self.user,
-            task=grandchild,
-            start_time=start_time + timedelta(hours=3),
-            end_time=start_time + timedelta(hours=3, minutes=15),
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            # 親タスクに1時間
+            TimeEntry.objects.create(
+                user=self.user,
+                task=parent,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+
+            # 子タスクに30分
+            TimeEntry.objects.create(
+                user=self.user,
+                task=child,
+                start_time=start_time + timedelta(hours=2),
+                end_time=start_time + timedelta(hours=2, minutes=30),
+            )
+
+            # 孫タスクに15分
+            TimeEntry.objects.create(
+                user=self.user,
+                task=grandchild,
+                start_time=start_time + timedelta(hours=3),
+                end_time=start_time + timedelta(hours=3, minutes=15),
+            )
 
         parent.refresh_from_db()
         child.refresh_from_db()
@@ -600,3 +692,647 @@ class TaskDurationTrackingTestCase(TestCase):
         # 親タスクの先祖は []
         ancestors = parent.get_all_ancestors()
         self.assertEqual(len(ancestors), 0)
+
+
+class TaskDurationRollupTestCase(TestCase):
+    """TimeEntry 保存・削除時の duration_seconds 再計算のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        self.grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=self.child
+        )
+        self.start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+
+    def _durations(self):
+        return [
+            Task.objects.get(pk=task.pk).duration_seconds
+            for task in (self.parent, self.child, self.grandchild)
+        ]
+
+    def test_stop_timer_uses_fixed_number_of_queries(self):
+        """タイマー停止のクエリ数が履歴の件数に依存しないことを確認"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                TimeEntry.objects.create(
+                    user=self.user,
+                    task=self.grandchild,
+                    start_time=self.start_time + timedelta(minutes=i * 10),
+                    end_time=self.start_time + timedelta(minutes=i * 10 + 5),
+                )
+
+            entry = TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time + timedelta(hours=1),
+            )
+        # 他のユーザーの履歴
+        other = User.objects.create_user(username="other", password="pass")
+        other_task = Task.objects.create(user=other, name="他人のタスク")
+        TimeEntry.objects.bulk_create(
+            TimeEntry(
+                user=other,
+                task=other_task,
+                start_time=self.start_time + timedelta(hours=i),
+                end_time=self.start_time + timedelta(hours=i, minutes=30),
+                duration_seconds=1800,
+            )
+            for i in range(20)
+        )
+        entry = TimeEntry.objects.select_related("task", "user").get(pk=entry.pk)
+        entry.end_time = entry.start_time + timedelta(minutes=30)
+
+        # Time Entry・日次集計・data_version の UPDATE
+        # + コミット時の先祖タスクまでの再計算と data_version の UPDATE
+        with (
+            self.assertNumQueries(5),
+            CaptureQueriesContext(connection) as queries,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            entry.save()
+
+        self.assertEqual(self._durations(), [3300, 3300, 3300])
+        # 再計算はtask_idのインデックスで集計する（Time Entryを全件走査しない）
+        recompute = queries[-1]["sql"]
+        self.assertIn("duration_seconds", recompute)
+        self.assertEqual(time_entry_full_scans(recompute), [])
+
+    def test_edit_completed_entry_recomputes_tree(self):
+        """完了済みエントリの編集がタスク階層に反映されることを確認"""
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time,
+                end_time=self.start_time + timedelta(hours=1),
+            )
+
+            entry = TimeEntry.objects.get(pk=entry.pk)
+            entry.end_time = self.start_time + timedelta(minutes=30)
+            entry.save()
+
+        self.assertEqual(self._durations(), [1800, 1800, 1800])
+
+    def test_reassign_entry_moves_duration(self):
+        """エントリの付け替えで旧タスクから減算され新タスクに加算されることを確認"""
+        other = Task.objects.create(user=self.user, name="別タスク")
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time,
+                end_time=self.start_time + timedelta(hours=1),
+            )
+
+            entry = TimeEntry.objects.get(pk=entry.pk)
+            entry.task = other
+            entry.save()
+
+        other.refresh_from_db()
+        self.assertEqual(self._durations(), [0, 0, 0])
+        self.assertEqual(other.duration_seconds, 3600)
+
+    def test_delete_entry_removes_duration(self):
+        """完了済みエントリの削除でタスク階層から減算されることを確認"""
+        with self.captureOnCommitCallbacks(execute=True):
+            first = TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time,
+                end_time=self.start_time + timedelta(hours=1),
+            )
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.child,
+                start_time=self.start_time + timedelta(hours=2),
+                end_time=self.start_time + timedelta(hours=2, minutes=30),
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.get(pk=first.pk).delete()
+
+        self.assertEqual(self._durations(), [1800, 1800, 0])
+
+    def test_delete_task_recomputes_remaining_tree(self):
+        """子タスクの削除で残ったツリーの duration_seconds が再計算されることを確認"""
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time,
+                end_time=self.start_time + timedelta(hours=1),
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.child.delete()
+
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.duration_seconds, 0)
+
+    def test_delete_grandchild_recomputes_ancestors(self):
+        """孫タスクの削除で親タスクとルートタスクが再計算されることを確認"""
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=self.start_time,
+                end_time=self.start_time + timedelta(hours=1),
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grandchild.delete()
+
+        self.parent.refresh_from_db()
+        self.child.refresh_from_db()
+        self.assertEqual(
+            (self.parent.duration_seconds, self.child.duration_seconds), (0, 0)
+        )
+
+    def test_changes_in_transaction_are_flushed_once(self):
+        """同じトランザクション内の変更がツリーごとに1回だけ再計算されることを確認"""
+        other = Task.objects.create(user=self.user, name="別タスク")
+
+        with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+            for i, task in enumerate([self.grandchild, self.child, other] * 5):
+                TimeEntry.objects.create(
+                    user=self.user,
+                    task=task,
+                    start_time=self.start_time + timedelta(minutes=i * 10),
+                    end_time=self.start_time + timedelta(minutes=i * 10 + 5),
+                )
+
+        # コミットまでは再計算されない
+        self.assertEqual(self._durations(), [0, 0, 0])
+        self.assertEqual(len(callbacks), 1)
+
+        # 2つのツリーをまとめて UPDATE 1文で再計算し、data_version を進める
+        with self.assertNumQueries(2):
+            callbacks[0]()
+
+        other.refresh_from_db()
+        self.assertEqual(self._durations(), [3000, 3000, 1500])
+        self.assertEqual(other.duration_seconds, 1500)
+
+    def test_rolled_back_changes_are_rescheduled(self):
+        """ロールバックされたセーブポイント内の変更後も再計算が登録されることを確認"""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    TimeEntry.objects.create(
+                        user=self.user,
+                        task=self.grandchild,
+                        start_time=self.start_time,
+                        end_time=self.start_time + timedelta(hours=1),
+                    )
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.child,
+                start_time=self.start_time + timedelta(hours=2),
+                end_time=self.start_time + timedelta(hours=2, minutes=30),
+            )
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self._durations(), [1800, 1800, 0])
+
+    def test_recompute_durations_fallback(self):
+        """recompute_durations がサブツリーの合計から再計算することを確認"""
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.parent,
+            start_time=self.start_time,
+            end_time=self.start_time + timedelta(hours=1),
+        )
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.grandchild,
+            start_time=self.start_time + timedelta(hours=2),
+            end_time=self.start_time + timedelta(hours=2, minutes=15),
+        )
+        Task.objects.filter(user=self.user).update(duration_seconds=0)
+
+        Task.objects.filter(user=self.user).recompute_durations()
+
+        self.assertEqual(self._durations(), [4500, 900, 900])
+
+
+class TaskTreeLookupTestCase(TestCase):
+    """root/level を使ったサブツリー・先祖タスク取得のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.children = [
+            Task.objects.create(user=self.user, name=f"子タスク{i}", parent=self.parent)
+            for i in range(3)
+        ]
+        self.grandchildren = [
+            Task.objects.create(user=self.user, name=f"孫タスク{i}", parent=child)
+            for i, child in enumerate(self.children)
+        ]
+
+    def test_get_all_descendants_single_query(self):
+        """子孫タスクが1クエリで取得されることを確認"""
+        with self.assertNumQueries(1):
+            descendants = self.parent.get_all_descendants()
+
+        self.assertEqual(
+            {task.pk for task in descendants},
+            {task.pk for task in self.children + self.grandchildren},
+        )
+        self.assertEqual(
+            self.children[0].get_all_descendants(), [self.grandchildren[0]]
+        )
+
+        # 孫タスクは子孫を持たないためクエリを発行しない
+        with self.assertNumQueries(0):
+            self.assertEqual(self.grandchildren[0].get_all_descendants(), [])
+
+    def test_get_all_ancestors_single_query(self):
+        """先祖タスクが1クエリで取得されることを確認"""
+        grandchild = Task.objects.get(pk=self.grandchildren[1].pk)
+
+        with self.assertNumQueries(1):
+            ancestors = grandchild.get_all_ancestors()
+
+        self.assertEqual(ancestors, [self.children[1], self.parent])
+
+    def test_descendants_map(self):
+        """複数タスクの子孫タスクが1クエリでまとめて取得されることを確認"""
+        other = Task.objects.create(user=self.user, name="別タスク")
+        tasks = [self.parent, self.children[2], self.grandchildren[0], other]
+
+        with self.assertNumQueries(1):
+            descendants = Task.objects.descendants_map(tasks)
+
+        self.assertEqual(len(descendants[self.parent.pk]), 6)
+        self.assertEqual(descendants[self.children[2].pk], [self.grandchildren[2]])
+        self.assertEqual(descendants[self.grandchildren[0].pk], [])
+        self.assertEqual(descendants[other.pk], [])
+
+
+class TaskLiveDurationTestCase(TestCase):
+    """進行中の TimeEntry を含む累計時間（DB側計算）のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        self.grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=self.child
+        )
+        self.other = Task.objects.create(user=self.user, name="別タスク")
+
+        start_time = timezone.now() - timedelta(hours=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.child,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+        # 孫タスクで30分前から進行中
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.grandchild,
+            start_time=timezone.now() - timedelta(minutes=30),
+        )
+
+    def test_with_live_duration_annotates_page_in_one_query(self):
+        """複数タスクの現在の累計時間が1クエリで取得されることを確認"""
+        with CaptureQueriesContext(connection) as queries:
+            live = dict(
+                Task.objects.filter(user=self.user)
+                .with_live_duration()
+                .values_list("pk", "live_duration_seconds")
+            )
+
+        self.assertEqual(len(queries), 1)
+        # 進行中のエントリのサブクエリは1回だけで、インデックスで引く
+        sql = queries[0]["sql"]
+        self.assertEqual(sql.count('FROM "api_timeentry"'), 1)
+        self.assertEqual(time_entry_full_scans(sql), [])
+
+        for task, completed in (
+            (self.parent, 3600),
+            (self.child, 3600),
+            (self.grandchild, 0),
+        ):
+            self.assertGreaterEqual(live[task.pk], completed + 1795)
+            self.assertLessEqual(live[task.pk], completed + 1860)
+        self.assertEqual(live[self.other.pk], 0)
+
+    def test_with_subtree_counts_uses_indexes(self):
+        """サブツリーの件数がインデックスを使う1クエリで取得されることを確認"""
+        with CaptureQueriesContext(connection) as queries:
+            counts = {
+                pk: (child_count, entry_count)
+                for pk, child_count, entry_count in Task.objects.filter(
+                    user=self.user
+                )
+                .with_subtree_counts()
+                .values_list("pk", "child_count", "subtree_entry_count")
+            }
+
+        self.assertEqual(counts[self.parent.pk], (1, 2))
+        self.assertEqual(counts[self.child.pk], (1, 2))
+        self.assertEqual(counts[self.grandchild.pk], (0, 1))
+        self.assertEqual(counts[self.other.pk], (0, 0))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(time_entry_full_scans(queries[0]["sql"]), [])
+
+    def test_get_current_duration_seconds_matches_annotation(self):
+        """get_current_duration_seconds が DB 側の計算と一致することを確認"""
+        child = Task.objects.with_live_duration().get(pk=self.child.pk)
+
+        self.assertAlmostEqual(
+            child.get_current_duration_seconds(), child.live_duration_seconds, delta=2
+        )
+
+
+class DailyRollupTestCase(TestCase):
+    """日次集計（DailyRollup）の差分更新のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザー・プロジェクト・タスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.project = Project.objects.create(
+            user=self.user, name="テストプロジェクト", color="#FF0000"
+        )
+        self.task = Task.objects.create(
+            user=self.user, name="テストタスク", project=self.project
+        )
+        self.day = datetime(2026, 1, 5).date()
+        self.start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+
+    def _rollups(self):
+        return sorted(
+            DailyRollup.objects.filter(user=self.user)
+            .exclude(entry_count=0)
+            .values_list(
+                "date", "project_id", "task_id", "duration_seconds", "entry_count"
+            ),
+            key=lambda row: (row[0], row[2] or 0),
+        )
+
+    def _create_entry(self, start, minutes, task=None, project=None):
+        return TimeEntry.objects.create(
+            user=self.user,
+            task=task or self.task,
+            project=project,
+            start_time=start,
+            end_time=start + timedelta(minutes=minutes),
+        )
+
+    def test_create_entry_adds_to_rollup(self):
+        """完了済みエントリの作成で集計行が作成・加算されることを確認"""
+        self._create_entry(self.start_time, 30)
+        self._create_entry(self.start_time + timedelta(hours=1), 15)
+
+        self.assertEqual(
+            self._rollups(),
+            [(self.day, self.project.pk, self.task.pk, 2700, 2)],
+        )
+
+    def test_running_entry_is_counted_when_stopped(self):
+        """進行中のエントリは停止時に集計されることを確認"""
+        entry = TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=self.start_time
+        )
+        self.assertEqual(self._rollups(), [])
+
+        entry = TimeEntry.objects.get(pk=entry.pk)
+        entry.end_time = self.start_time + timedelta(minutes=45)
+        entry.save()
+
+        self.assertEqual(
+            self._rollups(),
+            [(self.day, self.project.pk, self.task.pk, 2700, 1)],
+        )
+
+    def test_edit_and_delete_apply_delta(self):
+        """編集・削除で旧状態が取り消されることを確認"""
+        other = Task.objects.create(user=self.user, name="別タスク")
+        entry = self._create_entry(self.start_time, 30)
+
+        entry = TimeEntry.objects.get(pk=entry.pk)
+        entry.task = other
+        entry.end_time = self.start_time + timedelta(minutes=20)
+        entry.save()
+        self.assertEqual(self._rollups(), [(self.day, None, other.pk, 1200, 1)])
+
+        entry.delete()
+        self.assertEqual(self._rollups(), [])
+
+    def test_entry_spanning_midnight_is_split(self):
+        """日付をまたぐエントリがローカル日付ごとに分割されることを確認"""
+        start = timezone.make_aware(datetime(2026, 1, 5, 23, 0))
+        self._create_entry(start, 90)
+
+        next_day = self.day + timedelta(days=1)
+        self.assertEqual(
+            self._rollups(),
+            [
+                (self.day, self.project.pk, self.task.pk, 3600, 1),
+                (next_day, self.project.pk, self.task.pk, 1800, 1),
+            ],
+        )
+
+    def test_split_by_day_across_dst_change(self):
+        """夏時間の切り替え日は23時間として分割されることを確認"""
+        tz = ZoneInfo("America/New_York")
+        start = datetime(2026, 3, 7, 12, 0, tzinfo=tz)
+        end = datetime(2026, 3, 9, 12, 0, tzinfo=tz)
+
+        days = list(DailyRollup.split_by_day(start, end, tz))
+
+        self.assertEqual(
+            [seconds for _, seconds in days], [12 * 3600, 23 * 3600, 12 * 3600]
+        )
+
+    def test_project_change_moves_rollups(self):
+        """ルートタスクのプロジェクト変更が集計行にも反映されることを確認"""
+        self._create_entry(self.start_time, 30)
+        new_project = Project.objects.create(
+            user=self.user, name="新プロジェクト", color="#00FF00"
+        )
+
+        self.task.project = new_project
+        self.task.save()
+
+        self.assertEqual(
+            self._rollups(),
+            [(self.day, new_project.pk, self.task.pk, 1800, 1)],
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """rebuild が差分更新と同じ集計結果になることを確認"""
+        self._create_entry(self.start_time, 30)
+        self._create_entry(timezone.make_aware(datetime(2026, 1, 5, 23, 30)), 60)
+        TimeEntry.objects.create(
+            user=self.user,
+            project=self.project,
+            start_time=self.start_time + timedelta(hours=1),
+            end_time=self.start_time + timedelta(hours=1, minutes=10),
+        )
+        expected = self._rollups()
+
+        DailyRollup.objects.filter(user=self.user).delete()
+        created = DailyRollup.objects.rebuild(self.user)
+
+        self.assertEqual(created, 3)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_rollup_key_is_unique_without_project_and_task(self):
+        """プロジェクト・タスクなしでも同じキーの集計行は1行に加算されることを確認"""
+        DailyRollup.objects.create(
+            user=self.user, date=self.day, duration_seconds=60, entry_count=1
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailyRollup.objects.create(
+                user=self.user, date=self.day, duration_seconds=60, entry_count=1
+            )
+
+        DailyRollup.objects.apply_deltas(
+            self.user.pk, {(self.day, None, None): (30, 1)}
+        )
+
+        self.assertEqual(self._rollups(), [(self.day, None, None, 90, 2)])
+
+    def test_deleting_task_merges_rollups(self):
+        """タスク削除で集計行がタスクなしの集計行に合算されることを確認"""
+        child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.task, project=self.project
+        )
+        self._create_entry(self.start_time, 30)
+        self._create_entry(self.start_time + timedelta(hours=1), 15, task=child)
+        TimeEntry.objects.create(
+            user=self.user,
+            project=self.project,
+            start_time=self.start_time + timedelta(hours=2),
+            end_time=self.start_time + timedelta(hours=2, minutes=10),
+        )
+
+        self.task.delete()
+
+        expected = [(self.day, self.project.pk, None, 3300, 3)]
+        self.assertEqual(self._rollups(), expected)
+        DailyRollup.objects.rebuild(self.user)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_deleting_project_merges_rollups(self):
+        """プロジェクト削除で集計行がプロジェクトなしの集計行に合算されることを確認"""
+        self._create_entry(self.start_time, 30)
+        for hours, project in ((1, self.project), (2, None)):
+            TimeEntry.objects.create(
+                user=self.user,
+                project=project,
+                start_time=self.start_time + timedelta(hours=hours),
+                end_time=self.start_time + timedelta(hours=hours, minutes=10),
+            )
+
+        self.project.delete()
+
+        expected = [
+            (self.day, None, None, 1200, 2),
+            (self.day, None, self.task.pk, 1800, 1),
+        ]
+        self.assertEqual(self._rollups(), expected)
+        DailyRollup.objects.rebuild(self.user)
+        self.assertEqual(self._rollups(), expected)
+
+
+class TimeEntryOverlapTestCase(TestCase):
+    """Time Entry の時間の重複チェックのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーと Time Entry を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+        TimeEntry.objects.create(
+            user=self.user,
+            start_time=self.start_time,
+            end_time=self.start_time + timedelta(hours=1),
+        )
+
+    def test_clean_rejects_overlap(self):
+        """clean() で重複するエントリがエラーになることを確認"""
+        entry = TimeEntry(
+            user=self.user,
+            start_time=self.start_time + timedelta(minutes=30),
+        )
+
+        with self.assertRaises(ValidationError) as context:
+            entry.clean()
+        self.assertIn("start_time", context.exception.message_dict)
+
+    def test_clean_rejects_end_before_start(self):
+        """clean() で終了時刻が開始時刻より前のエントリがエラーになることを確認"""
+        entry = TimeEntry(
+            user=self.user,
+            start_time=self.start_time + timedelta(hours=3),
+            end_time=self.start_time + timedelta(hours=2),
+        )
+
+        with self.assertRaises(ValidationError) as context:
+            entry.clean()
+        self.assertIn("end_time", context.exception.message_dict)
+
+    def test_database_rejects_end_before_start(self):
+        """終了時刻が開始時刻より前になる更新はデータベースで拒否されることを確認"""
+        entry = TimeEntry.objects.create(
+            user=self.user,
+            start_time=self.start_time + timedelta(hours=2),
+            end_time=self.start_time + timedelta(hours=3),
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimeEntry.objects.filter(pk=entry.pk).update(
+                end_time=self.start_time + timedelta(hours=1, minutes=30)
+            )
+
+    def test_other_users_entries_do_not_conflict(self):
+        """他のユーザーのエントリとは重複しないことを確認"""
+        other = User.objects.create_user(username="other", password="pass")
+        entry = TimeEntry.objects.create(
+            user=other,
+            start_time=self.start_time,
+            end_time=self.start_time + timedelta(hours=1),
+        )
+
+        entry.clean()
+
+    def test_database_rejects_overlapping_update(self):
+        """UPDATE による重複もデータベースで拒否されることを確認"""
+        entry = TimeEntry.objects.create(
+            user=self.user,
+            start_time=self.start_time + timedelta(hours=2),
+            end_time=self.start_time + timedelta(hours=3),
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimeEntry.objects.filter(pk=entry.pk).update(
+                start_time=self.start_time + timedelta(minutes=30)
+            )
@@ -0,0 +1,2274 @@
+"""
+API ビューのテスト
+
+REST API エンドポイントのクエリ数とレスポンス内容を確認します。
+"""
+
+import csv
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api import response_cache
+from api.models import Project, Tag, Task, TimeEntry
+from api.views import ProjectViewSet, TagViewSet, TaskViewSet
+
+User = get_user_model()
+
+
+class TaskListAnnotationTestCase(APITestCase):
+    """TaskViewSet の ?with= アノテーションのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        start_time = timezone.now() - timedelta(hours=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.child,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.child,
+            start_time=timezone.now() - timedelta(minutes=10),
+        )
+
+    def _list(self, **params):
+        response = self.client.get("/api/tasks/", params)
+        self.assertEqual(response.status_code, 200)
+        return {task["id"]: task for task in response.data["results"]}
+
+    def test_default_list_has_no_annotations(self):
+        """?with= を指定しない場合は追加フィールドを含まないことを確認"""
+        task = self._list()[self.parent.pk]
+
+        self.assertNotIn("live_duration_seconds", task)
+        self.assertNotIn("child_count", task)
+
+    def test_with_live_duration_and_subtree_counts(self):
+        """?with= で現在の累計時間とサブツリーの件数が返ることを確認"""
+        tasks = self._list(**{"with": "live_duration,subtree_counts"})
+
+        parent = tasks[self.parent.pk]
+        self.assertEqual(parent["duration_seconds"], 3600)
+        self.assertGreaterEqual(parent["live_duration_seconds"], 3600 + 595)
+        self.assertLessEqual(parent["live_duration_seconds"], 3600 + 660)
+        self.assertEqual(parent["child_count"], 1)
+        self.assertEqual(parent["subtree_entry_count"], 2)
+        self.assertEqual(tasks[self.child.pk]["child_count"], 0)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        """ページ内のタスク数に関わらずクエリ数が一定であることを確認"""
+        params = {"with": "live_duration,subtree_counts"}
+        with CaptureQueriesContext(connection) as small:
+            self._list(**params)
+
+        for i in range(20):
+            task = Task.objects.create(user=self.user, name=f"タスク{i}")
+            task.tags.add(self.tag)
+            Task.objects.create(user=self.user, name=f"子タスク{i}", parent=task)
+
+        with CaptureQueriesContext(connection) as large:
+            self._list(**params)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_unknown_with_option_is_rejected(self):
+        """未知の ?with= オプションは 400 になることを確認"""
+        response = self.client.get("/api/tasks/", {"with": "everything"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskSparseFieldsetTestCase(APITestCase):
+    """TaskViewSet の ?fields= / ?omit= のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタグ・プロジェクト付きのタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+        self.parent = Task.objects.create(
+            user=self.user, name="親タスク", project=self.project
+        )
+        self.parent.tags.add(self.tag)
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+
+    def _get(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/tasks/", params)
+        self.assertEqual(response.status_code, 200)
+        tasks = {task["id"]: task for task in response.data["results"]}
+        task_sql = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "api_task"' in query["sql"] and "COUNT(" not in query["sql"]
+        ]
+        return tasks, queries, task_sql
+
+    def test_fields_drops_joins_prefetches_and_columns(self):
+        """?fields=id,name では JOIN・prefetch・不要なカラムを読み込まないことを確認"""
+        tasks, queries, task_sql = self._get({"fields": "id,name"})
+
+        self.assertEqual(
+            tasks[self.child.pk], {"id": self.child.pk, "name": "子タスク"}
+        )
+        # data_version + COUNT + タスク一覧（タグの prefetch なし）
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn("JOIN", task_sql[0])
+        self.assertNotIn('"description"', task_sql[0])
+
+    def test_omit_removes_fields_and_prefetch(self):
+        """?omit= で指定したフィールドとタグの prefetch が除かれることを確認"""
+        tasks, queries, task_sql = self._get({"omit": "tags,tag_names,description"})
+
+        task = tasks[self.child.pk]
+        self.assertNotIn("tags", task)
+        self.assertNotIn("description", task)
+        self.assertEqual(task["project_name"], "プロジェクト")
+        self.assertEqual(task["parent_name"], "親タスク")
+        self.assertEqual(len(queries), 3)
+        self.assertIn("JOIN", task_sql[0])
+
+    def test_related_name_fields_join_only_what_is_needed(self):
+        """関連オブジェクトの名前は必要な JOIN だけで取得されることを確認"""
+        tasks, _, task_sql = self._get({"fields": "id,project_name,tag_names"})
+
+        self.assertEqual(
+            tasks[self.parent.pk],
+            {
+                "id": self.parent.pk,
+                "project_name": "プロジェクト",
+                "tag_names": ["タグ"],
+            },
+        )
+        self.assertEqual(task_sql[0].count("JOIN"), 1)
+
+    def test_fields_with_annotations(self):
+        """?with= の追加フィールドも ?fields= で指定できることを確認"""
+        tasks, _, _ = self._get({"with": "subtree_counts", "fields": "id,child_count"})
+
+        self.assertEqual(
+            tasks[self.parent.pk], {"id": self.parent.pk, "child_count": 1}
+        )
+
+    def test_fields_with_keyset_pagination(self):
+        """キーセットページネーションの並び替えカラムが遅延読み込みされないことを確認"""
+        params = {"pagination": "cursor", "limit": 1, "fields": "id"}
+        response = self.client.get("/api/tasks/", params)
+
+        # data_version + タスク一覧
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["results"], [{"id": self.parent.pk}])
+
+    def test_unknown_field_is_rejected(self):
+        """未知のフィールドは 400 になることを確認"""
+        response = self.client.get("/api/tasks/", {"fields": "id,secret"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.data)
+
+
+class TimeEntryKeysetPaginationTestCase(APITestCase):
+    """TimeEntryViewSet のキーセットページネーションのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーと TimeEntry を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.task = Task.objects.create(user=self.user, name="タスク")
+        self.other_task = Task.objects.create(user=self.user, name="別タスク")
+
+        base = timezone.now() - timedelta(days=10)
+        self.entries = []
+        for i in range(25):
+            # 同じ開始時刻のエントリを含める（id で順序が決まることを確認）
+            # 時間の重複は許可されないため、2件目は長さ0のエントリにする
+            start_time = base + timedelta(hours=i // 2)
+            minutes = 0 if i % 2 else 30
+            self.entries.append(
+                TimeEntry.objects.create(
+                    user=self.user,
+                    task=self.task if i % 3 else self.other_task,
+                    start_time=start_time,
+                    end_time=start_time + timedelta(minutes=minutes),
+                )
+            )
+
+    def _expected_ids(self):
+        return [
+            entry.pk
+            for entry in sorted(
+                self.entries, key=lambda e: (e.start_time, e.pk), reverse=True
+            )
+        ]
+
+    def test_walk_pages_forward_and_backward(self):
+        """next/previous を辿ると全件が重複・欠落なく取得できることを確認"""
+        pages = []
+        url = "/api/time-entries/?ordering=-start_time&limit=10"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            pages.append(response.data)
+            url = response.data["next"]
+
+        ids = [entry["id"] for page in pages for entry in page["results"]]
+        self.assertEqual(ids, self._expected_ids())
+        self.assertEqual([len(page["results"]) for page in pages], [10, 10, 5])
+        self.assertIsNone(pages[0]["previous"])
+
+        response = self.client.get(pages[2]["previous"])
+        self.assertEqual(
+            [entry["id"] for entry in response.data["results"]],
+            [entry["id"] for entry in pages[1]["results"]],
+        )
+
+    def test_deep_page_query_count(self):
+        """深いページでもクエリ数が一定であることを確認"""
+        response = self.client.get("/api/time-entries/", {"limit": 5})
+        for _ in range(3):
+            response = self.client.get(response.data["next"])
+
+        # data_version + Time Entry 一覧
+        with self.assertNumQueries(2):
+            self.client.get(response.data["next"])
+
+    def test_filters(self):
+        """task と start_time の範囲フィルターを確認"""
+        response = self.client.get(
+            "/api/time-entries/", {"task": self.other_task.pk, "limit": 100}
+        )
+        self.assertEqual(len(response.data["results"]), 9)
+
+        after = self.entries[20].start_time.isoformat()
+        response = self.client.get(
+            "/api/time-entries/", {"start_time_after": after, "limit": 100}
+        )
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_invalid_cursor(self):
+        """不正なカーソルは 404 になることを確認"""
+        response = self.client.get("/api/time-entries/", {"cursor": "invalid"})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_create_rejects_other_users_task(self):
+        """他ユーザーのタスクを指定した作成は 400 になることを確認"""
+        other_user = User.objects.create_user(username="other", password="pass")
+        other_task = Task.objects.create(user=other_user, name="他人のタスク")
+
+        response = self.client.post(
+            "/api/time-entries/",
+            {"task": other_task.pk, "start_time": timezone.now().isoformat()},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("task", response.data)
+
+
+class TaskKeysetPaginationTestCase(APITestCase):
+    """TaskViewSet のオプトインのキーセットページネーションのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーと同名・同時刻を含むタスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        created_at = timezone.now() - timedelta(days=1)
+        self.tasks = [
+            Task.objects.create(user=self.user, name=f"タスク{i // 3}")
+            for i in range(12)
+        ]
+        # 作成日時が同じタスクを含める（id で順序が決まることを確認）
+        for i, task in enumerate(self.tasks):
+            task.created_at = created_at + timedelta(minutes=i // 2)
+        Task.objects.bulk_update(self.tasks, ["created_at"])
+
+    def _walk(self, params):
+        pages = []
+        response = self.client.get("/api/tasks/", {"pagination": "cursor", **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            pages.append([task["id"] for task in response.data["results"]])
+            if not response.data["next"]:
+                return pages
+            response = self.client.get(response.data["next"])
+
+    def test_walk_pages_by_created_at(self):
+        """作成日時の降順で全件が重複・欠落なく取得できることを確認"""
+        pages = self._walk({"limit": 5})
+
+        expected = [
+            task.pk
+            for task in sorted(
+                self.tasks, key=lambda t: (t.created_at, t.pk), reverse=True
+            )
+        ]
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+
+    def test_walk_pages_by_name(self):
+        """名前の昇順で全件が重複・欠落なく取得できることを確認"""
+        pages = self._walk({"ordering": "name", "limit": 4})
+
+        expected = [
+            task.pk for task in sorted(self.tasks, key=lambda t: (t.name, t.pk))
+        ]
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_deep_page_has_no_count_query(self):
+        """深いページでも COUNT を含まない一定のクエリ数になることを確認"""
+        params = {"pagination": "cursor", "limit": 2}
+        response = self.client.get("/api/tasks/", params)
+        for _ in range(3):
+            response = self.client.get(response.data["next"])
+
+        # data_version + タスク + タグの prefetch
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data["next"])
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(
+            any("COUNT(" in query["sql"].upper() for query in queries.captured_queries)
+        )
+
+    def test_page_number_pagination_is_default(self):
+        """pagination を指定しない場合はページ番号方式のままであることを確認"""
+        response = self.client.get("/api/tasks/")
+
+        self.assertEqual(response.data["count"], 12)
+
+    def test_unknown_pagination_mode(self):
+        """不明な pagination は 400 になることを確認"""
+        response = self.client.get("/api/tasks/", {"pagination": "offset"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TimerViewSetTestCase(APITestCase):
+    """アクティブタイマー API のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.parent = Task.objects.create(user=self.user, name="親タスク")
+        self.task = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        self.other_task = Task.objects.create(user=self.user, name="別タスク")
+
+    def test_no_running_timer(self):
+        """タイマーが無い場合は 204 になることを確認"""
+        response = self.client.get("/api/timer/")
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_start_and_stop(self):
+        """タイマーの開始・取得・停止を確認"""
+        response = self.client.post("/api/timer/start/", {"task": self.task.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data["end_time"])
+
+        response = self.client.get("/api/timer/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["task"], self.task.pk)
+
+        response = self.client.post("/api/timer/stop/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data["end_time"])
+
+        response = self.client.post("/api/timer/stop/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_start_twice_conflicts(self):
+        """タイマーの二重開始は 409 になることを確認"""
+        self.client.post("/api/timer/start/", {"task": self.task.pk})
+
+        response = self.client.post("/api/timer/start/", {"task": self.other_task.pk})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["detail"], "進行中のタイマーが既に存在します")
+        self.assertEqual(
+            TimeEntry.objects.filter(user=self.user, end_time__isnull=True).count(), 1
+        )
+
+    def test_start_overlapping_finished_entry_conflicts(self):
+        """終了時刻が未来の完了済みエントリと重なる開始は重複の 409 になることを確認"""
+        now = timezone.now()
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.task,
+            start_time=now - timedelta(minutes=10),
+            end_time=now + timedelta(minutes=10),
+        )
+
+        for url in ("/api/timer/start/", "/api/timer/switch/"):
+            with self.subTest(url=url):
+                response = self.client.post(url, {"task": self.other_task.pk})
+
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(
+                    response.data["detail"], "他のTime Entryと時間が重複しています"
+                )
+        self.assertFalse(
+            TimeEntry.objects.filter(user=self.user, end_time__isnull=True).exists()
+        )
+
+    def test_switch(self):
+        """タイマーの切り替えで旧エントリが停止し新エントリが開始されることを確認"""
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.task,
+            start_time=timezone.now() - timedelta(minutes=20),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/timer/switch/", {"task": self.other_task.pk}
+            )
+
+        self.assertEqual(response.status_code, 201)
+        stopped, started = response.data["stopped"], response.data["started"]
+        self.assertEqual(stopped["end_time"], started["start_time"])
+        self.assertEqual(started["task"], self.other_task.pk)
+        self.parent.refresh_from_db()
+        self.assertGreaterEqual(self.parent.duration_seconds, 1200)
+
+    def test_switch_query_count_is_fixed(self):
+        """タイマーの切り替えのクエリ数が一定であることを確認"""
+        TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=timezone.now()
+        )
+        with CaptureQueriesContext(connection) as first:
+            self.client.post("/api/timer/switch/", {"task": self.other_task.pk})
+
+        for i in range(10):
+            start_time = timezone.now() - timedelta(days=i + 1)
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.task,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=5),
+            )
+        with CaptureQueriesContext(connection) as second:
+            self.client.post("/api/timer/switch/", {"task": self.task.pk})
+
+        self.assertEqual(len(first), len(second))
+
+    def test_switch_bumps_data_version_once(self):
+        """切り替えでdata_versionを1回だけ進め、両方のエントリに記録することを確認"""
+        stopped = TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=timezone.now()
+        )
+        self.user.refresh_from_db()
+        version = self.user.data_version
+
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                "/api/timer/switch/", {"task": self.other_task.pk}
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.data_version, version + 1)
+        started = TimeEntry.objects.get(pk=response.data["started"]["id"])
+        stopped.refresh_from_db()
+        self.assertEqual(started.sync_version, version + 1)
+        self.assertEqual(stopped.sync_version, version + 1)
+
+    def test_running_entry_is_unique_per_user(self):
+        """進行中のエントリはユーザーごとに1件に制限されることを確認"""
+        TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=timezone.now()
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimeEntry.objects.create(
+                user=self.user, task=self.other_task, start_time=timezone.now()
+            )
+
+
+class TimeEntryImportTestCase(APITestCase):
+    """TimeEntry 一括インポート API のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.parent = Task.objects.create(
+            user=self.user, name="親タスク", project=self.project
+        )
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.parent
+        )
+        other_user = User.objects.create_user(username="other", password="pass")
+        self.other_task = Task.objects.create(user=other_user, name="他人のタスク")
+
+    def _upload(self, content, name="entries.csv", **data):
+        upload = SimpleUploadedFile(name, content.encode("utf-8"))
+        return self.client.post(
+            "/api/time-entries/import/", {"file": upload, **data}, format="multipart"
+        )
+
+    def test_import_csv(self):
+        """CSV を取り込み、不正な行はスキップされることを確認"""
+        content = (
+            "task,start_time,end_time\n"
+            f"{self.child.pk},2025-01-01T09:00:00+09:00,2025-01-01T10:00:00+09:00\n"
+            f"{self.child.pk},2025-01-02T09:00:00+09:00,2025-01-02T09:30:00+09:00\n"
+            f"{self.parent.pk},2025-01-03T09:00:00+09:00,2025-01-03T09:15:00+09:00\n"
+            f"{self.other_task.pk},2025-01-04T09:00:00+09:00,2025-01-04T10:00:00+09:00\n"
+            f"{self.child.pk},not-a-date,2025-01-05T10:00:00+09:00\n"
+            f"{self.child.pk},2025-01-06T10:00:00+09:00,2025-01-06T09:00:00+09:00\n"
+        )
+
+        response = self._upload(content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(response.data["skipped"], 3)
+        self.assertEqual([e["line"] for e in response.data["errors"]], [5, 6, 7])
+
+        entry = TimeEntry.objects.filter(task=self.child).first()
+        self.assertEqual(entry.project, self.project)
+        self.assertEqual(entry.name, "子タスク")
+
+        # タスクの duration_seconds はまとめて再計算される
+        self.parent.refresh_from_db()
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.duration_seconds, 5400)
+        self.assertEqual(self.parent.duration_seconds, 6300)
+
+    def test_unreadable_file_stops_with_line(self):
+        """不正な UTF-8 や CSV の行で 400 になり、それまでの行は取り込まれることを確認"""
+        rows = [
+            f"{self.child.pk},2025-01-0{day}T09:00:00+09:00,2025-01-0{day}T09:10:00+09:00"
+            for day in range(1, 4)
+        ]
+        for bad_line in (b"\xff\xfe,broken", "x" * (csv.field_size_limit() + 1)):
+            with self.subTest(bad_line=bad_line[:10]):
+                TimeEntry.objects.all().delete()
+                if isinstance(bad_line, str):
+                    bad_line = f'"{bad_line}",,'.encode()
+                content = b"\n".join(
+                    [b"task,start_time,end_time", *(r.encode() for r in rows)]
+                    + [bad_line, rows[0].encode()]
+                )
+                upload = SimpleUploadedFile("entries.csv", content)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(
+                        "/api/time-entries/import/",
+                        {"file": upload},
+                        format="multipart",
+                    )
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["line"], 5)
+                self.assertEqual(response.data["created"], 3)
+                self.assertEqual(response.data["last_line"], 4)
+                self.child.refresh_from_db()
+                self.assertEqual(self.child.duration_seconds, 1800)
+
+    def test_import_ndjson_resume(self):
+        """NDJSON を skip_lines で途中から再開できることを確認"""
+        lines = [
+            {
+                "task": self.child.pk,
+                "start_time": f"2025-01-0{day}T09:00:00+09:00",
+                "end_time": f"2025-01-0{day}T09:10:00+09:00",
+            }
+            for day in range(1, 6)
+        ]
+        content = "\n".join(json.dumps(line) for line in lines)
+
+        response = self._upload(content, name="entries.ndjson", skip_lines=2)
+
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(response.data["last_line"], 5)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.duration_seconds, 1800)
+
+    def test_import_skips_overlapping_rows(self):
+        """既存のエントリやファイル内の先の行と重なる行はスキップされることを確認"""
+        TimeEntry.objects.create(
+            user=self.user,
+            task=self.child,
+            start_time=timezone.make_aware(datetime(2025, 1, 1, 9, 0)),
+            end_time=timezone.make_aware(datetime(2025, 1, 1, 10, 0)),
+        )
+        content = (
+            "task,start_time,end_time\n"
+            f"{self.child.pk},2025-01-01T09:30:00+09:00,2025-01-01T10:30:00+09:00\n"
+            f"{self.child.pk},2025-01-01T10:00:00+09:00,2025-01-01T11:00:00+09:00\n"
+            f"{self.child.pk},2025-01-01T10:30:00+09:00,2025-01-01T11:30:00+09:00\n"
+            f"{self.child.pk},2025-01-01T11:00:00+09:00,2025-01-01T11:30:00+09:00\n"
+        )
+
+        response = self._upload(content)
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([e["line"] for e in response.data["errors"]], [2, 4])
+        self.assertEqual(TimeEntry.objects.filter(user=self.user).count(), 3)
+
+
+class TimeEntryOverlapTestCase(APITestCase):
+    """Time Entry の時間の重複防止と監査 API のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーと Time Entry を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+        self.entry = TimeEntry.objects.create(
+            user=self.user,
+            start_time=self.start_time,
+            end_time=self.start_time + timedelta(hours=1),
+        )
+
+    def _post(self, start_minutes, end_minutes):
+        data = {"start_time": self.start_time + timedelta(minutes=start_minutes)}
+        if end_minutes is not None:
+            data["end_time"] = self.start_time + timedelta(minutes=end_minutes)
+        return self.client.post("/api/time-entries/", data, format="json")
+
+    def test_create_rejects_overlap(self):
+        """既存のエントリと重なるエントリの作成は 400 を返すことを確認"""
+        for start, end in ((30, 90), (-30, 10), (-60, 120), (10, 20), (-10, None)):
+            response = self._post(start, end)
+            self.assertEqual(response.status_code, 400, (start, end))
+            self.assertIn("start_time", response.data)
+
+    def test_adjacent_entries_are_allowed(self):
+        """前後に隣接するエントリは作成できることを確認"""
+        self.assertEqual(self._post(-30, 0).status_code, 201)
+        self.assertEqual(self._post(60, 90).status_code, 201)
+        self.assertEqual(self._post(120, None).status_code, 201)
+
+    def test_update_rejects_overlap(self):
+        """更新で他のエントリと重なる場合は 400 を返すことを確認"""
+        other = TimeEntry.objects.create(
+            user=self.user,
+            start_time=self.start_time + timedelta(hours=2),
+            end_time=self.start_time + timedelta(hours=3),
+        )
+
+        response = self.client.patch(
+            f"/api/time-entries/{other.pk}/",
+            {"start_time": self.start_time + timedelta(minutes=30)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # 自分自身とは重複しない
+        response = self.client.patch(
+            f"/api/time-entries/{other.pk}/",
+            {"end_time": self.start_time + timedelta(hours=4)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_rejects_end_before_start(self):
+        """終了時刻を開始時刻より前にする更新は 400 を返すことを確認"""
+        response = self.client.patch(
+            f"/api/time-entries/{self.entry.pk}/",
+            {"end_time": self.start_time - timedelta(minutes=1)},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("end_time", response.data)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.duration_seconds, 3600)
+
+    def test_database_rejects_overlap(self):
+        """バリデーションを経由しない保存もデータベースで拒否されることを確認"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimeEntry.objects.bulk_create(
+                [
+                    TimeEntry(
+                        user=self.user,
+                        start_time=self.start_time + timedelta(minutes=30),
+                        end_time=self.start_time + timedelta(minutes=90),
+                    )
+                ]
+            )
+
+    def test_overlap_audit(self):
+        """重複がない場合の監査 API の結果を確認"""
+        response = self.client.get("/api/time-entries/overlaps/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"count": 0, "results": []})
+
+
+class TimeEntryExportTestCase(APITestCase):
+    """TimeEntry ストリーミングエクスポートのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザー・タスク・TimeEntry を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.task = Task.objects.create(user=self.user, name="タスク", project=project)
+        self.task.tags.add(
+            Tag.objects.create(user=self.user, name="b"),
+            Tag.objects.create(user=self.user, name="a"),
+        )
+        base = timezone.now() - timedelta(days=30)
+        for i in range(5):
+            start_time = base + timedelta(days=i)
+            TimeEntry.objects.create(
+                user=self.user,
+                task=self.task if i % 2 == 0 else None,
+                name=None if i % 2 == 0 else "タスクなし",
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=10),
+            )
+        self.base = base
+
+    def _content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_csv(self):
+        """CSV でタスク名・プロジェクト名・タグ名が出力されることを確認"""
+        response = self.client.get("/api/time-entries/export/")
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = self._content(response).splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "start_time", "end_time"])
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(
+            lines[1].endswith(f",タスク,{self.task.project_id},プロジェクト,a;b")
+        )
+
+    def test_export_ndjson_with_filter(self):
+        """NDJSON と start_time の範囲フィルターを確認"""
+        response = self.client.get(
+            "/api/time-entries/export/",
+            {
+                "output": "ndjson",
+                "start_time_after": (self.base + timedelta(days=2)).isoformat(),
+            },
+        )
+
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["tags"], ["a", "b"])
+        self.assertEqual(rows[1]["name"], "タスクなし")
+        self.assertEqual(rows[1]["tags"], [])
+
+    def test_export_uses_user_timezone(self):
+        """日時がユーザーのタイムゾーンで出力されることを確認"""
+        self.user.timezone = "America/New_York"
+        self.user.save()
+
+        response = self.client.get("/api/time-entries/export/", {"output": "ndjson"})
+
+        row = json.loads(self._content(response).splitlines()[0])
+        entry = TimeEntry.objects.get(pk=row["id"])
+        tz = ZoneInfo("America/New_York")
+        self.assertEqual(
+            row["start_time"], timezone.localtime(entry.start_time, tz).isoformat()
+        )
+        self.assertEqual(
+            row["end_time"], timezone.localtime(entry.end_time, tz).isoformat()
+        )
+
+    def test_export_query_count_per_chunk(self):
+        """チャンク単位でクエリが発行されることを確認"""
+        response = self.client.get("/api/time-entries/export/")
+        with self.assertNumQueries(2):
+            self._content(response)
+
+
+class ReportSummaryTestCase(APITestCase):
+    """/api/reports/summary/ のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザー・タスク・Time Entryを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            user=self.user, name="プロジェクト", color="#FF0000"
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name) for name in ("A", "B")
+        ]
+        self.task = Task.objects.create(
+            user=self.user, name="タスク", project=self.project
+        )
+        self.task.tags.set(self.tags)
+        self.other = Task.objects.create(user=self.user, name="別タスク")
+
+        tz = ZoneInfo("Asia/Tokyo")
+        # 2026-01-04(日) 23:00 から 2時間（日付と週をまたぐ）
+        self._create(self.task, datetime(2026, 1, 4, 23, 0, tzinfo=tz), 120)
+        self._create(self.other, datetime(2026, 1, 20, 9, 0, tzinfo=tz), 30)
+        self._create(self.task, datetime(2026, 2, 2, 9, 0, tzinfo=tz), 15)
+
+    def _create(self, task, start_time, minutes):
+        TimeEntry.objects.create(
+            user=self.user,
+            task=task,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=minutes),
+        )
+
+    def _summary(self, **params):
+        params = {"start": "2026-01-01", "end": "2026-12-31", **params}
+        response = self.client.get("/api/reports/summary/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_daily_buckets_split_at_midnight(self):
+        """日付をまたぐエントリが日ごとに分割されることを確認"""
+        data = self._summary()
+
+        self.assertEqual(data["timezone"], "Asia/Tokyo")
+        self.assertEqual(data["total_seconds"], 9900)
+        self.assertEqual(
+            [(row["period"], row["duration_seconds"]) for row in data["results"]],
+            [
+                ("2026-01-04", 3600),
+                ("2026-01-05", 3600),
+                ("2026-01-20", 1800),
+                ("2026-02-02", 900),
+            ],
+        )
+
+    def test_weekly_buckets_grouped_by_project(self):
+        """ISO週（月曜始まり）とプロジェクトで集計されることを確認"""
+        data = self._summary(bucket="week", group_by="project")
+
+        self.assertEqual(
+            [
+                (row["period"], row["id"], row["duration_seconds"])
+                for row in data["results"]
+            ],
+            [
+                ("2025-12-29", self.project.pk, 3600),
+                ("2026-01-05", self.project.pk, 3600),
+                ("2026-01-19", None, 1800),
+                ("2026-02-02", self.project.pk, 900),
+            ],
+        )
+
+    def test_monthly_buckets_grouped_by_tag(self):
+        """月ごと・タグごとに集計されることを確認"""
+        data = self._summary(bucket="month", group_by="tag")
+
+        self.assertEqual(
+            [
+                (row["period"], row["name"], row["duration_seconds"])
+                for row in data["results"]
+            ],
+            [
+                ("2026-01-01", None, 1800),
+                ("2026-01-01", "A", 7200),
+                ("2026-01-01", "B", 7200),
+                ("2026-02-01", "A", 900),
+                ("2026-02-01", "B", 900),
+            ],
+        )
+
+    def test_user_timezone_changes_buckets(self):
+        """ユーザーのタイムゾーン変更で日次集計が作り直されることを確認"""
+        response = self.client.patch(
+            "/api/auth/user/", {"timezone": "America/New_York"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["timezone"], "America/New_York")
+
+        data = self._summary(end="2026-01-31")
+
+        # 東京の 2026-01-04 23:00 はニューヨークの 2026-01-04 09:00
+        self.assertEqual(data["timezone"], "America/New_York")
+        self.assertEqual(
+            [(row["period"], row["duration_seconds"]) for row in data["results"]],
+            [("2026-01-04", 7200), ("2026-01-19", 1800)],
+        )
+
+    def test_invalid_parameters(self):
+        """不正なパラメータは 400 を返すことを確認"""
+        for params in (
+            {},
+            {"start": "2026-02-01", "end": "2026-01-01"},
+            {"start": "2026-01-01", "end": "2026-01-31", "bucket": "year"},
+            {"start": "2026-01-01", "end": "2026-01-31", "group_by": "user"},
+        ):
+            response = self.client.get("/api/reports/summary/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+        response = self.client.patch(
+            "/api/auth/user/", {"timezone": "Mars/Olympus"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ReportTimelineHeatmapTestCase(APITestCase):
+    """/api/reports/timeline/ と /api/reports/heatmap/ のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザー・プロジェクト・Time Entryを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            user=self.user, name="プロジェクト", color="#FF0000"
+        )
+        task = Task.objects.create(user=self.user, name="タスク", project=self.project)
+
+        tz = ZoneInfo("Asia/Tokyo")
+        # 2026-01-05(月) 23:30 から 1時間（日付をまたぐ）
+        TimeEntry.objects.create(
+            user=self.user,
+            task=task,
+            start_time=datetime(2026, 1, 5, 23, 30, tzinfo=tz),
+            end_time=datetime(2026, 1, 6, 0, 30, tzinfo=tz),
+        )
+        # プロジェクトなし・上のエントリの直後から1時間
+        TimeEntry.objects.create(
+            user=self.user,
+            start_time=datetime(2026, 1, 6, 0, 30, tzinfo=tz),
+            end_time=datetime(2026, 1, 6, 1, 30, tzinfo=tz),
+        )
+
+    def test_hourly_timeline(self):
+        """時間ごとの合計・稼働・プロジェクト別秒数を確認"""
+        response = self.client.get(
+            "/api/reports/timeline/",
+            {"start": "2026-01-05", "end": "2026-01-06", "bucket": "hour"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        results = response.data["results"]
+        self.assertEqual(len(results), 48)
+        busy = [row for row in results if row["duration_seconds"]]
+        self.assertEqual(
+            [
+                (
+                    row["start"],
+                    row["duration_seconds"],
+                    row["active_seconds"],
+                    row["projects"],
+                )
+                for row in busy
+            ],
+            [
+                (
+                    "2026-01-05T23:00:00+09:00",
+                    1800,
+                    1800,
+                    [{"id": self.project.pk, "duration_seconds": 1800}],
+                ),
+                (
+                    "2026-01-06T00:00:00+09:00",
+                    3600,
+                    3600,
+                    [
+                        {"id": None, "duration_seconds": 1800},
+                        {"id": self.project.pk, "duration_seconds": 1800},
+                    ],
+                ),
+                (
+                    "2026-01-06T01:00:00+09:00",
+                    1800,
+                    1800,
+                    [{"id": None, "duration_seconds": 1800}],
+                ),
+            ],
+        )
+
+    def test_timeline_range_limit(self):
+        """時間単位のタイムラインは31日までに制限されることを確認"""
+        response = self.client.get(
+            "/api/reports/timeline/",
+            {"start": "2026-01-01", "end": "2026-03-01", "bucket": "hour"},
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_heatmap(self):
+        """日ごとの合計と曜日×時刻のヒストグラムを確認"""
+        response = self.client.get("/api/reports/heatmap/", {"year": 2026})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            response.data["days"],
+            [
+                {"date": "2026-01-05", "duration_seconds": 1800},
+                {"date": "2026-01-06", "duration_seconds": 5400},
+            ],
+        )
+        hours = response.data["hour_of_week"]
+        self.assertEqual(hours[0][23], 1800)
+        self.assertEqual(hours[1][0], 3600)
+        self.assertEqual(hours[1][1], 1800)
+        self.assertEqual(sum(map(sum, hours)), 7200)
+
+
+class ConditionalGetTestCase(APITestCase):
+    """data_version を使った ETag / If-None-Match のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとプロジェクト・タスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+        self.task = Task.objects.create(
+            user=self.user, name="タスク", project=self.project
+        )
+
+    def _etag(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_saving_stale_user_keeps_data_version(self):
+        """古いユーザーのインスタンスを保存してもdata_versionが戻らないことを確認"""
+        stale = User.objects.get(pk=self.user.pk)
+        Project.objects.create(user=self.user, name="追加")
+        version = User.objects.get(pk=self.user.pk).data_version
+        self.assertGreater(version, stale.data_version)
+
+        stale.first_name = "名前"
+        stale.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).data_version, version)
+        # force_authenticate したユーザーも作成時点の古いインスタンス
+        response = self.client.patch(
+            "/api/auth/user/", {"timezone": "Asia/Tokyo"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.data_version, version)
+        self.assertEqual(user.timezone, "Asia/Tokyo")
+
+    def test_matching_etag_returns_304_without_serializing(self):
+        """一致する If-None-Match には data_version の取得だけで 304 を返すことを確認"""
+        for url in (
+            "/api/projects/",
+            "/api/tags/",
+            "/api/tasks/",
+            "/api/time-entries/",
+            f"/api/tasks/{self.task.pk}/",
+        ):
+            etag = self._etag(url)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+
+    def test_etag_depends_on_query_string(self):
+        """クエリ文字列が異なれば ETag も異なることを確認"""
+        self.assertNotEqual(
+            self._etag("/api/tasks/"), self._etag("/api/tasks/", {"fields": "id"})
+        )
+
+    def test_writes_change_etag(self):
+        """作成・更新・削除・タグの付け替えで ETag が変わることを確認"""
+        etags = [self._etag("/api/tasks/")]
+
+        self.client.post("/api/projects/", {"name": "別プロジェクト"})
+        etags.append(self._etag("/api/tasks/"))
+
+        self.client.patch(f"/api/tags/{self.tag.pk}/", {"name": "改名"})
+        etags.append(self._etag("/api/tasks/"))
+
+        self.task.tags.add(self.tag)
+        etags.append(self._etag("/api/tasks/"))
+
+        self.client.delete(f"/api/projects/{self.project.pk}/")
+        etags.append(self._etag("/api/tasks/"))
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_duration_rollup_changes_etag(self):
+        """コミット時のタスクの累計時間の再計算で ETag が変わることを確認"""
+        start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+        entry = TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=start_time
+        )
+        etag = self._etag("/api/tasks/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.end_time = start_time + timedelta(hours=1)
+            entry.save()
+        response = self.client.get("/api/tasks/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["duration_seconds"], 3600)
+
+    def test_other_users_writes_keep_etag(self):
+        """他のユーザーの変更では ETag が変わらないことを確認"""
+        etag = self._etag("/api/projects/")
+        other = User.objects.create_user(username="other", password="pass")
+        Project.objects.create(user=other, name="他人のプロジェクト")
+
+        response = self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_live_duration_has_no_etag(self):
+        """現在時刻に依存する ?with=live_duration には ETag を付けないことを確認"""
+        response = self.client.get("/api/tasks/", {"with": "live_duration"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+
+class SyncTestCase(APITestCase):
+    """/api/sync/ の差分同期のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとデータを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+        self.task = Task.objects.create(
+            user=self.user, name="タスク", project=self.project
+        )
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.task
+        )
+        start_time = timezone.now() - timedelta(hours=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry = TimeEntry.objects.create(
+                user=self.user,
+                task=self.child,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+            )
+
+    def _sync(self, since=None):
+        params = {} if since is None else {"since": since}
+        response = self.client.get("/api/sync/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _upserted_ids(self, data, key):
+        return [row["id"] for row in data[key]["upserted"]]
+
+    def test_full_snapshot(self):
+        """since を省略すると全件と現在のトークンを返すことを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        Project.objects.create(user=other, name="他のユーザー")
+
+        data = self._sync()
+
+        self.user.refresh_from_db()
+        self.assertEqual(data["token"], self.user.data_version)
+        self.assertTrue(data["full"])
+        self.assertEqual(self._upserted_ids(data, "projects"), [self.project.pk])
+        self.assertEqual(self._upserted_ids(data, "tags"), [self.tag.pk])
+        self.assertEqual(
+            self._upserted_ids(data, "tasks"), [self.task.pk, self.child.pk]
+        )
+        self.assertEqual(self._upserted_ids(data, "time_entries"), [self.entry.pk])
+        for key in ("projects", "tags", "tasks", "time_entries"):
+            self.assertEqual(data[key]["deleted"], [])
+
+        task = data["tasks"]["upserted"][1]
+        self.assertEqual(task["duration_seconds"], 3600)
+        self.assertNotIn("parent_name", task)
+        self.assertNotIn("task_name", data["time_entries"]["upserted"][0])
+
+    def test_no_changes_since_current_token(self):
+        """変更がなければ空の差分と同じトークンを返すことを確認"""
+        token = self._sync()["token"]
+
+        data = self._sync(token)
+
+        self.assertEqual(data["token"], token)
+        self.assertFalse(data["full"])
+        for key in ("projects", "tags", "tasks", "time_entries"):
+            self.assertEqual(data[key], {"upserted": [], "deleted": []})
+
+    def test_returns_only_changed_rows(self):
+        """トークン以降に変更された行だけを返すことを確認"""
+        token = self._sync()["token"]
+        self.project.name = "変更後"
+        self.project.save()
+        self.task.tags.add(self.tag)
+
+        data = self._sync(token)
+
+        self.assertGreater(data["token"], token)
+        self.assertEqual(self._upserted_ids(data, "projects"), [self.project.pk])
+        self.assertEqual(data["projects"]["upserted"][0]["name"], "変更後")
+        self.assertEqual(self._upserted_ids(data, "tags"), [])
+        self.assertEqual(self._upserted_ids(data, "tasks"), [self.task.pk])
+        self.assertEqual(data["tasks"]["upserted"][0]["tags"], [self.tag.pk])
+        self.assertEqual(self._upserted_ids(data, "time_entries"), [])
+
+    def test_bulk_updates_are_returned(self):
+        """save() を経由しない一括更新（集計・プロジェクトの伝播）も返すことを確認"""
+        token = self._sync()["token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.end_time = self.entry.start_time + timedelta(hours=2)
+            self.entry.save()
+
+        data = self._sync(token)
+
+        self.assertEqual(
+            self._upserted_ids(data, "tasks"), [self.task.pk, self.child.pk]
+        )
+        self.assertEqual(data["tasks"]["upserted"][1]["duration_seconds"], 7200)
+
+        token = data["token"]
+        other_project = Project.objects.create(user=self.user, name="別")
+        self.task.project = other_project
+        self.task.save()
+
+        data = self._sync(token)
+
+        self.assertCountEqual(
+            self._upserted_ids(data, "tasks"), [self.task.pk, self.child.pk]
+        )
+        self.assertEqual(self._upserted_ids(data, "time_entries"), [self.entry.pk])
+        self.assertEqual(
+            data["time_entries"]["upserted"][0]["project"], other_project.pk
+        )
+
+    def test_deleted_rows_are_returned_as_tombstones(self):
+        """削除された行（CASCADEを含む）のIDと、SET NULLされた行を返すことを確認"""
+        task_ids, tag_id = [self.task.pk, self.child.pk], self.tag.pk
+        token = self._sync()["token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.delete()
+        self.tag.delete()
+
+        data = self._sync(token)
+
+        self.assertCountEqual(data["tasks"]["deleted"], task_ids)
+        self.assertEqual(data["tags"]["deleted"], [tag_id])
+        self.assertEqual(data["projects"]["deleted"], [])
+        self.assertEqual(self._upserted_ids(data, "time_entries"), [self.entry.pk])
+        self.assertIsNone(data["time_entries"]["upserted"][0]["task"])
+
+        # 全件の取得では削除された行を返さない
+        self.assertEqual(self._sync()["tasks"]["deleted"], [])
+
+    def test_project_delete_marks_detached_rows(self):
+        """プロジェクトの削除でプロジェクトが外れたタスクも返すことを確認"""
+        project_id = self.project.pk
+        token = self._sync()["token"]
+        self.project.delete()
+
+        data = self._sync(token)
+
+        self.assertEqual(data["projects"]["deleted"], [project_id])
+        self.assertCountEqual(
+            self._upserted_ids(data, "tasks"), [self.task.pk, self.child.pk]
+        )
+        self.assertEqual(self._upserted_ids(data, "time_entries"), [self.entry.pk])
+
+    def test_tombstones_of_other_users_are_not_returned(self):
+        """他のユーザーの削除は返さないことを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        token = self._sync()["token"]
+        Project.objects.create(user=other, name="他のユーザー").delete()
+
+        data = self._sync(token)
+
+        self.assertEqual(data["token"], token)
+        self.assertEqual(data["projects"]["deleted"], [])
+
+    def test_unknown_token_is_rejected(self):
+        """現在より新しいトークンや不正な値は400になることを確認"""
+        token = self._sync()["token"]
+
+        for since in (token + 1, -1, "abc"):
+            response = self.client.get("/api/sync/", {"since": since})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("since", response.json())
+
+    def test_query_count(self):
+        """トークン・削除・各コレクション（タグのprefetchを含む）のクエリ数を確認"""
+        token = self._sync()["token"]
+        self.project.save()
+        self.task.save()
+
+        with self.assertNumQueries(7):
+            self._sync(token)
+
+
+class TaskBulkTreeTestCase(APITestCase):
+    """/api/tasks/bulk/ のタスクツリーの一括作成・更新のテスト"""
+
+    url = "/api/tasks/bulk/"
+
+    def setUp(self):
+        """テスト用のユーザーとプロジェクト・タグを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+
+    def _post(self, tasks, expected_status=201):
+        response = self.client.post(self.url, {"tasks": tasks}, format="json")
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def _template(self, children=3):
+        """ルート1件・子children件・各子に孫1件のネストしたペイロード"""
+        return [
+            {
+                "name": "ルート",
+                "project": self.project.pk,
+                "tags": [self.tag.pk],
+                "children": [
+                    {
+                        "name": f"子{i}",
+                        "tags": [self.tag.pk],
+                        "children": [{"name": f"孫{i}"}],
+                    }
+                    for i in range(children)
+                ],
+            }
+        ]
+
+    def test_create_nested_tree(self):
+        """ネストしたペイロードからlevel・root・projectを設定して作成することを確認"""
+        data = self._post(self._template(children=2))
+
+        self.assertEqual(
+            [task["name"] for task in data["tasks"]],
+            ["ルート", "子0", "孫0", "子1", "孫1"],
+        )
+        root = Task.objects.get(name="ルート")
+        child = Task.objects.get(name="子0")
+        grandchild = Task.objects.get(name="孫0")
+        self.assertEqual((root.level, root.root_id, root.parent_id), (0, None, None))
+        self.assertEqual(
+            (child.level, child.root_id, child.parent_id), (1, root.pk, root.pk)
+        )
+        self.assertEqual(
+            (grandchild.level, grandchild.root_id, grandchild.parent_id),
+            (2, root.pk, child.pk),
+        )
+        for task in (root, child, grandchild):
+            self.assertEqual(task.user, self.user)
+            self.assertEqual(task.project, self.project)
+        self.assertEqual(list(child.tags.all()), [self.tag])
+        self.assertEqual(data["tasks"][1]["tag_names"], ["タグ"])
+        self.assertEqual(data["tasks"][2]["parent_name"], "子0")
+
+    def test_create_flat_tree_with_refs(self):
+        """一時IDで親を参照するフラットなペイロード（親が後にあってもよい）を確認"""
+        data = self._post(
+            [
+                {"ref": "c", "parent_ref": "b", "name": "孫"},
+                {"ref": "b", "parent_ref": "a", "name": "子"},
+                {"ref": "a", "name": "ルート", "project": self.project.pk},
+            ]
+        )
+
+        refs = data["refs"]
+        grandchild = Task.objects.get(pk=refs["c"])
+        self.assertEqual(grandchild.parent_id, refs["b"])
+        self.assertEqual(grandchild.root_id, refs["a"])
+        self.assertEqual(grandchild.level, 2)
+        self.assertEqual(grandchild.project, self.project)
+        self.assertEqual(
+            [task["id"] for task in data["tasks"]], [refs["c"], refs["b"], refs["a"]]
+        )
+
+    def test_update_and_add_children_to_existing_tasks(self):
+        """既存タスクの更新と、既存タスクの下への追加を1回で行えることを確認"""
+        root = Task.objects.create(user=self.user, name="既存のルート")
+        child = Task.objects.create(user=self.user, name="既存の子", parent=root)
+        other_tag = Tag.objects.create(user=self.user, name="別のタグ")
+        child.tags.add(self.tag)
+
+        data = self._post(
+            [
+                {
+                    "id": root.pk,
+                    "project": self.project.pk,
+                    "children": [{"name": "新しい子"}],
+                },
+                {"id": child.pk, "name": "変更後", "tags": [other_tag.pk]},
+                {"parent": child.pk, "name": "新しい孫", "ref": "g"},
+            ]
+        )
+
+        root.refresh_from_db()
+        child.refresh_from_db()
+        self.assertEqual(root.project, self.project)
+        self.assertEqual(child.project, self.project)
+        self.assertEqual(child.name, "変更後")
+        self.assertEqual(list(child.tags.all()), [other_tag])
+        new_child = Task.objects.get(name="新しい子")
+        self.assertEqual((new_child.parent, new_child.level), (root, 1))
+        self.assertEqual(new_child.project, self.project)
+        grandchild = Task.objects.get(pk=data["refs"]["g"])
+        self.assertEqual((grandchild.root, grandchild.level), (root, 2))
+        self.assertEqual(grandchild.project, self.project)
+
+    def test_update_only_returns_200(self):
+        """更新だけの場合は200を返し、指定しないフィールドは変更しないことを確認"""
+        task = Task.objects.create(
+            user=self.user, name="タスク", description="説明", estimate_minutes=30
+        )
+
+        self._post([{"id": task.pk, "name": "変更後"}], expected_status=200)
+
+        task.refresh_from_db()
+        self.assertEqual(task.name, "変更後")
+        self.assertEqual(task.description, "説明")
+        self.assertEqual(task.estimate_minutes, 30)
+
+    def test_query_count_does_not_depend_on_size(self):
+        """クエリ数がタスク数に依存しないことを確認"""
+        with CaptureQueriesContext(connection) as small:
+            self._post(self._template(children=1))
+        with CaptureQueriesContext(connection) as large:
+            self._post(self._template(children=50))
+
+        self.assertEqual(Task.objects.count(), 3 + 101)
+        self.assertEqual(len(small), len(large))
+
+    def test_sync_returns_created_tasks(self):
+        """一括作成したタスクが差分同期で返されることを確認"""
+        token = self.client.get("/api/sync/").json()["token"]
+
+        data = self._post(self._template(children=1))
+
+        changes = self.client.get("/api/sync/", {"since": token}).json()
+        self.assertCountEqual(
+            [task["id"] for task in changes["tasks"]["upserted"]],
+            [task["id"] for task in data["tasks"]],
+        )
+
+    def test_invalid_payloads_write_nothing(self):
+        """不正なペイロードはパスごとのエラーで400になり、何も作成しないことを確認"""
+        other_project = Project.objects.create(user=self.other, name="他")
+        other_own = Project.objects.create(user=self.user, name="別のプロジェクト")
+        other_tag = Tag.objects.create(user=self.other, name="他")
+        other_task = Task.objects.create(user=self.other, name="他")
+        grandchild = Task.objects.create(
+            user=self.user,
+            name="孫",
+            parent=Task.objects.create(
+                user=self.user,
+                name="子",
+                parent=Task.objects.create(user=self.user, name="ルート"),
+            ),
+        )
+        cases = [
+            ([{"name": "a", "project": other_project.pk}], "0"),
+            ([{"name": "a", "tags": [other_tag.pk]}], "0"),
+            ([{"name": "a", "parent": other_task.pk}], "0"),
+            ([{"id": other_task.pk, "name": "a"}], "0"),
+            ([{"name": "a", "parent": grandchild.pk}], "0"),
+            (
+                [
+                    {
+                        "name": "a",
+                        "children": [
+                            {
+                                "name": "b",
+                                "children": [
+                                    {"name": "c", "children": [{"name": "d"}]}
+                                ],
+                            }
+                        ],
+                    }
+                ],
+                "0.children.0.children.0.children.0",
+            ),
+            (
+                [
+                    {"ref": "a", "parent_ref": "b", "name": "a"},
+                    {"ref": "b", "parent_ref": "a", "name": "b"},
+                ],
+                "0",
+            ),
+            ([{"name": "a", "parent_ref": "missing"}], "0"),
+            ([{"ref": "a", "name": "a"}, {"ref": "a", "name": "b"}], "1"),
+            ([{"id": grandchild.pk, "parent": grandchild.root_id}], "0"),
+            (
+                [
+                    {
+                        "name": "a",
+                        "project": self.project.pk,
+                        "children": [{"name": "b", "project": other_own.pk}],
+                    }
+                ],
+                "0.children.0",
+            ),
+        ]
+        count = Task.objects.count()
+        for tasks, path in cases:
+            with self.subTest(tasks=tasks):
+                data = self._post(tasks, expected_status=400)
+                self.assertIn(path, data["tasks"])
+        self.assertEqual(Task.objects.count(), count)
+
+        # 構造の不正はシリアライザで検出する
+        for tasks in ([], [{"description": "名前なし"}], [{"name": " "}]):
+            with self.subTest(tasks=tasks):
+                self._post(tasks, expected_status=400)
+
+    def test_existing_subtree_cannot_be_moved(self):
+        """子孫を持つ既存タスクの親の変更は拒否され、ツリーが変わらないことを確認"""
+        root = Task.objects.create(user=self.user, name="ルート")
+        child = Task.objects.create(user=self.user, name="子", parent=root)
+        grandchild = Task.objects.create(user=self.user, name="孫", parent=child)
+        target = Task.objects.create(user=self.user, name="移動先")
+
+        for tasks in (
+            [{"id": root.pk, "parent": target.pk}],
+            [{"id": child.pk, "parent": target.pk}],
+            [{"ref": "t", "name": "新"}, {"id": child.pk, "parent_ref": "t"}],
+        ):
+            with self.subTest(tasks=tasks):
+                data = self._post(tasks, expected_status=400)
+                self.assertIn(str(len(tasks) - 1), data["tasks"])
+
+        rows = Task.objects.filter(pk__in=[root.pk, child.pk, grandchild.pk])
+        self.assertEqual(
+            set(rows.values_list("pk", "parent_id", "root_id", "level")),
+            {
+                (root.pk, None, None, 0),
+                (child.pk, root.pk, root.pk, 1),
+                (grandchild.pk, child.pk, root.pk, 2),
+            },
+        )
+        self.assertEqual(Task.objects.filter(name="新").count(), 0)
+
+
+class TaskTreeTestCase(APITestCase):
+    """/api/tasks/tree/ と /api/tasks/{id}/subtree/ のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+
+        self.root = Task.objects.create(
+            user=self.user, name="ルート", project=self.project
+        )
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.root
+        )
+        self.grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=self.child
+        )
+        self.other_root = Task.objects.create(user=self.user, name="別のルート")
+        self.child.tags.add(self.tag)
+
+    def _ids(self, nodes):
+        """ノードのIDをネストしたタプルにする"""
+        return [(node["id"], self._ids(node["children"])) for node in nodes]
+
+    def test_tree_nests_all_tasks_in_two_queries(self):
+        """タスク1クエリ・タグ1クエリでツリーを返すことを確認"""
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/tasks/tree/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self._ids(response.json()),
+            [
+                (self.other_root.pk, []),
+                (self.root.pk, [(self.child.pk, [(self.grandchild.pk, [])])]),
+            ],
+        )
+
+    def test_tree_filtered_by_project(self):
+        """?project= でそのプロジェクトのツリーだけを返すことを確認"""
+        response = self.client.get("/api/tasks/tree/", {"project": self.project.pk})
+
+        self.assertEqual(
+            self._ids(response.json()),
+            [(self.root.pk, [(self.child.pk, [(self.grandchild.pk, [])])])],
+        )
+
+        response = self.client.get("/api/tasks/tree/", {"project": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_nodes_match_task_serializer(self):
+        """ノードのフィールドが /api/tasks/{id}/ の値と一致することを確認"""
+        node = self.client.get(f"/api/tasks/{self.child.pk}/subtree/").json()
+        detail = self.client.get(f"/api/tasks/{self.child.pk}/").json()
+
+        for name in (
+            "id",
+            "name",
+            "description",
+            "project",
+            "parent",
+            "root",
+            "level",
+            "tags",
+            "tag_names",
+            "estimate_minutes",
+            "duration_seconds",
+            "created_at",
+            "updated_at",
+        ):
+            self.assertEqual(node[name], detail[name], name)
+
+    def test_subtree(self):
+        """各レベルのタスクのサブツリーを1クエリ+タグで返すことを確認"""
+        cases = [
+            (
+                self.root,
+                [(self.root.pk, [(self.child.pk, [(self.grandchild.pk, [])])])],
+            ),
+            (self.child, [(self.child.pk, [(self.grandchild.pk, [])])]),
+            (self.grandchild, [(self.grandchild.pk, [])]),
+        ]
+        for task, expected in cases:
+            with self.subTest(level=task.level), self.assertNumQueries(2):
+                response = self.client.get(f"/api/tasks/{task.pk}/subtree/")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self._ids([response.json()]), expected)
+
+    def test_subtree_of_other_users_task_is_not_found(self):
+        """他のユーザーのタスクや存在しないタスクは404になることを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        task = Task.objects.create(user=other, name="他のユーザー")
+
+        for pk in (task.pk, 999999):
+            response = self.client.get(f"/api/tasks/{pk}/subtree/")
+            self.assertEqual(response.status_code, 404)
+
+
+class CompiledListSerializerTestCase(APITestCase):
+    """values() ベースの一覧のシリアライズ（CompiledListSerializer）のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとデータを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            user=self.user, name='プロジェクト "引用"', color="#123456"
+        )
+        Project.objects.create(user=self.user, name="α")
+        tags = [
+            Tag.objects.create(user=self.user, name=name) for name in ("b", "a", "c")
+        ]
+        root = Task.objects.create(
+            user=self.user,
+            name="ルート",
+            description="説明\n改行",
+            project=self.project,
+            estimate_minutes=90,
+        )
+        child = Task.objects.create(user=self.user, name="子", parent=root)
+        Task.objects.create(user=self.user, name="孫", parent=child)
+        Task.objects.create(user=self.user, name="プロジェクトなし")
+        root.tags.set(tags)
+        child.tags.add(tags[1])
+
+    def _compare(self, viewset, url, params=None):
+        """ModelSerializer を使った場合とバイト単位で同じレスポンスになることを確認"""
+        compiled = self.client.get(url, params)
+        with mock.patch.object(viewset, "compiled_list_serializer", None):
+            expected = self.client.get(url, params)
+
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, expected.content)
+        return compiled
+
+    def test_lists_are_byte_identical(self):
+        """プロジェクト・タグ・タスクの一覧が同じJSONになることを確認"""
+        self._compare(ProjectViewSet, "/api/projects/")
+        self._compare(TagViewSet, "/api/tags/")
+        response = self._compare(TaskViewSet, "/api/tasks/")
+
+        tasks = {task["name"]: task for task in response.json()["results"]}
+        self.assertEqual(tasks["ルート"]["tag_names"], ["a", "b", "c"])
+        self.assertNotIn("project_name", tasks["プロジェクトなし"])
+        self.assertNotIn("parent_name", tasks["ルート"])
+
+    def test_filtered_ordered_and_paginated_lists_are_byte_identical(self):
+        """フィルタ・並び替え・ページネーションを指定しても同じJSONになることを確認"""
+        for params in (
+            {"project": self.project.pk},
+            {"ordering": "name"},
+            {"page": 1, "tags": Tag.objects.get(name="a").pk},
+            {"pagination": "cursor", "limit": 2, "ordering": "name"},
+        ):
+            with self.subTest(params=params):
+                self._compare(TaskViewSet, "/api/tasks/", params)
+
+        cursor = self.client.get(
+            "/api/tasks/", {"pagination": "cursor", "limit": 2}
+        ).json()["next"]
+        self._compare(TaskViewSet, cursor)
+
+    def test_task_list_query_count(self):
+        """件数・一覧・タグの3クエリで一覧を返すことを確認"""
+        with self.assertNumQueries(4):
+            # data_version の取得（ETag）を含む
+            self.client.get("/api/tasks/")
+
+
+class TaskWriteIdentityMapTestCase(APITestCase):
+    """TaskSerializer の書き込み時の IdentityMap のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとタスク階層・タグを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f"タグ{i}") for i in range(5)
+        ]
+        self.root = Task.objects.create(
+            user=self.user, name="ルート", project=self.project
+        )
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.root
+        )
+
+    def _create_grandchild(self, tags):
+        return self.client.post(
+            "/api/tasks/",
+            {"name": "孫タスク", "parent": self.child.pk, "tags": tags},
+            format="json",
+        )
+
+    def test_create_grandchild_query_count(self):
+        """孫タスクの作成のクエリ数がタグの数によらず一定であることを確認"""
+        # 親（親・ルート・プロジェクトをJOIN）・タグの読み込み 2
+        # 保存（data_version・INSERT） 2
+        # タグの中間テーブルへのINSERT 1（レスポンスは作成したタグから返す）
+        for tags in ([self.tags[0].pk], [tag.pk for tag in self.tags]):
+            with self.subTest(tags=len(tags)), self.assertNumQueries(5):
+                response = self._create_grandchild(tags)
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()["tags"], tags)
+            self.assertEqual(
+                response.json()["tag_names"], [f"タグ{i}" for i in range(len(tags))]
+            )
+            task = Task.objects.get(pk=response.json()["id"])
+            self.assertEqual(
+                (task.level, task.root, task.parent), (2, self.root, self.child)
+            )
+            self.assertEqual(task.project, self.project)
+            self.assertEqual(task.tags.count(), len(tags))
+
+    def test_update_loads_tags_once_for_response(self):
+        """更新のレスポンスの tags・tag_names がタグを1回だけ読み込むことを確認"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f"/api/tasks/{self.child.pk}/",
+                {"tags": [self.tags[1].pk, self.tags[0].pk]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["tag_names"], ["タグ0", "タグ1"])
+        # 更新（set() が読み込みのキャッシュを破棄する）の後の読み込み
+        sqls = [query["sql"] for query in queries]
+        last_write = max(i for i, sql in enumerate(sqls) if sql.startswith("UPDATE"))
+        tag_reads = [
+            sql
+            for sql in sqls[last_write:]
+            if 'FROM "api_tag" INNER JOIN "api_task_tags"' in sql
+        ]
+        self.assertEqual(len(tag_reads), 1)
+
+    def test_rejects_other_users_rows(self):
+        """他のユーザーの親・プロジェクト・タグは存在しないものとして拒否することを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        other_task = Task.objects.create(user=other, name="他")
+        other_project = Project.objects.create(user=other, name="他")
+        other_tag = Tag.objects.create(user=other, name="他")
+
+        for field, value in (
+            ("parent", other_task.pk),
+            ("project", other_project.pk),
+            ("tags", [other_tag.pk]),
+            ("parent", "abc"),
+            ("tags", [True]),
+        ):
+            with self.subTest(field=field, value=value):
+                response = self.client.post(
+                    "/api/tasks/", {"name": "タスク", field: value}, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+    def test_form_encoded_tags(self):
+        """フォーム形式の複数のタグも読み込めることを確認"""
+        response = self.client.post(
+            "/api/tasks/",
+            {"name": "タスク", "tags": [self.tags[0].pk, self.tags[1].pk]},
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["tags"], [self.tags[0].pk, self.tags[1].pk])
+
+    def test_move_to_another_tree(self):
+        """別のツリーへの移動で読み込んだ親のルート・プロジェクトが使われることを確認"""
+        project = Project.objects.create(user=self.user, name="別のプロジェクト")
+        other_root = Task.objects.create(
+            user=self.user, name="別のルート", project=project
+        )
+
+        response = self.client.patch(
+            f"/api/tasks/{self.child.pk}/", {"parent": other_root.pk}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.root, other_root)
+        self.assertEqual(self.child.project, project)
+
+
+class TaskMoveTestCase(APITestCase):
+    """子孫タスクを持つタスクの移動のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーと2つのタスク階層を作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.other_project = Project.objects.create(user=self.user, name="移動先")
+        self.root = Task.objects.create(
+            user=self.user, name="ルート", project=self.project
+        )
+        self.child = Task.objects.create(
+            user=self.user, name="子タスク", parent=self.root
+        )
+        self.grandchild = Task.objects.create(
+            user=self.user, name="孫タスク", parent=self.child
+        )
+        self.target = Task.objects.create(
+            user=self.user, name="移動先", project=self.other_project
+        )
+        start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry = TimeEntry.objects.create(
+                user=self.user,
+                task=self.grandchild,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=30),
+            )
+
+    def _move(self, task, parent):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(
+                f"/api/tasks/{task.pk}/", {"parent": parent}, format="json"
+            )
+
+    def test_move_child_with_grandchild(self):
+        """子タスクの移動で孫タスクのレベル・ルート・プロジェクトと時間が移ることを確認"""
+        response = self._move(self.child, self.target.pk)
+
+        self.assertEqual(response.status_code, 200)
+        for task in (self.root, self.child, self.grandchild, self.target):
+            task.refresh_from_db()
+        self.assertEqual((self.child.level, self.child.root), (1, self.target))
+        self.assertEqual(
+            (self.grandchild.level, self.grandchild.root), (2, self.target)
+        )
+        self.assertEqual(self.grandchild.project, self.other_project)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.project, self.other_project)
+        self.assertEqual(self.root.duration_seconds, 0)
+        self.assertEqual(self.target.duration_seconds, 1800)
+
+    def test_move_child_to_root(self):
+        """子タスクをルートにすると孫タスクが子タスクになることを確認"""
+        response = self._move(self.child, None)
+
+        self.assertEqual(response.status_code, 200)
+        self.child.refresh_from_db()
+        self.grandchild.refresh_from_db()
+        self.assertEqual((self.child.level, self.child.root), (0, None))
+        self.assertEqual((self.grandchild.level, self.grandchild.root), (1, self.child))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.duration_seconds, 0)
+        self.assertEqual(self.child.duration_seconds, 1800)
+
+    def test_move_root_with_children(self):
+        """子タスクだけを持つルートタスクを別のツリーの子にできることを確認"""
+        self.grandchild.delete()
+        response = self._move(self.root, self.target.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.child.refresh_from_db()
+        self.assertEqual((self.child.level, self.child.root), (2, self.target))
+        self.assertEqual(self.child.project, self.other_project)
+
+    def test_rejects_too_deep_and_circular_moves(self):
+        """孫より深くなる移動と自身の子孫の下への移動は 400 になることを確認"""
+        for task, parent in (
+            (self.root, self.target),
+            (
+                self.child,
+                Task.objects.create(user=self.user, name="子", parent=self.target),
+            ),
+            (self.root, self.child),
+            (self.root, self.grandchild),
+            (self.child, self.grandchild),
+        ):
+            with self.subTest(task=task.name, parent=parent.name):
+                response = self._move(task, parent.pk)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("parent", response.data)
+        self.grandchild.refresh_from_db()
+        self.assertEqual((self.grandchild.level, self.grandchild.root), (2, self.root))
+
+
+class TagNamesTestCase(APITestCase):
+    """タグ名によるタグの指定と一括追加のテスト"""
+
+    def setUp(self):
+        """テスト用のユーザー・タグ・タスクを作成"""
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name="既存")
+        self.tasks = [
+            Task.objects.create(user=self.user, name=f"タスク{i}") for i in range(3)
+        ]
+
+    def test_create_task_with_tag_names(self):
+        """tag_namesで既存のタグを使い、存在しないタグを作成することを確認"""
+        response = self.client.post(
+            "/api/tasks/",
+            {"name": "タスク", "tag_names": ["既存", "新規", "新規"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["tag_names"], ["新規", "既存"])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        task = Task.objects.get(pk=response.json()["id"])
+        self.assertEqual(
+            sorted(task.tags.values_list("name", flat=True)), ["新規", "既存"]
+        )
+
+    def test_update_merges_tags_and_tag_names(self):
+        """tagsとtag_namesを合わせたタグに置き換えることを確認"""
+        other = Tag.objects.create(user=self.user, name="別")
+        task = self.tasks[0]
+        task.tags.add(other)
+
+        response = self.client.patch(
+            f"/api/tasks/{task.pk}/",
+            {"tags": [self.tag.pk], "tag_names": ["既存", "追加"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["tag_names"], ["既存", "追加"])
+
+        # tag_namesを指定しない更新ではタグは変わらない
+        response = self.client.patch(
+            f"/api/tasks/{task.pk}/", {"name": "改名"}, format="json"
+        )
+        self.assertEqual(response.json()["tag_names"], ["既存", "追加"])
+
+    def test_tag_names_are_per_user(self):
+        """他のユーザーの同名のタグは使わず、自分のタグを作成することを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        other_tag = Tag.objects.create(user=other, name="共通")
+
+        response = self.client.post(
+            "/api/tasks/", {"name": "タスク", "tag_names": ["共通"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(other_tag.pk, response.json()["tags"])
+        self.assertTrue(Tag.objects.filter(user=self.user, name="共通").exists())
+
+    def test_apply_tags_to_tasks(self):
+        """既存のタグと名前で指定したタグを全てのタスクに追加することを確認"""
+        self.tasks[0].tags.add(self.tag)
+        ids = [task.pk for task in self.tasks]
+
+        response = self.client.post(
+            "/api/tags/apply/",
+            {"tasks": ids, "tags": [self.tag.pk], "tag_names": ["新規"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["tasks"], ids)
+        self.assertEqual(
+            [tag["name"] for tag in response.json()["tags"]], ["既存", "新規"]
+        )
+        for task in self.tasks:
+            self.assertEqual(
+                sorted(task.tags.values_list("name", flat=True)), ["新規", "既存"]
+            )
+
+    def test_apply_query_count_is_independent_of_task_count(self):
+        """タスクやタグの数によらず一定のクエリ数で追加することを確認"""
+        tasks = Task.objects.bulk_create(
+            Task(user=self.user, name=f"一括{i}") for i in range(50)
+        )
+        for ids in ([self.tasks[0].pk], [task.pk for task in tasks]):
+            names = [f"タグ{len(ids)}-{i}" for i in range(len(ids) % 7 + 1)]
+            # 検証（タスク・タグ） 2、トランザクション（SAVEPOINT・RELEASE） 2
+            # タグ名の解決（既存・data_version・INSERT・作成したタグ） 4
+            # 追加（タスクID・INSERT・data_version・sync_version） 4
+            with self.subTest(tasks=len(ids)), self.assertNumQueries(12):
+                response = self.client.post(
+                    "/api/tags/apply/",
+                    {"tasks": ids, "tags": [self.tag.pk], "tag_names": names},
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                Task.tags.through.objects.filter(task_id__in=ids).count(),
+                len(ids) * (len(names) + 1),
+            )
+
+    def test_apply_stamps_tasks_for_sync(self):
+        """タグを追加したタスクと作成したタグが同期の差分に含まれることを確認"""
+        since = self.client.get("/api/sync/").json()["token"]
+        response = self.client.post(
+            "/api/tags/apply/",
+            {"tasks": [self.tasks[1].pk], "tag_names": ["新規"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        changes = self.client.get("/api/sync/", {"since": since}).json()
+        tasks, tags = changes["tasks"]["upserted"], changes["tags"]["upserted"]
+        self.assertEqual([task["id"] for task in tasks], [self.tasks[1].pk])
+        self.assertEqual([tag["name"] for tag in tags], ["新規"])
+
+    def test_apply_rejects_invalid_payloads(self):
+        """他のユーザーのタスク・タグや、タグの指定がない場合は拒否することを確認"""
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        other_task = Task.objects.create(user=other, name="他")
+        other_tag = Tag.objects.create(user=other, name="他")
+        task = self.tasks[0].pk
+
+        for payload, field in (
+            ({"tasks": [task, other_task.pk], "tags": [self.tag.pk]}, "tasks"),
+            ({"tasks": [task], "tags": [other_tag.pk]}, "tags"),
+            ({"tasks": [], "tags": [self.tag.pk]}, "tasks"),
+            ({"tasks": [task]}, "non_field_errors"),
+            ({"tasks": [task], "tag_names": ["x" * 51]}, "tag_names"),
+        ):
+            with self.subTest(payload=payload):
+                response = self.client.post("/api/tags/apply/", payload, format="json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+        self.assertFalse(Task.tags.through.objects.exists())
+
+
+class ResponseCacheTestCase(APITestCase):
+    """data_version をキーにしたユーザーごとのレスポンスキャッシュのテスト"""
+
+    def setUp(self):
+        """テスト用のユーザーとプロジェクト・タグ・タスクを作成"""
+        response_cache.get_cache().clear()
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(user=self.user, name="プロジェクト")
+        self.tag = Tag.objects.create(user=self.user, name="タグ")
+        self.task = Task.objects.create(
+            user=self.user, name="タスク", project=self.project
+        )
+        self.task.tags.add(self.tag)
+
+    def test_warm_read_skips_queryset_and_serializer(self):
+        """2回目の取得は data_version の取得だけで同じレスポンスを返すことを確認"""
+        for url in (
+            "/api/projects/",
+            "/api/tags/",
+            "/api/tasks/",
+            "/api/tasks/?fields=id,name",
+            f"/api/projects/{self.project.pk}/",
+            f"/api/tasks/{self.task.pk}/",
+        ):
+            with self.subTest(url=url):
+                cold = self.client.get(url)
+                with self.assertNumQueries(1):
+                    warm = self.client.get(url)
+
+                self.assertEqual(warm.status_code, 200)
+                self.assertEqual(warm.content, cold.content)
+                self.assertEqual(warm["Content-Type"], cold["Content-Type"])
+                self.assertEqual(warm["ETag"], cold["ETag"])
+
+    def test_writes_invalidate_cached_responses(self):
+        """保存・削除・タグの付け替えで古いレスポンスを返さないことを確認"""
+        self.client.get("/api/tasks/")
+
+        self.client.patch(f"/api/tasks/{self.task.pk}/", {"name": "改名"})
+        self.assertEqual(
+            self.client.get("/api/tasks/").data["results"][0]["name"], "改名"
+        )
+
+        self.task.tags.remove(self.tag)
+        self.assertEqual(self.client.get("/api/tasks/").data["results"][0]["tags"], [])
+
+        self.client.delete(f"/api/tasks/{self.task.pk}/")
+        self.assertEqual(self.client.get("/api/tasks/").data["count"], 0)
+
+    def test_duration_rollup_invalidates_cached_tasks(self):
+        """コミット時のタスクの累計時間の再計算でキャッシュが無効になることを確認"""
+        start_time = timezone.make_aware(datetime(2026, 1, 5, 9, 0))
+        entry = TimeEntry.objects.create(
+            user=self.user, task=self.task, start_time=start_time
+        )
+        self.client.get(f"/api/tasks/{self.task.pk}/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.end_time = start_time + timedelta(hours=1)
+            entry.save()
+        response = self.client.get(f"/api/tasks/{self.task.pk}/")
+
+        self.assertEqual(response.data["duration_seconds"], 3600)
+
+    def test_cache_is_per_user(self):
+        """同じURLでも他のユーザーには別のレスポンスを返すことを確認"""
+        self.client.get("/api/projects/")
+        other = User.objects.create_user(username="other", password="pass")
+        Project.objects.create(user=other, name="他人のプロジェクト")
+        self.client.force_authenticate(other)
+
+        response = self.client.get("/api/projects/")
+
+        self.assertEqual(
+            [project["name"] for project in response.data["results"]],
+            ["他人のプロジェクト"],
+        )
+
+    def test_live_duration_and_errors_are_not_cached(self):
+        """現在時刻に依存する表現とエラーはキャッシュしないことを確認"""
+        for url in ("/api/tasks/?with=live_duration", "/api/tasks/0/"):
+            with self.subTest(url=url):
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertGreater(len(queries), 1)
+
+    def test_stats_count_hits_and_misses(self):
+        """管理者だけがViewSetごとのヒット・ミスの件数を取得できることを確認"""
+        self.client.get("/api/projects/")
+        self.client.get("/api/projects/")
+        self.client.get("/api/projects/")
+        self.client.get("/api/tags/")
+
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+
+        admin = User.objects.create_user(
+            username="admin", password="pass", is_staff=True
+        )
+        self.client.force_authenticate(admin)
+        stats = self.client.get("/api/cache/stats/").json()
+
+        self.assertEqual(
+            stats["viewsets"]["project"], {"hits": 2, "misses": 1, "hit_rate": 2 / 3}
+        )
+        self.assertEqual(
+            stats["viewsets"]["tag"], {"hits": 0, "misses": 1, "hit_rate": 0.0}
+        )
+        self.assertEqual(
+            stats["viewsets"]["task"], {"hits": 0, "misses": 0, "hit_rate": None}
+        )
+        self.assertEqual(stats["total"]["hits"], 2)
+        self.assertEqual(stats["total"]["misses"], 2)
+
+    @override_settings(
+        CACHES={"dummy": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        API_RESPONSE_CACHE="dummy",
+    )
+    def test_backend_is_configurable(self):
+        """API_RESPONSE_CACHE で別のキャッシュバックエンドを使えることを確認"""
+        self.client.get("/api/projects/")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/projects/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(queries), 1)